@@ -0,0 +1,288 @@
+"""
+按题目的增量统计
+
+每次提交审题分析时增量更新物化的统计结果（提交数、预评分相似度直方图、修改量直方图、常见问题主题），
+管理接口直接读取物化结果，无需遍历 session 文件。每道题的统计是共享存储中的一个文档，
+更新时只在该题目的锁内读写这一个文档，开销与题目数量无关；多个 worker 进程、多个节点
+或与重建命令同时运行时不会丢失更新。历史数据可通过重建命令重新计算：
+
+    python analytics.py rebuild
+"""
+import json
+import logging
+import os
+import re
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_BUCKETS = 10
+# 修改量直方图的分桶上界（cmt-add/cmt-del 标记数），最后一个桶为 ">= 最后上界"
+EDIT_BUCKETS = [0, 2, 5, 10, 20, 40]
+
+# 常见问题主题：批注（cmt-comm）中出现任一关键词即计入该主题，可在 config.json 的 ANALYTICS_THEMES 中覆盖
+DEFAULT_THEMES = {
+    "审题立意": ["审题", "立意", "偏题", "跑题", "中心论点", "主旨"],
+    "论据事例": ["事例", "例子", "论据", "素材"],
+    "名言引用": ["名言", "引用", "引言"],
+    "结构层次": ["结构", "层次", "逻辑", "递进", "并列"],
+    "思辨深度": ["深度", "深入", "思辨", "辩证", "浅"],
+    "联系现实": ["现实", "时代", "青年", "联系"],
+    "语言表达": ["语言", "表达", "措辞", "文采"],
+}
+
+_TAG_PATTERNS = {
+    kind: re.compile(rf'<cmt-{kind}>([\s\S]*?)</cmt-{kind}>')
+    for kind in ("add", "del", "comm")
+}
+
+
+def iter_strings(data):
+    """遍历嵌套结构中的所有字符串"""
+    if isinstance(data, str):
+        yield data
+    elif isinstance(data, dict):
+        for value in data.values():
+            yield from iter_strings(value)
+    elif isinstance(data, list):
+        for value in data:
+            yield from iter_strings(value)
+
+
+def outline_metrics(outline_data, themes):
+    """从一条 essay_outlines 记录中提取统计指标"""
+    edits = Counter()
+    comments = []
+    cmp_data = outline_data.get("cmp") or {}
+    # _think 为模型推理内容，不计入统计
+    for text in iter_strings({k: v for k, v in cmp_data.items() if k != "_think"} if isinstance(cmp_data, dict) else cmp_data):
+        for kind, pattern in _TAG_PATTERNS.items():
+            matches = pattern.findall(text)
+            edits[kind] += len(matches)
+            if kind == "comm":
+                comments.extend(matches)
+
+    matched_themes = set()
+    for comment in comments:
+        for theme, keywords in themes.items():
+            if any(keyword in comment for keyword in keywords):
+                matched_themes.add(theme)
+
+    prescore = outline_data.get("prescore") or {}
+    if "generation_error" in outline_data:
+        status = "generation_failed"
+    elif outline_data.get("judgement_error"):
+        status = "judgement_skipped" if outline_data["judgement_error"].startswith("Skipped by prescore") else "judgement_failed"
+    else:
+        status = "judged"
+
+    return {
+        "status": status,
+        "edits": dict(edits),
+        "themes": sorted(matched_themes),
+        "similarity": prescore.get("similarity"),
+        "verdict": prescore.get("verdict"),
+        "submitted_at": outline_data.get("submitted_at", "")
+    }
+
+
+def empty_aggregate(question_id):
+    return {
+        "question_id": question_id,
+        "submissions": 0,
+        "status": {},
+        "verdicts": {},
+        "similarity_histogram": [0] * HISTOGRAM_BUCKETS,
+        "edit_histogram": [0] * len(EDIT_BUCKETS),
+        "edit_totals": {"add": 0, "del": 0, "comm": 0},
+        "themes": {},
+        "first_submission_at": None,
+        "last_submission_at": None
+    }
+
+
+def apply_metrics(aggregate, metrics):
+    """将一条提交的指标合并进物化结果，O(1)"""
+    aggregate["submissions"] += 1
+    aggregate["status"][metrics["status"]] = aggregate["status"].get(metrics["status"], 0) + 1
+    if metrics["verdict"]:
+        aggregate["verdicts"][metrics["verdict"]] = aggregate["verdicts"].get(metrics["verdict"], 0) + 1
+    if metrics["similarity"] is not None:
+        bucket = min(HISTOGRAM_BUCKETS - 1, int(metrics["similarity"] * HISTOGRAM_BUCKETS))
+        aggregate["similarity_histogram"][bucket] += 1
+    if metrics["status"] == "judged":
+        edit_count = metrics["edits"].get("add", 0) + metrics["edits"].get("del", 0)
+        bucket = len(EDIT_BUCKETS) - 1
+        for i, upper in enumerate(EDIT_BUCKETS[1:]):
+            if edit_count < upper:
+                bucket = i
+                break
+        aggregate["edit_histogram"][bucket] += 1
+    for kind, count in metrics["edits"].items():
+        aggregate["edit_totals"][kind] = aggregate["edit_totals"].get(kind, 0) + count
+    for theme in metrics["themes"]:
+        aggregate["themes"][theme] = aggregate["themes"].get(theme, 0) + 1
+
+    submitted_at = metrics["submitted_at"]
+    if submitted_at:
+        if not aggregate["first_submission_at"] or submitted_at < aggregate["first_submission_at"]:
+            aggregate["first_submission_at"] = submitted_at
+        if not aggregate["last_submission_at"] or submitted_at > aggregate["last_submission_at"]:
+            aggregate["last_submission_at"] = submitted_at
+
+
+class AnalyticsStore:
+    """物化统计结果，每道题一个文档，保存在 storage 的文档存储中（local 后端为 data/analytics/<question_id>.json）"""
+
+    NAMESPACE = 'analytics'
+    # 重建进行中的标记和重建期间的提交日志（每条提交一个文档，写入与日志长度无关）
+    REBUILD_NAMESPACE = 'analytics_rebuild'
+    JOURNAL_NAMESPACE = 'analytics_journal'
+
+    def __init__(self, documents, locks, themes=None, top_n=5, legacy_path=None):
+        self.documents = documents
+        self.locks = locks
+        self.themes = themes or DEFAULT_THEMES
+        self.top_n = top_n
+        if legacy_path:
+            self._migrate(legacy_path)
+
+    def _lock(self, question_id):
+        return self.locks.lock(f"analytics:{question_id}")
+
+    def _migrate(self, legacy_path):
+        """将旧版的单文件 analytics.json 导入文档存储（存储中还没有统计时），之后重命名为 .migrated"""
+        if not os.path.exists(legacy_path):
+            return
+        try:
+            with self.locks.lock("analytics:migrate"):
+                if not os.path.exists(legacy_path):
+                    return
+                if not self.documents.list_ids(self.NAMESPACE):
+                    with open(legacy_path, 'r', encoding='utf-8') as f:
+                        questions = json.load(f).get("questions", {})
+                    for question_id, aggregate in questions.items():
+                        self.documents.put(self.NAMESPACE, question_id, aggregate)
+                    logger.info(f"Migrated analytics for {len(questions)} questions from {legacy_path}")
+                os.replace(legacy_path, legacy_path + '.migrated')
+        except Exception as e:
+            logger.error(f"Error migrating analytics from {legacy_path}: {e}")
+
+    def record(self, question_id, outline_data, key=None):
+        """记录一次审题分析提交，key 为 "<session_id>:<index>"，用于重建时去重"""
+        metrics = outline_metrics(outline_data, self.themes)
+        try:
+            with self._lock(question_id):
+                aggregate = self.documents.get(self.NAMESPACE, question_id) or empty_aggregate(question_id)
+                apply_metrics(aggregate, metrics)
+                self.documents.put(self.NAMESPACE, question_id, aggregate)
+                # 重建进行中：同时记入日志，由重建在持有题目锁时合并
+                if self.documents.exists(self.REBUILD_NAMESPACE, 'current'):
+                    self.documents.put(self.JOURNAL_NAMESPACE, uuid.uuid4().hex,
+                                       {"key": key, "question_id": question_id, "metrics": metrics})
+        except Exception as e:
+            logger.error(f"Error saving analytics: {e}")
+
+    def _clear_journal(self):
+        for entry_id in self.documents.list_ids(self.JOURNAL_NAMESPACE):
+            self.documents.delete(self.JOURNAL_NAMESPACE, entry_id)
+
+    def rebuild(self, outlines):
+        """
+        由 (key, question_id, outline_data) 序列重新计算全部统计。
+        扫描期间服务仍在记录新提交：这些提交写入日志，扫描结束后在持有所有题目锁时补上 key 未被扫描到的部分。
+        重建失败时清除标记和日志，已有的统计保持不变。
+        """
+        # 上次重建中途退出时可能留下日志
+        self._clear_journal()
+        self.documents.put(self.REBUILD_NAMESPACE, 'current', {"started_at": datetime.now().isoformat()})
+        aggregates = {}
+        seen = set()
+        count = 0
+        try:
+            for key, question_id, outline_data in outlines:
+                aggregate = aggregates.setdefault(question_id, empty_aggregate(question_id))
+                apply_metrics(aggregate, outline_metrics(outline_data, self.themes))
+                seen.add(key)
+                count += 1
+
+            question_ids = sorted(set(aggregates) | set(self.documents.list_ids(self.NAMESPACE)))
+            with ExitStack() as stack:
+                # 按固定顺序获取题目锁；record 持有题目锁时才写日志，因此此时日志已完整
+                for question_id in question_ids:
+                    stack.enter_context(self._lock(question_id))
+                for entry_id in self.documents.list_ids(self.JOURNAL_NAMESPACE):
+                    entry = self.documents.get(self.JOURNAL_NAMESPACE, entry_id)
+                    # 不在 question_ids 中的题目是扫描之后才出现的，record 已直接写入其文档
+                    if (entry is None or entry["question_id"] not in question_ids
+                            or (entry["key"] is not None and entry["key"] in seen)):
+                        continue
+                    apply_metrics(aggregates.setdefault(entry["question_id"], empty_aggregate(entry["question_id"])),
+                                  entry["metrics"])
+                    count += 1
+                for question_id in question_ids:
+                    if question_id in aggregates:
+                        self.documents.put(self.NAMESPACE, question_id, aggregates[question_id])
+                    else:
+                        self.documents.delete(self.NAMESPACE, question_id)
+                self.documents.delete(self.REBUILD_NAMESPACE, 'current')
+            self._clear_journal()
+        finally:
+            if self.documents.exists(self.REBUILD_NAMESPACE, 'current'):
+                self.documents.delete(self.REBUILD_NAMESPACE, 'current')
+                self._clear_journal()
+        return count
+
+    def _with_top_themes(self, aggregate):
+        result = dict(aggregate)
+        result["top_themes"] = [
+            {"theme": theme, "count": count}
+            for theme, count in sorted(aggregate["themes"].items(), key=lambda item: -item[1])[:self.top_n]
+        ]
+        return result
+
+    def get(self, question_id):
+        aggregate = self.documents.get(self.NAMESPACE, question_id)
+        return self._with_top_themes(aggregate) if aggregate else None
+
+    def summary(self):
+        result = {}
+        for question_id in sorted(self.documents.list_ids(self.NAMESPACE)):
+            aggregate = self.documents.get(self.NAMESPACE, question_id)
+            if aggregate:
+                result[question_id] = self._with_top_themes(aggregate)
+        return result
+
+
+def iter_stored_outlines(session_ids, load_session_data):
+    """遍历所有 session 中的审题分析记录，产出 (key, question_id, outline_data)"""
+    for session_id in sorted(session_ids):
+        session_data = load_session_data(session_id)
+        question_id = session_data.get('question', 'default')
+        for index, outline_data in enumerate(session_data.get('essay_outlines', [])):
+            yield f"{session_id}:{index}", question_id, outline_data
+
+
+def main():
+    import argparse
+
+    from app import analytics, list_session_ids, load_session_data
+
+    parser = argparse.ArgumentParser(description="题目统计")
+    parser.add_argument('command', choices=['rebuild', 'show'])
+    parser.add_argument('--question', help="show 时仅显示指定题目")
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        count = analytics.rebuild(iter_stored_outlines(list_session_ids(), load_session_data))
+        print(f"已根据 {count} 条提交重建统计")
+    else:
+        data = analytics.get(args.question) if args.question else analytics.summary()
+        print(json.dumps(data, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,39 @@
+import time
+IMPORT_STARTED = time.monotonic()
+
 import random
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, make_response, stream_with_context
 from flask_cors import CORS
 import os
 import json
-import base64
+import hashlib
 from datetime import datetime
 import uuid
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 import logging
-import requests
 import tempfile
 import re
+from functools import wraps
+
+from analytics import AnalyticsStore
+from archive import DEFAULT_ARCHIVE, ArchiveError, SessionArchive
+from export import RECORD_TYPES, gzip_chunks, import_records, iter_ndjson, iter_records, parse_date, to_ndjson
+from llm_router import LLMRouter
+from ocr_backends import create_ocr_backend
+from prescore import OutlinePrescorer
+from prompt_builder import (DEFAULT_TOKEN_BUDGETS, compact_json, fill_template,
+                            normalize_ocr_text, trim_std_outlines, truncate_text)
+from rate_limit import AdmissionController, RateLimiter, merge_limits
+from singleflight import SingleFlight, make_key
+from scheduler import DEFAULT_SCHEDULER, PriorityScheduler, SchedulerRejected, current_priority, work_priority
+from search_index import (SearchIndex, document_text, imitation_document, iter_qbank_documents,
+                          make_snippet, outline_document)
+from startup import DEFAULT_READINESS, FileCache, StartupMonitor, check_prompts, check_qbank, validate_config
+from storage import DEFAULT_STORAGE, StorageError, create_storage
+from strokes import DEFAULT_STROKE_RASTER, decode_strokes, rasterize_strokes
+
+IMPORTS_FINISHED = time.monotonic()
 
 # 导入配置文件
 if os.path.exists("config.json"):
@@ -20,8 +43,10 @@ if os.path.exists("config.json"):
     PADDLE_OCR_TOKEN = CONFIG.get("PADDLE_OCR_TOKEN", "")
     LLM_API_URL = CONFIG.get("LLM_API_URL", "")
     LLM_API_KEY = CONFIG.get("LLM_API_KEY", "")
+    LLM_MODEL = CONFIG.get("LLM_MODEL", "openai")
 else:
     print("警告: config.json 文件不存在，请复制 config.template.json 为 config.json 并填写正确的配置")
+    CONFIG = {}
     # 使用默认配置
     PADDLE_OCR_API_URL = "https://c8s16af3r0gd36g6.aistudio-app.com/layout-parsing"
     PADDLE_OCR_TOKEN = "your_paddle_ocr_token_here"
@@ -29,10 +54,19 @@ else:
     LLM_API_KEY = "your_llm_api_key_here"
     LLM_MODEL = "qwen-max"
 
+# prompt 各注入字段的 token 预算
+PROMPT_TOKEN_BUDGETS = {**DEFAULT_TOKEN_BUDGETS, **CONFIG.get("PROMPT_TOKEN_BUDGETS", {})}
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# LLM 服务商路由（见 LLM_CONFIG.md）
+llm_router = LLMRouter.from_config(CONFIG, LLM_API_URL, LLM_API_KEY, LLM_MODEL)
+
+# OCR 后端（远程 PaddleOCR 接口或本地进程池）
+ocr_backend = create_ocr_backend(CONFIG, PADDLE_OCR_API_URL, PADDLE_OCR_TOKEN)
+
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": ["https://berniehuang2008.github.io", "http://localhost:3000"]}})
 
@@ -41,8 +75,52 @@ DATA_FOLDER = 'data'
 SESSIONS_FOLDER = os.path.join(DATA_FOLDER, 'sessions')
 USERS_FOLDER = os.path.join(DATA_FOLDER, 'users')
 PROMPTS_FOLDER = 'prompts'
+QBANK_FOLDER = 'qbank'
+
+# prompt 和题库文件缓存（启动时预加载，文件修改后自动重新读取）
+prompt_cache = FileCache(lambda text: text)
+qbank_cache = FileCache(json.loads)
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+# 限流与准入控制（见 README.md「限流」）
+RATE_LIMITS = merge_limits(CONFIG.get("RATE_LIMITS"))
+if RATE_LIMITS["proxy_hops"]:
+    # 部署在反向代理之后时，从 X-Forwarded-For 取客户端IP
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=RATE_LIMITS["proxy_hops"])
+rate_limiter = RateLimiter({kind: RATE_LIMITS[kind] for kind in ("ocr", "llm")})
+admission = AdmissionController(RATE_LIMITS["max_concurrent"], RATE_LIMITS["max_queue"], RATE_LIMITS["queue_timeout"])
+
+# OCR/LLM 优先级调度（见 README.md「优先级调度」）
+SCHEDULER = {**DEFAULT_SCHEDULER, **CONFIG.get("SCHEDULER", {})}
+ocr_scheduler = PriorityScheduler('ocr', SCHEDULER["ocr"]["concurrency"], SCHEDULER["classes"], SCHEDULER["max_queue"])
+llm_scheduler = PriorityScheduler('llm', SCHEDULER["llm"]["concurrency"], SCHEDULER["classes"], SCHEDULER["max_queue"])
+
+# 笔画提交的栅格化分辨率
+STROKE_RASTER = {**DEFAULT_STROKE_RASTER, **CONFIG.get("STROKE_RASTER", {})}
+
+# 合并相同输入的并发OCR/LLM请求
+ocr_flight = SingleFlight('ocr')
+llm_flight = SingleFlight('llm')
+
+# 提纲本地预评分（启动时预计算题库向量）
+prescorer = OutlinePrescorer(QBANK_FOLDER, CONFIG.get("PRESCORE"))
+
+# 全文检索索引（首次启动时仅索引题库，历史提交可运行 python search_index.py rebuild）
+search_index = SearchIndex(os.path.join(DATA_FOLDER, 'search'))
+search_index.rebuild_if_empty(iter_qbank_documents(QBANK_FOLDER))
+
+# 冷 session 归档（见 README.md「归档」）
+ARCHIVE = {**DEFAULT_ARCHIVE, **CONFIG.get("ARCHIVE", {})}
+session_archive = SessionArchive(os.path.join(DATA_FOLDER, 'archive'), ARCHIVE["compression_level"])
+
+# session/用户/上传文件/锁/任务状态的存储后端（见 README.md「多节点部署」）
+STORAGE = {**DEFAULT_STORAGE, **CONFIG.get("STORAGE", {})}
+storage = create_storage(STORAGE, DATA_FOLDER)
+
+# 按题目的增量统计，保存在共享存储中（旧版的 data/analytics.json 首次启动时自动导入）
+analytics = AnalyticsStore(storage.documents, storage.locks, CONFIG.get("ANALYTICS_THEMES"),
+                           legacy_path=os.path.join(DATA_FOLDER, 'analytics.json'))
+
 # 确保必要的文件夹存在
 for folder in [DATA_FOLDER, SESSIONS_FOLDER, USERS_FOLDER]:
     if not os.path.exists(folder):
@@ -52,27 +130,30 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def ask_llm(messages: list) -> str:
-    import os
-    # Use Pollinations AI API for LLM interaction
-    url = LLM_API_URL
-    api_key = LLM_API_KEY
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "openai",
-        "messages": messages
-    }
-    response = requests.post(url, json=payload, headers=headers, verify=False)
-    return response
+def ask_llm(messages: list, stage=None, max_tokens=None, temperature=None):
+    # 第一条消息前加随机数防止缓存（合并请求的key不包含它）
+    messages = [dict(messages[0], content=str(random.random()) + messages[0]["content"])] + messages[1:]
+    # 由路由选择服务商，失败时自动切换
+    return llm_router.chat(messages, stage=stage, max_tokens=max_tokens, temperature=temperature)
+
+def call_llm_api(messages, max_tokens=None, temperature=None, stage=None):
+    """
+    调用LLM API进行内容生成，相同输入的并发调用只请求一次上游。
+    被调度器拒绝时，在线请求得到失败结果；batch/maintenance 任务收到 SchedulerRejected，由调用方退避重试。
+    """
+    key = make_key(stage, max_tokens, temperature, messages)
+    try:
+        return dict(llm_flight.do(key, lambda: _call_llm_api(messages, max_tokens, temperature, stage)))
+    except SchedulerRejected as e:
+        if current_priority()[0] != 'interactive':
+            raise
+        logger.error(f"Error calling LLM API: {str(e)}")
+        return {"success": False, "error": str(e)}
 
-def call_llm_api(messages, max_tokens=2048, temperature=0.7):
-    """调用LLM API进行内容生成"""
+def _call_llm_api(messages, max_tokens, temperature, stage):
     try:        
-        # response = requests.post(LLM_API_URL, json=payload, headers=headers, timeout=60, verify=False)
-        response = ask_llm(messages)
+        with llm_scheduler.slot():
+            response = ask_llm(messages, stage=stage, max_tokens=max_tokens, temperature=temperature)
         
         if response.status_code == 200:
             result = response.json()
@@ -88,6 +169,8 @@ def call_llm_api(messages, max_tokens=2048, temperature=0.7):
                 "error": f"LLM API request failed with status {response.status_code}"
             }
             
+    except SchedulerRejected:
+        raise
     except Exception as e:
         logger.error(f"Error calling LLM API: {str(e)}")
         return {
@@ -126,8 +209,7 @@ def load_prompt_template(prompt_file):
     """加载prompt模板文件"""
     prompt_path = os.path.join(PROMPTS_FOLDER, prompt_file)
     try:
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        return prompt_cache.get(prompt_path)
     except Exception as e:
         logger.error(f"Error loading prompt template {prompt_file}: {str(e)}")
         return None
@@ -139,17 +221,18 @@ def generate_user_outline(user_content):
         return {"success": False, "error": "Failed to load outline generation prompt"}
     
     # 替换模板中的用户内容
-    prompt = str(random.random()) + prompt_template  # 防止缓存
-    prompt = prompt.replace('$USER_CONTENT', user_content)
+    prompt = fill_template(prompt_template, {
+        '$USER_CONTENT': truncate_text(normalize_ocr_text(user_content), PROMPT_TOKEN_BUDGETS["user_content"])
+    }, stage='gen_user_outline')
     
     messages = [
         {"role": "user", "content": prompt}
     ]
     
-    result = call_llm_api(messages)
+    result = call_llm_api(messages, stage='gen_user_outline')
     
     with open("logs_outline_generation.txt", "w", encoding="utf-8") as log_file:
-        log_file.write(f"prompt:\n{prompt}\n\nresponse:\n{result['content']}\n")
+        log_file.write(f"prompt:\n{prompt}\n\nresponse:\n{result.get('content', result.get('error'))}\n")
 
     if result["success"]:
         # 提取JSON内容
@@ -161,9 +244,9 @@ def generate_user_outline(user_content):
     else:
         return result
 
-def cmp_outline(user_outline, sessionid):
+def cmp_outline(user_outline, sessionid, prompt_file='ai_cmp_outline.txt'):
     """使用AI比较用户提纲vs标准思路"""
-    prompt_template = load_prompt_template('ai_cmp_outline.txt')
+    prompt_template = load_prompt_template(prompt_file)
     if not prompt_template:
         return {"success": False, "error": "Failed to load outline judgment prompt"}
     
@@ -175,18 +258,19 @@ def cmp_outline(user_outline, sessionid):
     std_outilnes = topic.get("outlines", [])
     
     # 替换模板中的内容
-    prompt = str(random.random()) + prompt_template  # 防止缓存
-    prompt = prompt.replace('$USER_OUTLINE', json.dumps(user_outline, ensure_ascii=False, indent=2))
-    prompt = prompt.replace('$STD_OUTLINE', json.dumps(std_outilnes, ensure_ascii=False, indent=2))
-    prompt = prompt.replace('$STD_THINKING', std_thinking)
+    prompt = fill_template(prompt_template, {
+        '$USER_OUTLINE': compact_json(user_outline),
+        '$STD_OUTLINE': compact_json(trim_std_outlines(std_outilnes, PROMPT_TOKEN_BUDGETS["std_outline"])),
+        '$STD_THINKING': truncate_text(std_thinking, PROMPT_TOKEN_BUDGETS["std_thinking"])
+    }, stage='cmp_outline')
 
     messages = [
         {"role": "user", "content": prompt}
     ]
-    result = call_llm_api(messages)
+    result = call_llm_api(messages, stage='cmp_outline')
     
     with open("logs_outline_comparison.txt", "w", encoding="utf-8") as log_file:
-        log_file.write(f"prompt:\n{prompt}\n\nresponse:\n{result['content']}\n")
+        log_file.write(f"prompt:\n{prompt}\n\nresponse:\n{result.get('content', result.get('error'))}\n")
 
     if result["success"]:
         # 提取JSON内容
@@ -210,19 +294,20 @@ def judge_outline(user_content, generated_outline, sessionid):
     std_thinking = get_essay_topics(question_id).get("think", "")
     
     # 替换模板中的内容
-    prompt = str(random.random()) + prompt_template  # 防止缓存
-    prompt = prompt.replace('$USER_CONTENT', user_content)
-    prompt = prompt.replace('$GENERATED_OUTLINE', json.dumps(generated_outline, ensure_ascii=False, indent=2))
-    prompt = prompt.replace('$STD_THINKING', std_thinking)
+    prompt = fill_template(prompt_template, {
+        '$USER_CONTENT': truncate_text(normalize_ocr_text(user_content), PROMPT_TOKEN_BUDGETS["user_content"]),
+        '$GENERATED_OUTLINE': compact_json(generated_outline),
+        '$STD_THINKING': truncate_text(std_thinking, PROMPT_TOKEN_BUDGETS["std_thinking"])
+    }, stage='judge_outline')
     
     messages = [
         {"role": "user", "content": prompt}
     ]
     
-    result = call_llm_api(messages)
+    result = call_llm_api(messages, stage='judge_outline')
     
     with open("logs_outline_judgment.txt", "w", encoding="utf-8") as log_file:
-        log_file.write(f"prompt:\n{prompt}\n\nresponse:\n{result['content']}\n")
+        log_file.write(f"prompt:\n{prompt}\n\nresponse:\n{result.get('content', result.get('error'))}\n")
 
     if result["success"]:
         # 提取JSON内容
@@ -234,81 +319,113 @@ def judge_outline(user_content, generated_outline, sessionid):
     else:
         return result
 
-def process_image_with_ocr(file_path):
-    """使用PaddleOCR API处理图片并返回OCR结果"""
+def run_ocr(file_path):
+    """经优先级调度后调用OCR后端"""
     try:
-        # 读取图片文件并转换为base64
-        with open(file_path, "rb") as file:
-            file_bytes = file.read()
-            file_data = base64.b64encode(file_bytes).decode("ascii")
-            file_data = file_data
-        
-        # 设置请求头
-        headers = {
-            "Authorization": f"token {PADDLE_OCR_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        
-        # 设置请求数据（fileType=1 表示图片）
-        payload = {
-            "file": file_data,
-            "fileType": 1,
-            "useDocOrientationClassify": False,
-            "useDocUnwarping": False,
-            "useTextlineOrientation": False,
-            "useChartRecognition": False,
-        }
-        
-        # 发送OCR请求
-        response = requests.post(PADDLE_OCR_API_URL, json=payload, headers=headers, timeout=300, verify=False)
-        
-        if response.status_code == 200:
-            result = response.json()["result"]
-            
-            # 提取Markdown文本内容
-            ocr_texts = []
-            for res in result["layoutParsingResults"]:
-                if "markdown" in res and "text" in res["markdown"]:
-                    ocr_texts.append(res["markdown"]["text"])
-            
-            return {
-                "success": True,
-                "text_content": "\n\n".join(ocr_texts),
-                "raw_result": result
-            }
-        else:
-            logger.error(f"OCR API request failed with status {response.status_code}")
-            return {
-                "success": False,
-                "error": f"OCR API request failed with status {response.status_code}"
-            }
-            
-    except Exception as e:
-        logger.error(f"Error processing image with OCR: {str(e)}")
-        return {
-            "success": False,
-            "error": str(e)
-        }
+        with ocr_scheduler.slot():
+            return ocr_backend.process(file_path)
+    except SchedulerRejected as e:
+        logger.warning(str(e))
+        return {"success": False, "error": str(e)}
 
-def load_session_data(sessionid):
-    """加载指定session的数据文件"""
-    session_file = os.path.join(SESSIONS_FOLDER, f"{sessionid}.json")
-    if os.path.exists(session_file):
+def process_image_with_ocr(file_path):
+    """使用配置的OCR后端处理图片并返回OCR结果，内容相同的并发请求只识别一次"""
+    with open(file_path, 'rb') as f:
+        key = hashlib.sha256(f.read()).hexdigest()
+    return dict(ocr_flight.do(key, lambda: run_ocr(file_path)))
+
+def process_strokes_with_ocr(strokes):
+    """将笔画栅格化后进行OCR；相同笔画在栅格化之前即被合并"""
+    def rasterize_and_ocr():
+        png = rasterize_strokes(strokes, STROKE_RASTER["width"], STROKE_RASTER["max_height"])
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
+            temp_file.write(png)
         try:
-            with open(session_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Error loading session {sessionid}: {e}")
-            return get_session_template(sessionid)
+            return run_ocr(temp_file.name)
+        finally:
+            os.unlink(temp_file.name)
+    return dict(ocr_flight.do(strokes["key"], rasterize_and_ocr))
+
+def load_session_data(sessionid):
+    """加载指定session的数据，不存在时从归档包读取"""
+    try:
+        session_data = storage.documents.get('sessions', sessionid)
+        if session_data is not None:
+            return session_data
+        archived = session_archive.load(sessionid)
+        if archived is not None:
+            return archived
+    except ArchiveError:
+        # 归档记录无法读取时不能当作新session返回，否则下一次保存会覆盖归档中的数据
+        raise
+    except Exception as e:
+        logger.error(f"Error loading session {sessionid}: {e}")
     return get_session_template(sessionid)
 
+def session_exists(sessionid):
+    """判断session是否已保存（包括已归档的session）"""
+    return storage.documents.exists('sessions', sessionid) or session_archive.contains(sessionid)
+
+def list_session_ids():
+    """列出所有已保存的session，包括已归档的session"""
+    session_ids = storage.documents.list_ids('sessions')
+    loose = set(session_ids)
+    return session_ids + [sessionid for sessionid in session_archive.session_ids() if sessionid not in loose]
+
+def load_session_strict(sessionid):
+    """
+    读-改-写使用的加载：session不存在时返回模板，读取出错时抛出异常。
+    load_session_data 出错时返回模板，在锁内使用会把空模板保存回去，覆盖原有数据。
+    """
+    session_data = storage.documents.get('sessions', sessionid)
+    if session_data is None:
+        session_data = session_archive.load(sessionid)
+    return session_data if session_data is not None else get_session_template(sessionid)
+
+def store_session_data(sessionid, session_data):
+    session_data.setdefault('metadata', {})['last_updated'] = datetime.now().isoformat() + "Z"
+    storage.documents.put('sessions', sessionid, session_data)
+
+def lock_session_nowait(sessionid):
+    """获取session锁，已被占用时立即抛出 LockTimeout（供归档使用）"""
+    return storage.locks.lock(f"session:{sessionid}", timeout=0)
+
+def update_session_data(sessionid, update):
+    """
+    在session锁内读取、修改并保存session，避免多个节点的并发提交互相覆盖；返回修改后的数据。
+    获取锁、读取或保存失败时抛出 StorageError，此时不会保存任何内容。
+    """
+    try:
+        with storage.locks.lock(f"session:{sessionid}"):
+            session_data = load_session_strict(sessionid)
+            update(session_data)
+            store_session_data(sessionid, session_data)
+            return session_data
+    except StorageError:
+        raise
+    except Exception as e:
+        raise StorageError(f"Failed to update session {sessionid}: {e}") from e
+
+def update_job(jobid, **fields):
+    """记录提交任务的进度，任意节点可通过 /jobStatus 查询；失败时不影响提交本身"""
+    try:
+        storage.jobs.update(jobid, **fields)
+    except Exception as e:
+        logger.warning(f"Failed to update job {jobid}: {e}")
+
+def start_job(**fields):
+    """创建新的提交任务，任务id总是由服务端生成"""
+    jobid = uuid.uuid4().hex
+    try:
+        storage.jobs.start(jobid, **fields)
+    except Exception as e:
+        logger.warning(f"Failed to create job {jobid}: {e}")
+    return jobid
+
 def save_session_data(sessionid, session_data):
-    """保存session数据到文件"""
-    session_file = os.path.join(SESSIONS_FOLDER, f"{sessionid}.json")
+    """保存session数据"""
     try:
-        session_data['metadata']['last_updated'] = datetime.now().isoformat() + "Z"
-        with open(session_file, 'w', encoding='utf-8') as f:
-            json.dump(session_data, f, ensure_ascii=False, indent=2)
+        store_session_data(sessionid, session_data)
         return True
     except Exception as e:
         logger.error(f"Error saving session {sessionid}: {e}")
@@ -317,17 +434,14 @@ def save_session_data(sessionid, session_data):
 def get_all_sessions():
     """获取所有session列表"""
     sessions = {}
-    if os.path.exists(SESSIONS_FOLDER):
-        for filename in os.listdir(SESSIONS_FOLDER):
-            if filename.endswith('.json'):
-                sessionid = filename[:-5]  # 移除.json后缀
-                session_data = load_session_data(sessionid)
-                sessions[sessionid] = {
-                    "session_id": session_data.get("session_id", sessionid),
-                    "user_name": session_data.get("user_name", f"用户_{sessionid}"),
-                    "created_at": session_data.get("created_at", ""),
-                    "status": session_data.get("status", "active")
-                }
+    for sessionid in list_session_ids():
+        session_data = load_session_data(sessionid)
+        sessions[sessionid] = {
+            "session_id": session_data.get("session_id", sessionid),
+            "user_name": session_data.get("user_name", f"用户_{sessionid}"),
+            "created_at": session_data.get("created_at", ""),
+            "status": session_data.get("status", "active")
+        }
     return sessions
 
 def get_session_template(sessionid):
@@ -350,10 +464,10 @@ def get_session_template(sessionid):
 def get_essay_topics(question_id):
     """获取作文题目数据"""
     logger.info(f"Loading essay topic for question ID: {question_id}")
-    if os.path.exists(f'./qbank/{question_id}.json'):
+    question_file = os.path.join(QBANK_FOLDER, f'{question_id}.json')
+    if os.path.exists(question_file):
         try:
-            with open(f'./qbank/{question_id}.json', 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return qbank_cache.get(question_file)
         except Exception as e:
             logger.error(f"Error loading essay topic {question_id}: {e}")
             return {"question": "# 暂无题目\n\n请联系管理员添加题目内容。"}
@@ -410,23 +524,19 @@ def get_imitation_materials():
     }
 
 def load_user_config(username):
-    """加载用户配置文件"""
-    user_file = os.path.join(USERS_FOLDER, f"{username}.json")
-    if os.path.exists(user_file):
-        try:
-            with open(user_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Error loading user config {username}: {e}")
-            return get_user_config_template(username)
+    """加载用户配置"""
+    try:
+        user_config = storage.documents.get('users', username)
+        if user_config is not None:
+            return user_config
+    except Exception as e:
+        logger.error(f"Error loading user config {username}: {e}")
     return get_user_config_template(username)
 
 def save_user_config(username, user_config):
-    """保存用户配置文件"""
-    user_file = os.path.join(USERS_FOLDER, f"{username}.json")
+    """保存用户配置"""
     try:
-        with open(user_file, 'w', encoding='utf-8') as f:
-            json.dump(user_config, f, ensure_ascii=False, indent=2)
+        storage.documents.put('users', username, user_config)
         return True
     except Exception as e:
         logger.error(f"Error saving user config {username}: {e}")
@@ -442,46 +552,52 @@ def get_user_config_template(username):
 
 def add_session_to_user(username, session_id, session_name, question_id):
     """为用户添加session记录"""
-    user_config = load_user_config(username)
-    
-    # 检查session是否已存在
-    for session in user_config["sessions"]:
-        if session["session_id"] == session_id:
-            return False  # session已存在
-    
-    # 添加新session
-    new_session = {
-        "session_id": session_id,
-        "session_name": session_name,
-        "question_id": question_id,
-        "created_at": datetime.now().isoformat() + "Z"
-    }
-    user_config["sessions"].append(new_session)
-    
-    # 保存用户配置
-    return save_user_config(username, user_config)
+    # 读-改-写期间持有用户锁，避免多个节点同时创建session时互相覆盖；
+    # 读取出错时不能用模板代替，否则会覆盖该用户已有的session列表
+    try:
+        with storage.locks.lock(f"user:{username}"):
+            user_config = storage.documents.get('users', username) or get_user_config_template(username)
+            
+            # 检查session是否已存在
+            for session in user_config["sessions"]:
+                if session["session_id"] == session_id:
+                    return False  # session已存在
+            
+            # 添加新session
+            new_session = {
+                "session_id": session_id,
+                "session_name": session_name,
+                "question_id": question_id,
+                "created_at": datetime.now().isoformat() + "Z"
+            }
+            user_config["sessions"].append(new_session)
+            
+            # 保存用户配置
+            storage.documents.put('users', username, user_config)
+            return True
+    except Exception as e:
+        logger.error(f"Error adding session {session_id} to user {username}: {e}")
+        return False
 
 def get_all_questions():
     """获取所有问题列表"""
     questions = []
-    qbank_folder = 'qbank'
     
-    if os.path.exists(qbank_folder):
-        for filename in os.listdir(qbank_folder):
+    if os.path.exists(QBANK_FOLDER):
+        for filename in os.listdir(QBANK_FOLDER):
             if filename.startswith('question_') and filename.endswith('.json'):
                 question_id = filename[:-5]  # 移除.json后缀
                 try:
-                    with open(os.path.join(qbank_folder, filename), 'r', encoding='utf-8') as f:
-                        question_data = json.load(f)
-                        # 提取题目的前100个字符作为简介
-                        question_text = question_data.get('question', '')
-                        question_brief = question_text[:100] + '...' if len(question_text) > 100 else question_text
-                        
-                        questions.append({
-                            "question_id": question_id,
-                            "title": question_brief.split('\n')[0],  # 第一行作为标题
-                            "brief": question_brief
-                        })
+                    question_data = qbank_cache.get(os.path.join(QBANK_FOLDER, filename))
+                    # 提取题目的前100个字符作为简介
+                    question_text = question_data.get('question', '')
+                    question_brief = question_text[:100] + '...' if len(question_text) > 100 else question_text
+                    
+                    questions.append({
+                        "question_id": question_id,
+                        "title": question_brief.split('\n')[0],  # 第一行作为标题
+                        "brief": question_brief
+                    })
                 except Exception as e:
                     logger.error(f"Error loading question {question_id}: {e}")
     
@@ -525,10 +641,8 @@ def create_new_session(username, question_id, session_name=None):
                 "created_at": created_at
             }
         else:
-            # 如果添加到用户配置失败，删除已创建的session文件
-            session_file = os.path.join(SESSIONS_FOLDER, f"{session_id}.json")
-            if os.path.exists(session_file):
-                os.remove(session_file)
+            # 如果添加到用户配置失败，删除已创建的session
+            storage.documents.delete('sessions', session_id)
             return {
                 "success": False,
                 "error": "Failed to add session to user config"
@@ -539,6 +653,89 @@ def create_new_session(username, question_id, session_name=None):
             "error": "Failed to create session file"
         }
 
+def ocr_submission():
+    """
+    对提交中的手写内容执行OCR，支持两种格式：
+    - image: 图片文件
+    - strokes: 画布笔画数据（见 strokes.py），由后端栅格化
+    返回 (ocr_result, original_filename, error_response)
+    """
+    if 'strokes' in request.files or 'strokes' in request.form:
+        raw = request.files['strokes'].read() if 'strokes' in request.files else request.form['strokes']
+        try:
+            strokes = decode_strokes(raw)
+        except ValueError as e:
+            return None, None, (jsonify({"error": f"Invalid strokes data: {str(e)}"}), 400)
+        return process_strokes_with_ocr(strokes), 'strokes.json', None
+
+    if 'image' not in request.files:
+        return None, None, (jsonify({"error": "No image file provided"}), 400)
+    
+    file = request.files['image']
+    if file.filename == '':
+        return None, None, (jsonify({"error": "No file selected"}), 400)
+    
+    if not allowed_file(file.filename):
+        return None, None, (jsonify({"error": "Invalid file type"}), 400)
+
+    # 使用临时文件处理上传的图片
+    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
+        file.save(temp_file.name)
+    try:
+        ocr_result = process_image_with_ocr(temp_file.name)
+    finally:
+        # 清理临时文件
+        os.unlink(temp_file.name)
+    return ocr_result, secure_filename(file.filename), None
+
+def get_client_key():
+    """
+    限流使用的客户端标识（IP）。
+    sessionid 和用户名都由客户端提交且没有校验，以它们为键时，任何人带上别人的sessionid
+    就能耗尽对方的配额，每次换一个sessionid又能绕过限流，因此只按IP计费。
+    """
+    return f"ip:{request.remote_addr}"
+
+def too_many_requests(error, retry_after):
+    """返回带 Retry-After 的 429 响应"""
+    retry_after = max(1, int(retry_after + 0.999))
+    response = jsonify({"success": False, "error": error, "retry_after": retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def expensive(ocr=0, llm=0):
+    """为消耗OCR/LLM资源的接口加上按用户限流和全局并发控制"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = get_client_key()
+            costs = {"ocr": ocr, "llm": llm}
+            allowed, retry_after = rate_limiter.acquire(key, costs)
+            if not allowed:
+                logger.warning(f"Rate limit exceeded for {key} on {request.path}")
+                return too_many_requests("请求过于频繁，请稍后再试", retry_after)
+
+            admitted, retry_after = admission.acquire()
+            if not admitted:
+                rate_limiter.refund(key, costs)
+                logger.warning(f"Admission queue full, rejecting {key} on {request.path}")
+                return too_many_requests("服务器繁忙，请稍后再试", retry_after)
+
+            started = time.monotonic()
+            try:
+                # 在线请求以 interactive 优先级调度，按客户端公平分配
+                with work_priority('interactive', key):
+                    response = make_response(view(*args, **kwargs))
+            finally:
+                admission.release(time.monotonic() - started)
+            # 参数校验失败（400）时尚未调用OCR/LLM，退还令牌
+            if response.status_code == 400:
+                rate_limiter.refund(key, costs)
+            return response
+        return wrapper
+    return decorator
+
 # API 路由
 
 @app.route('/')
@@ -674,8 +871,7 @@ def get_session_detail():
     session_data = load_session_data(sessionid)
     
     # 如果是新创建的session，保存到文件
-    session_file = os.path.join(SESSIONS_FOLDER, f"{sessionid}.json")
-    if not os.path.exists(session_file):
+    if not session_exists(sessionid):
         save_session_data(sessionid, session_data)
         logger.info(f"Created new session: {sessionid}")
     
@@ -702,103 +898,125 @@ def get_essay_topic():
     return jsonify({"topic_md": topic_md})
 
 @app.route('/submitEssayOutline', methods=['POST'])
+@expensive(ocr=1, llm=2)
 def submit_essay_outline():
     """提交审题分析"""
     sessionid = request.args.get('sessionid')
     if not sessionid:
         return jsonify({"error": "Missing sessionid parameter"}), 400
     
-    if 'image' not in request.files:
-        return jsonify({"error": "No image file provided"}), 400
-    
-    file = request.files['image']
-    if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
+    jobid = start_job(kind="essay_outline", sessionid=sessionid, state="ocr")
+    ocr_result, original_filename, error_response = ocr_submission()
+    if error_response:
+        update_job(jobid, state="failed", error="invalid submission")
+        return error_response
     
-    if file and allowed_file(file.filename):
-        # 生成唯一文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if ocr_result["success"]:
+        # 使用AI生成提纲
+        logger.info(f"Generating outline using AI for session {sessionid}")
+        update_job(jobid, state="generating")
+        outline_result = generate_user_outline(ocr_result["text_content"])
         
-        # 使用临时文件处理上传的图片
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-            file.save(temp_file.name)
-            
-            # 使用OCR处理图片
-            ocr_result = process_image_with_ocr(temp_file.name)
+        if outline_result["success"]:
+            # 本地预评分，空提纲/偏题时可跳过AI评价
+            question_id = load_session_data(sessionid).get('question', 'default')
+            prescore = prescorer.score(question_id, outline_result["outline"])
             
-            # 清理临时文件
-            # os.unlink(temp_file.name)
-        
-        if ocr_result["success"]:
-            # 使用AI生成提纲
-            logger.info(f"Generating outline using AI for session {sessionid}")
-            outline_result = generate_user_outline(ocr_result["text_content"])
-            
-            if outline_result["success"]:
+            if prescorer.should_skip_llm(prescore):
+                logger.info(f"Skipping AI judgement for session {sessionid}: prescore verdict {prescore['verdict']}")
+                cmp_result = {"success": False, "error": f"Skipped by prescore: {prescore['verdict']}"}
+            else:
                 # 使用AI评价提纲
                 logger.info(f"Judging outline using AI for session {sessionid}")
+                update_job(jobid, state="judging")
                 cmp_result = cmp_outline(outline_result["outline"], sessionid)
-                
-                # 准备保存到session的数据
-                outline_data = {
-                    "text_content": ocr_result["text_content"],
-                    "structured_content": outline_result["outline"],
-                    "cmp": cmp_result["judgement"] if cmp_result["success"] else {},
-                    "submitted_at": datetime.now().isoformat(),
-                    "original_filename": secure_filename(file.filename)
-                }
-                
-                # 如果AI评价失败，记录错误但不影响整体流程
-                if not cmp_result["success"]:
-                    outline_data["judgement_error"] = cmp_result["error"]
-                    logger.warning(f"AI judgement failed for session {sessionid}: {cmp_result['error']}")
-                
-                # 记录提交信息到session文件
-                session_data = load_session_data(sessionid)
-                session_data['essay_outlines'].append(outline_data)
-                session_data['metadata']['total_submissions'] += 1
-                save_session_data(sessionid, session_data)
-                
-                logger.info(f"Essay outline fully processed for session {sessionid}")
-                return jsonify({
-                    "success": True,
-                    "message": "Outline submitted and processed successfully",
-                    "text_content": ocr_result["text_content"][:200] + "..." if len(ocr_result["text_content"]) > 200 else ocr_result["text_content"],
-                    "structured_content": outline_result["outline"],
-                    "cmp": outline_data["cmp"],
-                    "judgement_success": cmp_result["success"]
-                })
-            else:
-                # AI生成失败，但OCR成功，仍然保存基本信息
-                logger.error(f"AI outline generation failed for session {sessionid}: {outline_result['error']}")
-                
-                outline_data = {
-                    "text_content": ocr_result["text_content"],
-                    "structured_content": {},
-                    "cmp": {},
-                    "generation_error": outline_result["error"],
-                    "submitted_at": datetime.now().isoformat(),
-                    "original_filename": secure_filename(file.filename)
-                }
-                
-                session_data = load_session_data(sessionid)
-                session_data['essay_outlines'].append(outline_data)
-                session_data['metadata']['total_submissions'] += 1
-                save_session_data(sessionid, session_data)
-                
-                return jsonify({
-                    "success": False,
-                    "error": f"OCR succeeded but AI processing failed: {outline_result['error']}",
-                    "text_content": ocr_result["text_content"][:200] + "..." if len(ocr_result["text_content"]) > 200 else ocr_result["text_content"]
-                }), 500
+            
+            # 准备保存到session的数据
+            outline_data = {
+                "text_content": ocr_result["text_content"],
+                "structured_content": outline_result["outline"],
+                "cmp": cmp_result["judgement"] if cmp_result["success"] else {},
+                "prescore": prescore,
+                "submitted_at": datetime.now().isoformat(),
+                "original_filename": original_filename
+            }
+            
+            # 如果AI评价失败，记录错误但不影响整体流程
+            if not cmp_result["success"]:
+                outline_data["judgement_error"] = cmp_result["error"]
+                logger.warning(f"AI judgement failed for session {sessionid}: {cmp_result['error']}")
+            
+            # 记录提交信息到session
+            try:
+                session_data = update_session_data(sessionid, lambda data: append_outline(data, outline_data))
+            except StorageError as e:
+                return session_save_failed(jobid, sessionid, e)
+            analytics.record(question_id, outline_data, key=f"{sessionid}:{len(session_data['essay_outlines']) - 1}")
+            search_index.add(*outline_document(sessionid, question_id, len(session_data['essay_outlines']) - 1, outline_data))
+            update_job(jobid, state="done", judgement_success=cmp_result["success"])
+            
+            logger.info(f"Essay outline fully processed for session {sessionid}")
+            return jsonify({
+                "success": True,
+                "jobid": jobid,
+                "message": "Outline submitted and processed successfully",
+                "text_content": ocr_result["text_content"][:200] + "..." if len(ocr_result["text_content"]) > 200 else ocr_result["text_content"],
+                "structured_content": outline_result["outline"],
+                "cmp": outline_data["cmp"],
+                "prescore": prescore,
+                "judgement_success": cmp_result["success"]
+            })
         else:
-            logger.error(f"OCR processing failed for session {sessionid}: {ocr_result.get('error', 'Unknown error')}")
+            # AI生成失败，但OCR成功，仍然保存基本信息
+            logger.error(f"AI outline generation failed for session {sessionid}: {outline_result['error']}")
+            
+            outline_data = {
+                "text_content": ocr_result["text_content"],
+                "structured_content": {},
+                "cmp": {},
+                "generation_error": outline_result["error"],
+                "submitted_at": datetime.now().isoformat(),
+                "original_filename": original_filename
+            }
+            
+            try:
+                session_data = update_session_data(sessionid, lambda data: append_outline(data, outline_data))
+            except StorageError as e:
+                return session_save_failed(jobid, sessionid, e)
+            analytics.record(session_data.get('question', 'default'), outline_data,
+                             key=f"{sessionid}:{len(session_data['essay_outlines']) - 1}")
+            search_index.add(*outline_document(sessionid, session_data.get('question', 'default'),
+                                               len(session_data['essay_outlines']) - 1, outline_data))
+            update_job(jobid, state="failed", error=outline_result["error"])
+            
             return jsonify({
                 "success": False,
-                "error": f"OCR processing failed: {ocr_result.get('error', 'Unknown error')}"
+                "jobid": jobid,
+                "error": f"OCR succeeded but AI processing failed: {outline_result['error']}",
+                "text_content": ocr_result["text_content"][:200] + "..." if len(ocr_result["text_content"]) > 200 else ocr_result["text_content"]
             }), 500
-    
-    return jsonify({"error": "Invalid file type"}), 400
+    else:
+        logger.error(f"OCR processing failed for session {sessionid}: {ocr_result.get('error', 'Unknown error')}")
+        update_job(jobid, state="failed", error=ocr_result.get('error', 'Unknown error'))
+        return jsonify({
+            "success": False,
+            "jobid": jobid,
+            "error": f"OCR processing failed: {ocr_result.get('error', 'Unknown error')}"
+        }), 500
+
+def session_save_failed(jobid, sessionid, error):
+    """提交结果无法写入session（获取锁超时或存储出错）时将任务标记为失败"""
+    logger.error(f"Failed to save submission for session {sessionid}: {error}")
+    update_job(jobid, state="failed", error=str(error))
+    return jsonify({
+        "success": False,
+        "jobid": jobid,
+        "error": f"Failed to save submission: {error}"
+    }), 500
+
+def append_outline(session_data, outline_data):
+    session_data['essay_outlines'].append(outline_data)
+    session_data['metadata']['total_submissions'] += 1
 
 @app.route('/getImitation')
 def get_imitation():
@@ -839,6 +1057,7 @@ def get_imitation():
     return jsonify({"imitations": imitations})
 
 @app.route('/submitImitation', methods=['POST'])
+@expensive(ocr=1)
 def submit_imitation():
     """提交仿写作品"""
     sessionid = request.args.get('sessionid')
@@ -847,61 +1066,101 @@ def submit_imitation():
     if not sessionid or not imitid:
         return jsonify({"error": "Missing sessionid or imitid parameter"}), 400
     
-    if 'image' not in request.files:
-        return jsonify({"error": "No image file provided"}), 400
+    jobid = start_job(kind="imitation", sessionid=sessionid, imitid=imitid, state="ocr")
+    ocr_result, original_filename, error_response = ocr_submission()
+    if error_response:
+        update_job(jobid, state="failed", error="invalid submission")
+        return error_response
     
-    file = request.files['image']
-    if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
-    
-    if file and allowed_file(file.filename):
-        # 生成唯一文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # 使用临时文件处理上传的图片
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-            file.save(temp_file.name)
-            
-            # 使用OCR处理图片
-            ocr_result = process_image_with_ocr(temp_file.name)
-            
-            # 清理临时文件
-            os.unlink(temp_file.name)
+    if ocr_result["success"]:
+        # 记录提交信息到session（直接存储OCR结果）
+        work = {
+            "text_content": ocr_result["text_content"],
+            "submitted_at": datetime.now().isoformat(),
+            "original_filename": original_filename
+        }
         
-        if ocr_result["success"]:
-            # 记录提交信息到session文件（直接存储OCR结果）
-            session_data = load_session_data(sessionid)
-            
-            if imitid not in session_data['imitation_works']:
-                session_data['imitation_works'][imitid] = []
-            
-            session_data['imitation_works'][imitid].append({
-                "text_content": ocr_result["text_content"],
-                "submitted_at": datetime.now().isoformat(),
-                "original_filename": secure_filename(file.filename)
-            })
-            
+        def append_work(session_data):
+            session_data['imitation_works'].setdefault(imitid, []).append(work)
             session_data['metadata']['total_submissions'] += 1
-            save_session_data(sessionid, session_data)
-            
-            logger.info(f"Imitation work OCR processed for session {sessionid}, segment {imitid}")
-            return jsonify({
-                "success": True,
-                "message": "Imitation submitted and processed successfully",
-                "imitid": imitid,
-                "text_content": ocr_result["text_content"][:200] + "..." if len(ocr_result["text_content"]) > 200 else ocr_result["text_content"]
-            })
-        else:
-            logger.error(f"OCR processing failed for session {sessionid}, imitid {imitid}: {ocr_result.get('error', 'Unknown error')}")
-            return jsonify({
-                "success": False,
-                "error": f"OCR processing failed: {ocr_result.get('error', 'Unknown error')}"
-            }), 500
-    
-    return jsonify({"error": "Invalid file type"}), 400
+        
+        try:
+            session_data = update_session_data(sessionid, append_work)
+        except StorageError as e:
+            return session_save_failed(jobid, sessionid, e)
+        update_job(jobid, state="done")
+        search_index.add(*imitation_document(sessionid, session_data.get('question', 'default'), imitid,
+                                             len(session_data['imitation_works'][imitid]) - 1, work))
+        
+        logger.info(f"Imitation work OCR processed for session {sessionid}, segment {imitid}")
+        return jsonify({
+            "success": True,
+            "jobid": jobid,
+            "message": "Imitation submitted and processed successfully",
+            "imitid": imitid,
+            "text_content": ocr_result["text_content"][:200] + "..." if len(ocr_result["text_content"]) > 200 else ocr_result["text_content"]
+        })
+    else:
+        logger.error(f"OCR processing failed for session {sessionid}, imitid {imitid}: {ocr_result.get('error', 'Unknown error')}")
+        update_job(jobid, state="failed", error=ocr_result.get('error', 'Unknown error'))
+        return jsonify({
+            "success": False,
+            "jobid": jobid,
+            "error": f"OCR processing failed: {ocr_result.get('error', 'Unknown error')}"
+        }), 500
+
+
+@app.route('/jobStatus')
+def job_status():
+    """查询提交任务的进度，任务可能在其他节点上执行"""
+    jobid = request.args.get('jobid')
+    if not jobid:
+        return jsonify({"error": "Missing jobid parameter"}), 400
+    job = storage.jobs.get(jobid)
+    if job is None:
+        return jsonify({"error": f"Job {jobid} not found"}), 404
+    return jsonify(job)
+
+
+# 测试接口
+@app.route('/test/ai', methods=['POST'])
+@expensive(llm=2)
+def test_ai():
+    """测试接口：跳过OCR，直接对文本执行提纲生成和评价"""
+    data = request.get_json(silent=True) or {}
+    text_content = data.get('text_content')
+    if not text_content:
+        return jsonify({"success": False, "error": "缺少text_content参数"}), 400
+
+    outline_result = generate_user_outline(text_content)
+    if not outline_result["success"]:
+        return jsonify({"success": False, "error": outline_result["error"]}), 500
+
+    # 未指定session时使用默认题目的审题思路
+    sessionid = request.args.get('sessionid', 'test')
+    judge_result = judge_outline(text_content, outline_result["outline"], sessionid)
+    return jsonify({
+        "success": True,
+        "text_content": text_content,
+        "structured_content": outline_result["outline"],
+        "ai_judgement": judge_result["judgement"] if judge_result["success"] else {},
+        "judgement_success": judge_result["success"]
+    })
 
 
 # 管理接口（可选）
+# 健康检查
+@app.route('/healthz')
+def healthz():
+    """存活检查：进程能够处理请求即返回 200"""
+    return jsonify(startup.liveness())
+
+@app.route('/readyz')
+def readyz():
+    """就绪检查：本地检查通过、预热完成且上游可达时返回 200，否则返回 503"""
+    ready, details = startup.readiness()
+    return jsonify(details), 200 if ready else 503
+
 @app.route('/admin/sessions')
 def admin_sessions():
     """管理接口：查看所有sessions"""
@@ -914,13 +1173,142 @@ def admin_session_detail(sessionid):
     session_data = load_session_data(sessionid)
     return jsonify(session_data)
 
+@app.route('/admin/llm/stats')
+def admin_llm_stats():
+    """管理接口：查看LLM服务商延迟和失败统计"""
+    return jsonify(llm_router.stats())
+
+@app.route('/admin/ratelimit/stats')
+def admin_ratelimit_stats():
+    """管理接口：查看限流和准入控制计数"""
+    return jsonify({
+        "rate_limiter": rate_limiter.stats(),
+        "admission": admission.stats()
+    })
+
+@app.route('/admin/singleflight/stats')
+def admin_singleflight_stats():
+    """管理接口：查看请求合并计数（coalesced_calls 即节省的上游调用次数）"""
+    return jsonify({
+        "ocr": ocr_flight.stats(),
+        "llm": llm_flight.stats()
+    })
+
+@app.route('/admin/scheduler/stats')
+def admin_scheduler_stats():
+    """管理接口：查看各优先级类别的排队深度和等待时间"""
+    return jsonify({
+        "ocr": ocr_scheduler.stats(),
+        "llm": llm_scheduler.stats()
+    })
+
+@app.route('/admin/analytics')
+def admin_analytics():
+    """管理接口：查看所有题目的统计"""
+    return jsonify(analytics.summary())
+
+@app.route('/admin/analytics/<question_id>')
+def admin_question_analytics(question_id):
+    """管理接口：查看指定题目的统计"""
+    aggregate = analytics.get(question_id)
+    if aggregate is None:
+        return jsonify({"error": f"题目 {question_id} 暂无统计数据"}), 404
+    return jsonify(aggregate)
+
+@app.route('/search')
+def search():
+    """全文检索：题库和已提交的审题分析、仿写作品，按 BM25 排序分页返回"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Missing q parameter"}), 400
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        page_size = min(50, max(1, int(request.args.get('page_size', 10))))
+    except ValueError:
+        return jsonify({"error": "Invalid page or page_size"}), 400
+
+    total, results = search_index.search(query, page=page, page_size=page_size,
+                                         kind=request.args.get('kind'),
+                                         question_id=request.args.get('question_id'))
+    return jsonify({
+        "query": query,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "results": [
+            {**doc, "score": score, "snippet": make_snippet(document_text(doc, load_session_data, get_essay_topics), query)}
+            for score, doc in results
+        ]
+    })
+
+@app.route('/admin/search/stats')
+def admin_search_stats():
+    """管理接口：全文检索索引状态"""
+    return jsonify(search_index.stats())
+
+@app.route('/admin/export')
+def admin_export():
+    """管理接口：流式导出 NDJSON（gzip=1 时压缩）"""
+    try:
+        records = iter_records(
+            list_session_ids(), load_session_data,
+            user=request.args.get('user'),
+            question=request.args.get('question'),
+            since=parse_date(request.args.get('since')),
+            until=parse_date(request.args.get('until')),
+            types=tuple(t.strip() for t in request.args.get('types', ','.join(RECORD_TYPES)).split(','))
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date: {str(e)}"}), 400
+
+    filename = f"xessay_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson"
+    if request.args.get('gzip') in ('1', 'true'):
+        body, mimetype, filename = gzip_chunks(to_ndjson(records)), 'application/gzip', filename + '.gz'
+    else:
+        body, mimetype = to_ndjson(records), 'application/x-ndjson'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.route('/admin/import', methods=['POST'])
+def admin_import():
+    """管理接口：导入 NDJSON（可为 gzip），mode=merge|skip|overwrite"""
+    try:
+        stats = import_records(iter_ndjson(request.stream), update_session_data,
+                               session_exists, add_session_to_user, mode=request.args.get('mode', 'merge'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except StorageError as e:
+        logger.error(f"Import aborted: {e}")
+        return jsonify({"success": False, "error": f"Import aborted: {e}"}), 500
+    logger.info(f"Imported records: {stats}")
+    return jsonify({"success": True, **stats})
+
+@app.route('/admin/archive', methods=['POST'])
+def admin_archive():
+    """管理接口：归档超过 days 天未修改的 session，dry_run=1 时只统计"""
+    try:
+        days = int(request.args.get('days', ARCHIVE["after_days"]))
+    except ValueError:
+        return jsonify({"error": "Invalid days"}), 400
+    if storage.name != 'local':
+        # 归档包保存在本地磁盘，只适用于本地存储后端
+        return jsonify({"error": f"Archiving is not supported with the {storage.name} storage backend"}), 400
+    report = session_archive.archive(SESSIONS_FOLDER, days, dry_run=request.args.get('dry_run') in ('1', 'true'),
+                                     lock_session=lock_session_nowait)
+    return jsonify(report)
+
+@app.route('/admin/archive/stats')
+def admin_archive_stats():
+    """管理接口：查看归档包"""
+    return jsonify(session_archive.stats())
+
 @app.route('/admin/reset/<sessionid>', methods=['POST'])
 def admin_reset_session(sessionid):
     """管理接口：重置指定session数据"""
     try:
-        session_file = os.path.join(SESSIONS_FOLDER, f"{sessionid}.json")
-        if os.path.exists(session_file):
-            os.remove(session_file)
+        storage.documents.delete('sessions', sessionid)
+        session_archive.delete(sessionid)
+        search_index.delete_session(sessionid)
         logger.info(f"Session {sessionid} reset successfully")
         return jsonify({"message": f"Session {sessionid} reset successfully"})
     except Exception as e:
@@ -936,24 +1324,21 @@ def get_standard_outlines():
             return jsonify({'error': '缺少session ID参数'}), 400
             
         # 获取会话信息
-        session_file = os.path.join(SESSIONS_FOLDER, f'{sessionid}.json')
-        if not os.path.exists(session_file):
+        if not session_exists(sessionid):
             return jsonify({'error': '会话不存在'}), 404
             
-        with open(session_file, 'r', encoding='utf-8') as f:
-            session_data = json.load(f)
+        session_data = load_session_data(sessionid)
             
         question_id = session_data.get('question')
         if not question_id:
             return jsonify({'error': '会话中没有题目信息'}), 400
             
         # 读取题目文件获取标准提纲
-        question_file = os.path.join('qbank', f'{question_id}.json')
+        question_file = os.path.join(QBANK_FOLDER, f'{question_id}.json')
         if not os.path.exists(question_file):
             return jsonify({'error': '题目文件不存在'}), 404
             
-        with open(question_file, 'r', encoding='utf-8') as f:
-            question_data = json.load(f)
+        question_data = qbank_cache.get(question_file)
             
         outlines = question_data.get('outlines', [])
         return jsonify({
@@ -986,13 +1371,7 @@ def upload_image():
                 ext = '.png'
                 
             filename = f"upload_{timestamp}_{str(uuid.uuid4())[:8]}{ext}"
-            uploads_dir = os.path.join(DATA_FOLDER, 'uploads')
-            
-            if not os.path.exists(uploads_dir):
-                os.makedirs(uploads_dir)
-                
-            file_path = os.path.join(uploads_dir, filename)
-            file.save(file_path)
+            storage.blobs.put(f"uploads/{filename}", file.read())
             
             return jsonify({
                 "success": True,
@@ -1014,6 +1393,29 @@ def not_found(error):
 def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
+# 启动阶段：预加载并校验配置、prompts 和题库，后台预热上游连接（见 README.md「健康检查」）
+READINESS = {**DEFAULT_READINESS, **CONFIG.get("READINESS", {})}
+upstream_warmers = {"ocr": ocr_backend.warm, "storage": storage.probe,
+                    **{f"llm:{p.name}": p.warm for p in llm_router.providers}}
+upstream_probes = {**upstream_warmers, "ocr": ocr_backend.probe}
+startup = StartupMonitor(IMPORT_STARTED, IMPORTS_FINISHED, READINESS)
+startup.run_checks({
+    "config": lambda: validate_config(CONFIG, PADDLE_OCR_API_URL, PADDLE_OCR_TOKEN, LLM_API_KEY),
+    "prompts": lambda: check_prompts(load_prompt_template),
+    "qbank": lambda: check_qbank(QBANK_FOLDER, qbank_cache.get),
+})
+startup.set_probes(upstream_probes)
+startup.finish()
+
+def serve():
+    """
+    启动服务时调用：在后台预热上游连接（本地OCR会启动工作进程并加载模型）。
+    regrade.py 等命令行工具也会 import app，预热不能放在导入时执行。
+    gunicorn 使用 "app:serve()" 作为入口。
+    """
+    startup.start_warmup(upstream_warmers)
+    return app
+
 if __name__ == '__main__':
     # print("="*50)
     # print("Essay Training Backend Server")
@@ -1038,4 +1440,7 @@ if __name__ == '__main__':
     # print("Press Ctrl+C to stop")
     # print("="*50)
     
+    # debug 模式下由 reloader 启动的子进程实际处理请求，只在子进程中预热
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        serve()
     app.run(host='0.0.0.0', port=5005, debug=True)
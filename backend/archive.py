@@ -0,0 +1,370 @@
+"""
+冷 session 归档
+
+将超过 N 天未修改的 session 文件移入按月份划分的压缩包（data/archive/）：
+- sessions-YYYY-MM.pack: 逐条 zlib 压缩的 session JSON 依次追加
+- sessions-YYYY-MM.idx.json: {session_id: [偏移, 长度, 原文件大小, 原修改时间]}
+月份取 session 文件的最后修改时间。load_session_data 找不到 session 文件时从归档包读取；
+归档的 session 再次保存后重新成为普通文件，并优先于归档包中的旧版本。
+
+归档、删除和合并可能由命令行在服务外执行，写入时持有 archive.lock 文件锁；
+读取时检查索引是否变化，读到无法解压的记录时等待写入完成、重新加载索引后重试，仍失败则抛出 ArchiveError。
+归档时在 session 锁内复核、写入归档包并删除原文件，与提交的读-改-写互斥；正被修改的 session 留到下次归档。
+
+用法:
+    python archive.py run --days 90 [--dry-run]
+    python archive.py stats
+    python archive.py compact        # 重写归档包，去掉已删除或已被重新归档的旧记录
+"""
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from contextlib import ExitStack, nullcontext
+
+from file_lock import file_lock
+from storage import LockTimeout
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE = {
+    # 超过该天数未修改的 session 会被归档
+    "after_days": 90,
+    "compression_level": 6,
+}
+
+PACK_PREFIX = 'sessions-'
+PACK_SUFFIX = '.pack'
+INDEX_SUFFIX = '.idx.json'
+# 归档时每批同时持有的 session 锁数量上限
+ARCHIVE_BATCH = 100
+
+
+class ArchiveError(Exception):
+    """归档记录无法读取（损坏或索引与归档包不一致）"""
+
+
+class SessionArchive:
+    """按月份划分的 session 归档包"""
+
+    def __init__(self, folder, compression_level=DEFAULT_ARCHIVE["compression_level"]):
+        self.folder = folder
+        self.compression_level = compression_level
+        self.lock = threading.Lock()
+        # session_id -> (月份, 偏移, 长度)
+        self.index = {}
+        self.loaded_mtimes = {}
+        self.lock_path = os.path.join(folder, 'archive.lock')
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _pack_path(self, month):
+        return os.path.join(self.folder, f"{PACK_PREFIX}{month}{PACK_SUFFIX}")
+
+    def _index_path(self, month):
+        return os.path.join(self.folder, f"{PACK_PREFIX}{month}{INDEX_SUFFIX}")
+
+    def _index_mtimes(self):
+        mtimes = {}
+        for filename in os.listdir(self.folder):
+            if filename.startswith(PACK_PREFIX) and filename.endswith(INDEX_SUFFIX):
+                month = filename[len(PACK_PREFIX):-len(INDEX_SUFFIX)]
+                stat = os.stat(os.path.join(self.folder, filename))
+                # 索引总是整体替换，inode 变化也能识别同一时间戳内的改写
+                mtimes[month] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        return mtimes
+
+    def _read_index(self, month):
+        path = self._index_path(month)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_index(self, month, entries):
+        path = self._index_path(month)
+        if not entries:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(temp_path, path)
+
+    def _load(self):
+        index = {}
+        mtimes = self._index_mtimes()
+        for month in sorted(mtimes):
+            try:
+                for session_id, (offset, length, _, _) in self._read_index(month).items():
+                    index[session_id] = (month, offset, length)
+            except Exception as e:
+                logger.error(f"Error loading archive index {month}: {e}")
+        self.index = index
+        self.loaded_mtimes = mtimes
+
+    def _reload_if_changed(self):
+        # 归档命令可能在服务外运行，索引文件变化后重新加载
+        if self._index_mtimes() != self.loaded_mtimes:
+            self._load()
+
+    # ---- 读取 ----
+
+    def contains(self, session_id):
+        with self.lock:
+            if session_id not in self.index:
+                self._reload_if_changed()
+            return session_id in self.index
+
+    def _read_entry(self, entry):
+        month, offset, length = entry
+        with open(self._pack_path(month), 'rb') as f:
+            f.seek(offset)
+            return json.loads(zlib.decompress(f.read(length)).decode('utf-8'))
+
+    def load(self, session_id):
+        """从归档包读取 session，不存在时返回 None，记录无法读取时抛出 ArchiveError"""
+        with self.lock:
+            # 合并会移动记录的偏移，每次读取前都检查索引是否变化
+            self._reload_if_changed()
+            entry = self.index.get(session_id)
+        if entry is None:
+            return None
+        try:
+            return self._read_entry(entry)
+        except (OSError, zlib.error, ValueError):
+            pass
+        # 可能正好读到合并中途替换的归档包：等待写入结束后重新加载索引再读一次
+        with self.lock, file_lock(self.lock_path):
+            self._load()
+            entry = self.index.get(session_id)
+            if entry is None:
+                return None
+            try:
+                return self._read_entry(entry)
+            except (OSError, zlib.error, ValueError) as e:
+                raise ArchiveError(f"Archived session {session_id} is unreadable: {e}") from e
+
+    def session_ids(self):
+        with self.lock:
+            self._reload_if_changed()
+            return list(self.index)
+
+    # ---- 写入 ----
+
+    def _compress(self, raw):
+        # 去掉缩进后再压缩
+        return zlib.compress(json.dumps(json.loads(raw), ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                             self.compression_level)
+
+    def _compress_files(self, sessions, report):
+        compressed = []
+        for session_id, path, stat in sessions:
+            try:
+                with open(path, 'rb') as f:
+                    compressed.append((session_id, path, stat, self._compress(f.read())))
+            except Exception as e:
+                report["errors"].append({"session_id": session_id, "error": str(e)})
+        return compressed
+
+    def _lock_batch(self, stack, sessions, lock_session, report):
+        """获取一批 session 的锁并复核，返回锁定后仍未被修改的 session"""
+        locked = []
+        for session_id, path, stat in sessions:
+            try:
+                stack.enter_context(lock_session(session_id))
+            except LockTimeout:
+                # 正在被提交修改，留到下次归档
+                report["changed_during_archive"] += 1
+                continue
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if (current.st_mtime_ns, current.st_size) != (stat.st_mtime_ns, stat.st_size):
+                report["changed_during_archive"] += 1
+                continue
+            locked.append((session_id, path, current))
+        return locked
+
+    def _append(self, month, compressed, report):
+        """先追加数据并落盘，再更新索引，最后删除原文件；中途失败时原文件仍然有效"""
+        entries = self._read_index(month)
+        with open(self._pack_path(month), 'ab') as pack:
+            offset = pack.tell()
+            for session_id, _, stat, data in compressed:
+                pack.write(data)
+                entries[session_id] = [offset, len(data), stat.st_size, stat.st_mtime]
+                offset += len(data)
+            pack.flush()
+            os.fsync(pack.fileno())
+
+        # 之前归档在其他月份包中的旧版本不再需要
+        stale = {}
+        for session_id, _, _, _ in compressed:
+            previous = self.index.get(session_id)
+            if previous and previous[0] != month:
+                stale.setdefault(previous[0], []).append(session_id)
+        for stale_month, session_ids in stale.items():
+            stale_entries = self._read_index(stale_month)
+            for session_id in session_ids:
+                stale_entries.pop(session_id, None)
+            self._write_index(stale_month, stale_entries)
+
+        self._write_index(month, entries)
+        for session_id, path, stat, data in compressed:
+            self.index[session_id] = (month, entries[session_id][0], len(data))
+            current = os.stat(path)
+            if (current.st_mtime_ns, current.st_size) != (stat.st_mtime_ns, stat.st_size):
+                # 不经过 session 锁的写入，保留文件（文件优先于归档包）
+                report["changed_during_archive"] += 1
+                continue
+            os.remove(path)
+            report["archived"] += 1
+            report["bytes_before"] += stat.st_size
+            report["bytes_after"] += len(data)
+        report["packs"][month] = report["packs"].get(month, 0) + len(compressed)
+
+    def archive(self, sessions_folder, after_days, dry_run=False, now=None, lock_session=None):
+        """
+        归档超过 after_days 天未修改的 session 文件，返回归档报告。
+        lock_session(session_id) 返回该 session 的锁（上下文管理器），获取不到时应立即抛出 LockTimeout：
+        调用方可能持有 session 锁等待读取归档，归档过程中不能等待 session 锁。
+        """
+        lock_session = lock_session or (lambda session_id: nullcontext())
+        cutoff = (now or time.time()) - after_days * 86400
+        candidates = {}
+        with os.scandir(sessions_folder) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    if stat.st_mtime < cutoff:
+                        month = time.strftime('%Y-%m', time.localtime(stat.st_mtime))
+                        candidates.setdefault(month, []).append((entry.name[:-5], entry.path, stat))
+
+        report = {"dry_run": dry_run, "after_days": after_days, "archived": 0, "changed_during_archive": 0,
+                  "errors": [], "bytes_before": 0, "bytes_after": 0, "packs": {}}
+
+        with self.lock, file_lock(self.lock_path):
+            self._reload_if_changed()
+            for month, sessions in sorted(candidates.items()):
+                if dry_run:
+                    compressed = self._compress_files(sessions, report)
+                    if compressed:
+                        report["archived"] += len(compressed)
+                        report["bytes_before"] += sum(stat.st_size for _, _, stat, _ in compressed)
+                        report["bytes_after"] += sum(len(data) for _, _, _, data in compressed)
+                        report["packs"][month] = len(compressed)
+                    continue
+
+                for start in range(0, len(sessions), ARCHIVE_BATCH):
+                    with ExitStack() as stack:
+                        locked = self._lock_batch(stack, sessions[start:start + ARCHIVE_BATCH], lock_session, report)
+                        compressed = self._compress_files(locked, report)
+                        if compressed:
+                            self._append(month, compressed, report)
+            self.loaded_mtimes = self._index_mtimes()
+
+        report["reclaimed_bytes"] = report["bytes_before"] - report["bytes_after"]
+        logger.info(f"Archived {report['archived']} sessions, reclaimed {report['reclaimed_bytes']} bytes"
+                    f"{' (dry run)' if dry_run else ''}")
+        return report
+
+    def delete(self, session_id):
+        """从归档中删除 session（数据在 compact 时回收）"""
+        with self.lock, file_lock(self.lock_path):
+            self._reload_if_changed()
+            entry = self.index.pop(session_id, None)
+            if entry is None:
+                return False
+            entries = self._read_index(entry[0])
+            entries.pop(session_id, None)
+            self._write_index(entry[0], entries)
+            self.loaded_mtimes = self._index_mtimes()
+            return True
+
+    def compact(self):
+        """重写归档包，只保留索引中的记录"""
+        reclaimed = 0
+        with self.lock, file_lock(self.lock_path):
+            self._reload_if_changed()
+            for filename in sorted(os.listdir(self.folder)):
+                if not (filename.startswith(PACK_PREFIX) and filename.endswith(PACK_SUFFIX)):
+                    continue
+                month = filename[len(PACK_PREFIX):-len(PACK_SUFFIX)]
+                pack_path = self._pack_path(month)
+                entries = self._read_index(month)
+                size_before = os.path.getsize(pack_path)
+                if not entries:
+                    os.remove(pack_path)
+                    reclaimed += size_before
+                    continue
+
+                temp_path = f"{pack_path}.{os.getpid()}.tmp"
+                with open(pack_path, 'rb') as source, open(temp_path, 'wb') as target:
+                    for session_id, entry in sorted(entries.items(), key=lambda item: item[1][0]):
+                        source.seek(entry[0])
+                        data = source.read(entry[1])
+                        entry[0] = target.tell()
+                        target.write(data)
+                    target.flush()
+                    os.fsync(target.fileno())
+                os.replace(temp_path, pack_path)
+                self._write_index(month, entries)
+                reclaimed += size_before - os.path.getsize(pack_path)
+            self._load()
+        logger.info(f"Archive compacted, reclaimed {reclaimed} bytes")
+        return {"reclaimed_bytes": reclaimed}
+
+    def stats(self):
+        with self.lock:
+            self._reload_if_changed()
+            packs = {}
+            for month in sorted(self.loaded_mtimes):
+                entries = self._read_index(month)
+                pack_path = self._pack_path(month)
+                packs[month] = {
+                    "sessions": len(entries),
+                    "pack_bytes": os.path.getsize(pack_path) if os.path.exists(pack_path) else 0,
+                    "live_bytes": sum(entry[1] for entry in entries.values()),
+                    "original_bytes": sum(entry[2] for entry in entries.values())
+                }
+        return {
+            "sessions": sum(p["sessions"] for p in packs.values()),
+            "pack_bytes": sum(p["pack_bytes"] for p in packs.values()),
+            "original_bytes": sum(p["original_bytes"] for p in packs.values()),
+            "packs": packs
+        }
+
+
+def main():
+    import argparse
+
+    from app import ARCHIVE, SESSIONS_FOLDER, lock_session_nowait, session_archive, storage
+
+    parser = argparse.ArgumentParser(description="冷 session 归档")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help="归档长期未修改的 session")
+    run_parser.add_argument('--days', type=int, default=ARCHIVE["after_days"])
+    run_parser.add_argument('--dry-run', action='store_true', help="只统计，不移动文件")
+    subparsers.add_parser('stats', help="查看归档包")
+    subparsers.add_parser('compact', help="回收归档包中的无效记录")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if storage.name != 'local':
+            parser.error(f"归档只适用于本地存储后端（当前为 {storage.name}）")
+        result = session_archive.archive(SESSIONS_FOLDER, args.days, dry_run=args.dry_run,
+                                         lock_session=lock_session_nowait)
+    elif args.command == 'stats':
+        result = session_archive.stats()
+    else:
+        result = session_archive.compact()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""压测工具：OCR/LLM 桩服务与负载驱动，见 bench/README.md"""
@@ -0,0 +1,311 @@
+"""
+后端压测驱动
+
+模拟学生的完整流程 createSession → getEssayTopic → submitEssayOutline → getStandardOutlines，
+统计各接口的吞吐量、p50/p95/p99 延迟和后端进程的资源占用，结果写入 JSON 便于长期对比。
+
+用法:
+    # 自动启动桩服务和一个后端实例（推荐，结果可复现）
+    python -m bench.load --spawn --users 8 --iterations 5 --ocr-latency 1 --llm-latency 3
+
+    # 压测已经运行的后端（需自行将其 config.json 指向桩服务），--pid 用于采集资源占用
+    python -m bench.load --target http://127.0.0.1:5005 --users 8 --pid 12345
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import requests
+
+from bench.stubs import start_llm_stub, start_ocr_stub
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FOLDER = os.path.join(BACKEND_DIR, 'data', 'bench')
+
+
+def make_png(width=64, height=64, seed=None):
+    """
+    生成一张白色PNG，作为提交的手写图片。
+    指定 seed 时第一行像素由 seed 决定，不同 seed 的图片内容不同，不会被后端的请求合并去重。
+    """
+    rows = [b'\xff' * (width * 3) for _ in range(height)]
+    if seed is not None:
+        pixels = b''
+        while len(pixels) < width * 3:
+            pixels += hashlib.sha256(f"{seed}:{len(pixels)}".encode('utf-8')).digest()
+        rows[0] = pixels[:width * 3]
+    raw = b''.join(b'\x00' + row for row in rows)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw))
+            + chunk(b'IEND', b''))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """线程安全地记录每个接口的延迟和状态码"""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, latency, status):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((latency, status))
+
+    def summary(self, duration):
+        report = {}
+        for endpoint, samples in self.samples.items():
+            latencies = sorted(latency for latency, _ in samples)
+            statuses = {}
+            for _, status in samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            errors = sum(1 for _, status in samples if status is None or status >= 400)
+            report[endpoint] = {
+                "requests": len(samples),
+                "errors": errors,
+                "statuses": statuses,
+                "throughput": round(len(samples) / duration, 3) if duration else 0,
+                "p50": round(percentile(latencies, 50), 4),
+                "p95": round(percentile(latencies, 95), 4),
+                "p99": round(percentile(latencies, 99), 4),
+                "max": round(latencies[-1], 4) if latencies else 0
+            }
+        return report
+
+
+class ProcessSampler:
+    """通过 /proc 采集进程的 CPU 时间和内存（仅 Linux）"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+    def cpu_seconds(self):
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            # utime 和 stime 分别是第14、15个字段
+            return (int(fields[11]) + int(fields[12])) / self.clock_ticks
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def memory(self):
+        result = {}
+        try:
+            with open(f'/proc/{self.pid}/status') as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    if key in ('VmRSS', 'VmHWM', 'Threads'):
+                        result[key] = int(value.split()[0])
+        except OSError:
+            pass
+        return result
+
+
+def user_flow(base_url, user_index, iterations, question_id, image, recorder):
+    """
+    单个虚拟用户循环执行完整流程。
+    image 为 None 时每次提交一张不同的图片，模拟真实流量（相同图片的并发请求会被后端合并，结果偏乐观）。
+    """
+    http = requests.Session()
+
+    def call(endpoint, method, url, **kwargs):
+        started = time.monotonic()
+        try:
+            response = http.request(method, base_url + url, timeout=600, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, None
+        recorder.record(endpoint, time.monotonic() - started, status)
+        return response
+
+    for iteration in range(iterations):
+        username = f"bench_user_{user_index}"
+        response = call('createSession', 'POST', '/createSession', json={
+            "username": username,
+            "question_id": question_id,
+            "session_name": f"bench_{iteration}"
+        })
+        if response is None or response.status_code != 200:
+            continue
+        session_id = response.json()["session_id"]
+        call('getEssayTopic', 'GET', f'/getEssayTopic?sessionid={session_id}')
+        call('submitEssayOutline', 'POST', f'/submitEssayOutline?sessionid={session_id}',
+             files={"image": ("outline.png", image or make_png(seed=f"{user_index}:{iteration}"), "image/png")})
+        call('getStandardOutlines', 'GET', f'/getStandardOutlines?sessionid={session_id}')
+
+
+def spawn_backend(port, ocr_url, llm_url):
+    """在临时目录中启动一个指向桩服务的后端实例，返回 (进程, 工作目录)"""
+    workdir = tempfile.mkdtemp(prefix='xessay_bench_')
+    for name in ('prompts', 'qbank'):
+        os.symlink(os.path.join(BACKEND_DIR, name), os.path.join(workdir, name))
+    config = {
+        "PADDLE_OCR_API_URL": ocr_url,
+        "PADDLE_OCR_TOKEN": "bench",
+        "LLM_API_URL": llm_url,
+        "LLM_API_KEY": "bench",
+        # 压测时放开限流，测量的是后端本身的处理能力
+        "RATE_LIMITS": {
+            "ocr": {"rate": 1000, "burst": 1000},
+            "llm": {"rate": 1000, "burst": 1000},
+            "max_concurrent": 1000,
+            "max_queue": 1000
+        }
+    }
+    with open(os.path.join(workdir, 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+
+    code = (f"import sys; sys.path.insert(0, {BACKEND_DIR!r}); import app; "
+            f"app.serve().run(host='127.0.0.1', port={port}, threaded=True)")
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=workdir,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + '/', timeout=1)
+            return process, workdir
+        except requests.RequestException:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.terminate()
+    shutil.rmtree(workdir, ignore_errors=True)
+    raise RuntimeError("Backend failed to start")
+
+
+def run(args):
+    process = workdir = None
+    target = args.target.rstrip('/')
+    pid = args.pid
+    if args.spawn:
+        ocr = start_ocr_stub(latency=args.ocr_latency, jitter=args.jitter, error_rate=args.error_rate)
+        llm = start_llm_stub(latency=args.llm_latency, jitter=args.jitter, error_rate=args.error_rate)
+        process, workdir = spawn_backend(
+            args.port,
+            f"http://127.0.0.1:{ocr.server_address[1]}/layout-parsing",
+            f"http://127.0.0.1:{llm.server_address[1]}/v1/chat/completions"
+        )
+        target = f"http://127.0.0.1:{args.port}"
+        pid = process.pid
+
+    sampler = ProcessSampler(pid) if pid else None
+    cpu_before = sampler.cpu_seconds() if sampler else None
+    # 默认每次提交不同的图片；--same-image 用于单独衡量请求合并的效果
+    image = make_png() if args.same_image else None
+    recorder = Recorder()
+
+    started = time.monotonic()
+    try:
+        threads = [
+            threading.Thread(target=user_flow,
+                             args=(target, i, args.iterations, args.question, image, recorder))
+            for i in range(args.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - started
+
+        resources = {}
+        if sampler:
+            cpu_after = sampler.cpu_seconds()
+            memory = sampler.memory()
+            if cpu_before is not None and cpu_after is not None:
+                resources["cpu_seconds"] = round(cpu_after - cpu_before, 3)
+                resources["cpu_percent"] = round((cpu_after - cpu_before) / duration * 100, 1)
+            resources["rss_mb"] = round(memory.get('VmRSS', 0) / 1024, 1)
+            resources["peak_rss_mb"] = round(memory.get('VmHWM', 0) / 1024, 1)
+            resources["threads"] = memory.get('Threads', 0)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "started_at": datetime.now().isoformat(),
+        "target": target,
+        "config": {
+            "users": args.users,
+            "iterations": args.iterations,
+            "question": args.question,
+            "spawn": args.spawn,
+            "ocr_latency": args.ocr_latency,
+            "llm_latency": args.llm_latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "same_image": args.same_image
+        },
+        "duration": round(duration, 3),
+        "endpoints": recorder.summary(duration),
+        "resources": resources
+    }
+    return report
+
+
+def print_report(report):
+    print(f"Duration: {report['duration']}s  target: {report['target']}")
+    print(f"{'endpoint':<22}{'reqs':>6}{'errs':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:<22}{stats['requests']:>6}{stats['errors']:>6}{stats['throughput']:>9}"
+              f"{stats['p50']:>9}{stats['p95']:>9}{stats['p99']:>9}")
+    if report["resources"]:
+        print("Resources:", json.dumps(report["resources"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后端压测")
+    parser.add_argument('--target', default='http://127.0.0.1:5005', help="已运行的后端地址")
+    parser.add_argument('--pid', type=int, help="后端进程PID，用于采集资源占用")
+    parser.add_argument('--spawn', action='store_true', help="自动启动桩服务和后端实例")
+    parser.add_argument('--port', type=int, default=5099, help="--spawn 时后端监听的端口")
+    parser.add_argument('--users', type=int, default=4, help="并发虚拟用户数")
+    parser.add_argument('--iterations', type=int, default=3, help="每个用户执行流程的次数")
+    parser.add_argument('--question', default='question_01')
+    parser.add_argument('--ocr-latency', type=float, default=1.0)
+    parser.add_argument('--llm-latency', type=float, default=3.0)
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--same-image', action='store_true',
+                        help="所有用户提交同一张图片（会触发请求合并，只用于衡量合并效果）")
+    parser.add_argument('--output', help="结果JSON路径，默认 data/bench/<时间戳>.json")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+
+    output = args.output or os.path.join(RESULTS_FOLDER, datetime.now().strftime('%Y%m%d_%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+对比远程与本地OCR后端的延迟和吞吐量
+
+用法（在 backend 目录下，读取 config.json 中的远程接口和 LOCAL_OCR 配置）:
+    python -m bench.ocr_compare samples/*.png --backends remote,local --repeat 3 --concurrency 2
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.load import percentile
+from ocr_backends import DEFAULT_LOCAL_OCR, LocalPaddleOCRBackend, RemotePaddleOCRBackend
+
+
+def build_backend(name, config):
+    if name == "remote":
+        return RemotePaddleOCRBackend(config.get("PADDLE_OCR_API_URL", ""), config.get("PADDLE_OCR_TOKEN", ""))
+    if name == "local":
+        return LocalPaddleOCRBackend(**{**DEFAULT_LOCAL_OCR, **config.get("LOCAL_OCR", {})})
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def measure(backend, images, repeat, concurrency):
+    def timed(path):
+        started = time.monotonic()
+        result = backend.process(path)
+        return time.monotonic() - started, result["success"], len(result.get("text_content", ""))
+
+    jobs = [path for _ in range(repeat) for path in images]
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, jobs))
+    duration = time.monotonic() - started
+
+    latencies = sorted(latency for latency, _, _ in results)
+    return {
+        "requests": len(results),
+        "succeeded": sum(1 for _, ok, _ in results if ok),
+        "throughput": round(len(results) / duration, 3),
+        "p50": round(percentile(latencies, 50), 3),
+        "p95": round(percentile(latencies, 95), 3),
+        "max": round(latencies[-1], 3) if latencies else 0,
+        "avg_chars": round(sum(chars for _, _, chars in results) / max(1, len(results)), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比OCR后端性能")
+    parser.add_argument('images', nargs='+', help="测试图片路径")
+    parser.add_argument('--backends', default='remote,local')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--config', default='config.json')
+    args = parser.parse_args()
+
+    config = {}
+    if os.path.exists(args.config):
+        with open(args.config) as f:
+            config = json.load(f)
+
+    report = {}
+    for name in args.backends.split(','):
+        backend = build_backend(name.strip(), config)
+        # 本地后端先预热一次，排除模型加载时间
+        if isinstance(backend, LocalPaddleOCRBackend):
+            backend.process(args.images[0])
+        report[name] = measure(backend, args.images, args.repeat, args.concurrency)
+        if isinstance(backend, LocalPaddleOCRBackend):
+            backend.shutdown()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
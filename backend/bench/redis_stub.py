@@ -0,0 +1,224 @@
+"""
+Redis 协议的本地替身
+
+实现后端用到的 RESP 命令子集（字符串、集合、过期、WATCH/MULTI/EXEC），数据只保存在内存中，
+用于在没有 Redis 的环境下测试 STORAGE.backend = "redis" 和多节点部署。
+
+用法:
+    python -m bench.redis_stub --port 6390
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class RedisStubState:
+    """所有连接共享的数据，每个键带版本号以支持 WATCH"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expires = {}
+        self.versions = {}
+
+    def _expire(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and time.time() >= deadline:
+            self._delete(key)
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _delete(self, key):
+        existed = self.data.pop(key, None) is not None
+        self.expires.pop(key, None)
+        self._touch(key)
+        return existed
+
+    def version(self, key):
+        self._expire(key)
+        return self.versions.get(key, 0)
+
+    def execute(self, args):
+        """在持有 self.lock 时调用"""
+        command = args[0].upper()
+        handler = getattr(self, f"cmd_{command.decode().lower()}", None)
+        if handler is None:
+            return RuntimeError(f"ERR unknown command '{command.decode()}'")
+        for key in args[1:2]:
+            self._expire(key)
+        return handler(*args[1:])
+
+    def cmd_ping(self, *args):
+        return args[0] if args else 'PONG'
+
+    def cmd_auth(self, *args):
+        return 'OK'
+
+    def cmd_select(self, db):
+        return 'OK'
+
+    def cmd_flushdb(self):
+        for key in list(self.data):
+            self._delete(key)
+        return 'OK'
+
+    def cmd_dbsize(self):
+        return len(self.data)
+
+    def cmd_get(self, key):
+        value = self.data.get(key)
+        if isinstance(value, set):
+            return RuntimeError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def cmd_set(self, key, value, *options):
+        options = [o.upper() for o in options]
+        if b'NX' in options and key in self.data:
+            return None
+        if b'XX' in options and key not in self.data:
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        for unit, scale in ((b'EX', 1.0), (b'PX', 0.001)):
+            if unit in options:
+                self.expires[key] = time.time() + int(options[options.index(unit) + 1]) * scale
+        self._touch(key)
+        return 'OK'
+
+    def cmd_del(self, *keys):
+        count = 0
+        for key in keys:
+            self._expire(key)
+            count += self._delete(key) if key in self.data else 0
+        return count
+
+    def cmd_exists(self, *keys):
+        for key in keys:
+            self._expire(key)
+        return sum(1 for key in keys if key in self.data)
+
+    def cmd_sadd(self, key, *members):
+        members_set = self.data.setdefault(key, set())
+        added = len(set(members) - members_set)
+        members_set.update(members)
+        self._touch(key)
+        return added
+
+    def cmd_srem(self, key, *members):
+        members_set = self.data.get(key, set())
+        removed = len(set(members) & members_set)
+        members_set.difference_update(members)
+        if not members_set:
+            self.data.pop(key, None)
+        self._touch(key)
+        return removed
+
+    def cmd_smembers(self, key):
+        return sorted(self.data.get(key, set()))
+
+
+def _encode(value):
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, RuntimeError):
+        return b'-' + str(value).encode() + b'\r\n'
+    if isinstance(value, str):
+        return b'+' + value.encode() + b'\r\n'
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    if isinstance(value, list):
+        return b'*%d\r\n' % len(value) + b''.join(_encode(v) for v in value)
+    raise TypeError(value)
+
+
+def make_handler(state):
+    class RedisStubHandler(socketserver.StreamRequestHandler):
+        def read_command(self):
+            line = self.rfile.readline()
+            if not line:
+                return None
+            if not line.startswith(b'*'):
+                return line.split()
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            return args
+
+        def handle(self):
+            watched = {}
+            queued = None
+            while True:
+                args = self.read_command()
+                if args is None:
+                    return
+                if not args:
+                    continue
+                command = args[0].upper()
+                with state.lock:
+                    if command == b'WATCH':
+                        watched.update((key, state.version(key)) for key in args[1:])
+                        reply = 'OK'
+                    elif command == b'UNWATCH':
+                        watched.clear()
+                        reply = 'OK'
+                    elif command == b'MULTI':
+                        queued = []
+                        reply = 'OK'
+                    elif command == b'DISCARD':
+                        queued = None
+                        watched.clear()
+                        reply = 'OK'
+                    elif command == b'EXEC':
+                        if queued is None:
+                            reply = RuntimeError("ERR EXEC without MULTI")
+                        elif any(state.version(key) != version for key, version in watched.items()):
+                            reply = None
+                        else:
+                            reply = [state.execute(queued_args) for queued_args in queued]
+                        queued = None
+                        watched.clear()
+                        if reply is None:
+                            self.wfile.write(b'*-1\r\n')
+                            continue
+                    elif queued is not None:
+                        queued.append(args)
+                        reply = 'QUEUED'
+                    else:
+                        reply = state.execute(args)
+                self.wfile.write(_encode(reply))
+
+    return RedisStubHandler
+
+
+class RedisStubServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_redis_stub(port=0, host='127.0.0.1'):
+    """在后台线程中启动 Redis 替身，返回 server 对象（server.server_address[1] 为实际端口）"""
+    server = RedisStubServer((host, port), make_handler(RedisStubState()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动 Redis 协议替身")
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    server = start_redis_stub(args.port)
+    print(f"Redis stub: redis://127.0.0.1:{server.server_address[1]}/0")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
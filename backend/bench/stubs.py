@@ -0,0 +1,156 @@
+"""
+模拟 PaddleOCR layout-parsing 接口和 OpenAI chat/completions 接口的本地桩服务
+
+延迟和错误率可配置，用于在不依赖外部服务的情况下压测后端。
+
+用法:
+    python -m bench.stubs --ocr-port 9001 --llm-port 9002 \
+        --ocr-latency 1.5 --llm-latency 4 --jitter 0.3 --error-rate 0.02
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_OCR_TEXT = """标题：腹有诗书气自华
+中心论点：新时代青年应深学笃行，涵养书卷气。
+一、书卷气是从容笃定——苏轼身处逆境仍吟“一蓑烟雨任平生”
+二、书卷气是家国情怀——“家事国事天下事，事事关心”
+三、书卷气是和而不同——在交流中坚守自我
+结尾：立志深学笃行，传承中华文化。"""
+
+STUB_OUTLINE = {
+    "title": "腹有诗书气自华",
+    "subject": "新时代青年应深学笃行，涵养书卷气",
+    "parts": [
+        {
+            "part_title": "从容笃定",
+            "content": "书卷气是身处逆境时的从容",
+            "examples": ["苏轼黄州"],
+            "quotes": ["一蓑烟雨任平生"],
+            "example_content": "【空】"
+        },
+        {
+            "part_title": "家国情怀",
+            "content": "书卷气是忧国忧民的担当",
+            "examples": [],
+            "quotes": ["家事国事天下事，事事关心"],
+            "example_content": "【空】"
+        }
+    ]
+}
+
+
+class LatencyProfile:
+    """延迟与错误配置：基础延迟 * (1 ± jitter)，按 error_rate 返回 500"""
+
+    def __init__(self, latency, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def sample(self):
+        """返回 (本次延迟, 是否出错)"""
+        delay = max(0.0, self.latency * (1 + random.uniform(-self.jitter, self.jitter)))
+        failed = random.random() < self.error_rate
+        with self.lock:
+            self.requests += 1
+            if failed:
+                self.errors += 1
+        return delay, failed
+
+
+def make_handler(profile, build_body):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request_body = self.rfile.read(length)
+            delay, failed = profile.sample()
+            time.sleep(delay)
+            if failed:
+                self._send(500, {"error": "stub failure"})
+            else:
+                self._send(200, build_body(request_body))
+
+        def do_GET(self):
+            # 健康检查
+            self._send(200, {"status": "ok", "requests": profile.requests, "errors": profile.errors})
+
+        def _send(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return StubHandler
+
+
+def request_tag(request_body):
+    """
+    由请求内容生成的短标记，附加在返回内容中：不同的输入得到不同的输出，
+    后续阶段的 LLM 请求也各不相同，压测时不会因为桩服务返回固定内容而被后端合并。
+    """
+    return hashlib.sha256(request_body).hexdigest()[:8]
+
+
+def ocr_body(request_body=b''):
+    text = f"{STUB_OCR_TEXT}\n（{request_tag(request_body)}）"
+    return {"result": {"layoutParsingResults": [{"markdown": {"text": text}}]}}
+
+
+def llm_body(request_body=b''):
+    outline = dict(STUB_OUTLINE, subject=f"{STUB_OUTLINE['subject']}（{request_tag(request_body)}）")
+    content = "```json\n" + json.dumps(outline, ensure_ascii=False) + "\n```"
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+def start_stub(port, profile, build_body, host='127.0.0.1'):
+    """在后台线程中启动桩服务，返回 server 对象（server.server_address[1] 为实际端口）"""
+    server = ThreadingHTTPServer((host, port), make_handler(profile, build_body))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_ocr_stub(port=0, latency=1.0, jitter=0.0, error_rate=0.0):
+    return start_stub(port, LatencyProfile(latency, jitter, error_rate), ocr_body)
+
+
+def start_llm_stub(port=0, latency=3.0, jitter=0.0, error_rate=0.0):
+    return start_stub(port, LatencyProfile(latency, jitter, error_rate), llm_body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动OCR/LLM桩服务")
+    parser.add_argument('--ocr-port', type=int, default=9001)
+    parser.add_argument('--llm-port', type=int, default=9002)
+    parser.add_argument('--ocr-latency', type=float, default=1.0, help="OCR基础延迟（秒）")
+    parser.add_argument('--llm-latency', type=float, default=3.0, help="LLM基础延迟（秒）")
+    parser.add_argument('--jitter', type=float, default=0.2, help="延迟抖动比例，0.2表示±20%%")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回500的概率")
+    args = parser.parse_args()
+
+    ocr = start_ocr_stub(args.ocr_port, args.ocr_latency, args.jitter, args.error_rate)
+    llm = start_llm_stub(args.llm_port, args.llm_latency, args.jitter, args.error_rate)
+    print(f"OCR stub: http://127.0.0.1:{ocr.server_address[1]}/layout-parsing")
+    print(f"LLM stub: http://127.0.0.1:{llm.server_address[1]}/v1/chat/completions")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
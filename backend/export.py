@@ -0,0 +1,267 @@
+"""
+批量导出/导入
+
+以 NDJSON（可选 gzip）流式导出 session、审题分析和仿写作品，每行一条记录：
+    {"type": "session", "session_id": ..., ...session 元数据}
+    {"type": "outline", "session_id": ..., "index": 0, ...essay_outlines 中的一条}
+    {"type": "imitation", "session_id": ..., "imitid": "1", "index": 0, ...imitation_works 中的一条}
+同一 session 的记录连续输出，整个过程由生成器串联，内存占用与数据总量无关。
+
+用法:
+    python export.py export -o export.ndjson.gz --question question_01 --since 2025-01-01
+    python export.py import export.ndjson.gz --mode merge
+"""
+import gzip
+import io
+import json
+import zlib
+from datetime import datetime
+
+RECORD_TYPES = ('session', 'outline', 'imitation')
+IMPORT_MODES = ('merge', 'skip', 'overwrite')
+
+
+def parse_date(value):
+    """
+    解析 ISO 8601 时间，统一为不带时区的服务器本地时间（与记录中 datetime.now().isoformat() 的格式一致）。
+    带时区（含 Z 后缀）的时间先换算到本地时间；非字符串抛出 TypeError。
+    """
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise TypeError(f"Expected an ISO 8601 string, got {type(value).__name__}")
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def in_range(timestamp, since, until):
+    if not since and not until:
+        return True
+    try:
+        moment = parse_date(timestamp)
+    except (TypeError, ValueError):
+        return False
+    if moment is None:
+        return False
+    return (not since or moment >= since) and (not until or moment < until)
+
+
+def session_records(session_data, types, since=None, until=None):
+    """将一个 session 展开为导出记录"""
+    session_id = session_data.get('session_id')
+    items = []
+    if 'outline' in types:
+        for index, outline in enumerate(session_data.get('essay_outlines', [])):
+            if in_range(outline.get('submitted_at'), since, until):
+                items.append({"type": "outline", "session_id": session_id, "index": index, **outline})
+    if 'imitation' in types:
+        for imitid, works in session_data.get('imitation_works', {}).items():
+            for index, work in enumerate(works):
+                if in_range(work.get('submitted_at'), since, until):
+                    items.append({"type": "imitation", "session_id": session_id, "imitid": imitid, "index": index, **work})
+
+    if 'session' in types and (items or in_range(session_data.get('created_at'), since, until)):
+        meta = {k: v for k, v in session_data.items() if k not in ('essay_outlines', 'imitation_works')}
+        yield {"type": "session", **meta}
+    yield from items
+
+
+def iter_records(session_ids, load_session_data, user=None, question=None, since=None, until=None, types=RECORD_TYPES):
+    """按条件流式产出所有导出记录"""
+    for session_id in session_ids:
+        session_data = load_session_data(session_id)
+        session_data.setdefault('session_id', session_id)
+        if user and user not in (session_data.get('username'), session_data.get('user_name')):
+            continue
+        if question and session_data.get('question') != question:
+            continue
+        yield from session_records(session_data, types, since, until)
+
+
+def to_ndjson(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def gzip_chunks(lines, chunk_size=64 * 1024):
+    """将文本行流式压缩为 gzip 字节块"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            compressed = compressor.compress(b''.join(buffer))
+            buffer, size = [], 0
+            if compressed:
+                yield compressed
+    yield compressor.compress(b''.join(buffer)) + compressor.flush()
+
+
+def iter_ndjson(stream):
+    """从二进制流中逐行解析 NDJSON，自动识别 gzip"""
+    reader = io.BufferedReader(stream) if not hasattr(stream, 'peek') else stream
+    if reader.peek(2)[:2] == b'\x1f\x8b':
+        reader = gzip.GzipFile(fileobj=reader)
+    for line_number, line in enumerate(io.TextIOWrapper(reader, encoding='utf-8'), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {line_number}: {e}")
+
+
+def _item_key(item):
+    return item.get('submitted_at'), item.get('text_content')
+
+
+def _merge_items(existing, incoming):
+    known = {_item_key(item) for item in existing}
+    added = 0
+    for item in incoming:
+        if _item_key(item) not in known:
+            existing.append(item)
+            known.add(_item_key(item))
+            added += 1
+    return added
+
+
+def import_records(records, update_session_data, session_exists, add_session_to_user, mode='merge'):
+    """
+    导入记录。同一 session 的记录连续出现时逐个 session 写入，内存占用只与单个 session 相关。
+    update_session_data(session_id, mutate) 在session锁内读取、修改并保存，与在线提交互不覆盖；出错时抛出异常，不会写入。
+    mode: merge 合并到已有 session（按 submitted_at+text_content 去重）；skip 跳过已有 session；overwrite 覆盖已有 session
+    同一 session 的记录不连续时，后出现的部分总是合并到本次导入已写入的 session 中，不会再次覆盖或跳过。
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode: {mode}")
+    stats = {"sessions": 0, "skipped_sessions": 0, "outlines": 0, "imitations": 0}
+    current = {"session_id": None, "meta": None, "outlines": [], "imitations": {}}
+    # 本次导入已写入 / 已跳过的 session
+    written = set()
+    skipped = set()
+
+    def flush():
+        session_id = current["session_id"]
+        if session_id is None or session_id in skipped:
+            return
+        exists = session_exists(session_id)
+        if exists and mode == 'skip' and session_id not in written:
+            stats["skipped_sessions"] += 1
+            skipped.add(session_id)
+            return
+        merge = session_id in written or (exists and mode == 'merge')
+        added = {"outlines": 0, "imitations": 0}
+
+        def mutate(session_data):
+            if not merge:
+                # 新建或覆盖：优先使用导出的 session 元数据
+                base = dict(current["meta"]) if current["meta"] else dict(session_data)
+                session_data.clear()
+                session_data.update(base)
+                session_data['essay_outlines'] = []
+                session_data['imitation_works'] = {}
+            session_data.setdefault('session_id', session_id)
+            added["outlines"] = _merge_items(session_data.setdefault('essay_outlines', []), current["outlines"])
+            added["imitations"] = 0
+            for imitid, works in current["imitations"].items():
+                added["imitations"] += _merge_items(session_data.setdefault('imitation_works', {}).setdefault(imitid, []), works)
+            session_data.setdefault('metadata', {})['total_submissions'] = (
+                len(session_data['essay_outlines']) + sum(len(w) for w in session_data['imitation_works'].values())
+            )
+
+        session_data = update_session_data(session_id, mutate)
+        stats["outlines"] += added["outlines"]
+        stats["imitations"] += added["imitations"]
+        username = session_data.get('username') or session_data.get('user_name')
+        if not exists and username:
+            add_session_to_user(username, session_id, session_data.get('session_name', session_id), session_data.get('question', ''))
+        if session_id not in written:
+            written.add(session_id)
+            stats["sessions"] += 1
+
+    for record in records:
+        record = dict(record)
+        record_type = record.pop('type', None)
+        session_id = record.get('session_id')
+        if record_type not in RECORD_TYPES or not session_id:
+            raise ValueError(f"Invalid record: {record_type} / {session_id}")
+        if session_id != current["session_id"]:
+            flush()
+            current = {"session_id": session_id, "meta": None, "outlines": [], "imitations": {}}
+
+        if record_type == 'session':
+            current["meta"] = record
+        elif record_type == 'outline':
+            record.pop('session_id')
+            record.pop('index', None)
+            current["outlines"].append(record)
+        else:
+            record.pop('session_id')
+            record.pop('index', None)
+            imitid = str(record.pop('imitid', ''))
+            current["imitations"].setdefault(imitid, []).append(record)
+    flush()
+    return stats
+
+
+def main():
+    import argparse
+    import sys
+
+    from app import (add_session_to_user, list_session_ids, load_session_data,
+                     session_exists, update_session_data)
+
+    parser = argparse.ArgumentParser(description="批量导出/导入 session 数据")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="导出为 NDJSON")
+    export_parser.add_argument('-o', '--output', help="输出文件，以 .gz 结尾时 gzip 压缩；默认输出到标准输出")
+    export_parser.add_argument('--user')
+    export_parser.add_argument('--question')
+    export_parser.add_argument('--since', help="起始时间（含），如 2025-01-01")
+    export_parser.add_argument('--until', help="结束时间（不含）")
+    export_parser.add_argument('--types', default=','.join(RECORD_TYPES), help="记录类型，逗号分隔")
+
+    import_parser = subparsers.add_parser('import', help="从 NDJSON 导入")
+    import_parser.add_argument('input', help="输入文件（.ndjson 或 .ndjson.gz），- 表示标准输入")
+    import_parser.add_argument('--mode', choices=IMPORT_MODES, default='merge')
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        lines = to_ndjson(iter_records(
+            list_session_ids(), load_session_data,
+            user=args.user, question=args.question,
+            since=parse_date(args.since), until=parse_date(args.until),
+            types=tuple(t.strip() for t in args.types.split(','))
+        ))
+        if not args.output:
+            for line in lines:
+                sys.stdout.write(line)
+        elif args.output.endswith('.gz'):
+            with open(args.output, 'wb') as f:
+                for chunk in gzip_chunks(lines):
+                    f.write(chunk)
+        else:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                for line in lines:
+                    f.write(line)
+    else:
+        stream = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')
+        with stream:
+            stats = import_records(iter_ndjson(stream), update_session_data,
+                                   session_exists, add_session_to_user, mode=args.mode)
+        print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+进程间文件锁
+
+多个 worker 进程（或服务进程与命令行工具）共用同一个 data 目录时，用于保护本地文件的读-改-写。
+锁文件与被保护的文件放在一起；不支持 flock 的平台（Windows）退化为进程内锁。
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_thread_locks = {}
+_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(path):
+    """阻塞获取 path 上的排他锁，持有期间应只做短小的文件操作"""
+    if fcntl is None:
+        with _guard:
+            thread_lock = _thread_locks.setdefault(os.path.abspath(path), threading.Lock())
+        with thread_lock:
+            yield
+        return
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
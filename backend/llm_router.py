@@ -0,0 +1,202 @@
+"""
+多 LLM 服务商路由
+
+在多个兼容 OpenAI 接口的服务商之间路由请求：优先选择近期 p95 延迟最低的服务商，
+超过对冲延迟仍未返回时向下一个服务商发起对冲请求，出错时自动切换，并按阶段应用 model/max_tokens/temperature。
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from upstream import DEFAULT_POOL_SIZE, make_http_session, probe
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TOKENS = 2048
+DEFAULT_TEMPERATURE = 0.7
+
+
+class LLMProvider:
+    """单个兼容 OpenAI chat/completions 接口的服务商，记录近期延迟和失败情况"""
+
+    def __init__(self, name, url, api_key, model, timeout=120, verify=False, window=50, pool_size=DEFAULT_POOL_SIZE):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.verify = verify
+        self.latencies = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.session = make_http_session(pool_size)
+
+    def p95(self):
+        """近期请求延迟的 p95，没有样本时返回 0 以便优先探测"""
+        with self.lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def available(self):
+        return time.monotonic() >= self.cooldown_until
+
+    def record_success(self, latency):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+            self.cooldown_until = 0.0
+
+    def record_failure(self, latency):
+        with self.lock:
+            self.requests += 1
+            self.failures += 1
+            # 失败按超时时间计入延迟样本：快速失败（如连接被拒）不能让服务商的 p95 变低，
+            # 否则冷却结束后又会被排在最前面。这里有意高估：恢复后要等失败样本移出窗口 p95 才会回落
+            self.latencies.append(max(latency, self.timeout))
+            self.consecutive_failures += 1
+            # 连续失败后指数退避，最长冷却 60 秒
+            self.cooldown_until = time.monotonic() + min(60, 2 ** self.consecutive_failures)
+
+    def post(self, payload):
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        return self.session.post(self.url, json=payload, headers=headers, timeout=self.timeout, verify=self.verify)
+
+    def warm(self, timeout=3):
+        """预先建立连接并检查可达性"""
+        return {"name": self.name, **probe(self.session, self.url, timeout, self.verify)}
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "url": self.url,
+            "model": self.model,
+            "requests": self.requests,
+            "failures": self.failures,
+            "p95": round(self.p95(), 3),
+            "available": self.available()
+        }
+
+
+class LLMRouter:
+    """按延迟选择服务商，支持对冲请求和失败切换"""
+
+    def __init__(self, providers, hedge_delay=0, stages=None, max_workers=16):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.stages = stages or {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm')
+
+    @classmethod
+    def from_config(cls, config, default_url, default_key, default_model):
+        """从 config.json 构建路由；未配置 LLM_PROVIDERS 时退化为单一服务商"""
+        provider_configs = config.get("LLM_PROVIDERS") or [{
+            "name": "default",
+            "url": default_url,
+            "api_key": default_key,
+            "model": default_model
+        }]
+        providers = [
+            LLMProvider(
+                name=p.get("name", f"provider_{i}"),
+                url=p["url"],
+                api_key=p.get("api_key", ""),
+                model=p.get("model", default_model),
+                timeout=p.get("timeout", 120),
+                verify=p.get("verify", False),
+                pool_size=p.get("pool_size", DEFAULT_POOL_SIZE)
+            )
+            for i, p in enumerate(provider_configs)
+        ]
+        return cls(providers, hedge_delay=config.get("LLM_HEDGE_DELAY", 0), stages=config.get("LLM_STAGES", {}))
+
+    def ranked_providers(self):
+        """可用的服务商按 p95 升序排列，冷却中的排在最后作为兜底"""
+        available = sorted((p for p in self.providers if p.available()), key=lambda p: p.p95())
+        cooling = sorted((p for p in self.providers if not p.available()), key=lambda p: p.cooldown_until)
+        return available + cooling
+
+    def build_payload(self, provider, messages, stage, max_tokens, temperature):
+        stage_config = self.stages.get(stage, {}) if stage else {}
+        return {
+            "model": stage_config.get("model", provider.model),
+            "messages": messages,
+            "max_tokens": max_tokens if max_tokens is not None else stage_config.get("max_tokens", DEFAULT_MAX_TOKENS),
+            "temperature": temperature if temperature is not None else stage_config.get("temperature", DEFAULT_TEMPERATURE)
+        }
+
+    def _attempt(self, provider, payload):
+        started = time.monotonic()
+        try:
+            response = provider.post(payload)
+        except Exception:
+            provider.record_failure(time.monotonic() - started)
+            raise
+        if response.status_code == 200:
+            provider.record_success(time.monotonic() - started)
+        else:
+            provider.record_failure(time.monotonic() - started)
+        return response
+
+    def chat(self, messages, stage=None, max_tokens=None, temperature=None):
+        """发送 chat 请求，返回第一个成功的 requests.Response；全部失败时返回最后一个响应或抛出最后一个异常"""
+        candidates = self.ranked_providers()
+        pending = {}
+        next_index = 0
+        last_response = None
+        last_error = None
+
+        def launch():
+            nonlocal next_index
+            provider = candidates[next_index]
+            next_index += 1
+            payload = self.build_payload(provider, messages, stage, max_tokens, temperature)
+            pending[self.executor.submit(self._attempt, provider, payload)] = provider
+
+        launch()
+        while pending:
+            hedge = self.hedge_delay if self.hedge_delay and next_index < len(candidates) else None
+            done, _ = wait(pending, timeout=hedge, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info(f"LLM request slower than {self.hedge_delay}s, hedging to {candidates[next_index].name}")
+                launch()
+                continue
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    logger.warning(f"LLM provider {provider.name} failed: {str(e)}")
+                    last_error = e
+                    continue
+                if response.status_code == 200:
+                    return response
+                logger.warning(f"LLM provider {provider.name} returned status {response.status_code}")
+                last_response = response
+
+            # 当前没有进行中的请求时切换到下一个服务商
+            if not pending and next_index < len(candidates):
+                launch()
+
+        if last_response is not None:
+            return last_response
+        raise last_error
+
+    def stats(self):
+        return {
+            "hedge_delay": self.hedge_delay,
+            "providers": [p.stats() for p in self.providers]
+        }
@@ -0,0 +1,244 @@
+"""
+OCR 后端
+
+- RemotePaddleOCRBackend: 调用 PaddleOCR layout-parsing 远程接口（默认）
+- LocalPaddleOCRBackend: 在本机的有界进程池中运行 PaddleOCR，每个工作进程只加载一次模型
+
+两者的 process() 都返回 {"success", "text_content", "raw_result"} 或 {"success": False, "error"}。
+通过 config.json 的 OCR_BACKEND（"remote" / "local"）选择。
+"""
+import base64
+import importlib.util
+import logging
+import multiprocessing
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from upstream import make_http_session, probe
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_OCR = {
+    "workers": 2,
+    "max_queue": 8,
+    "timeout": 120,
+    "lang": "ch",
+}
+
+
+class OCRBackend(ABC):
+    """OCR后端接口"""
+
+    name = "base"
+
+    @abstractmethod
+    def process(self, file_path):
+        """识别图片，返回 {"success", "text_content", "raw_result"} 或 {"success": False, "error"}"""
+
+    def warm(self, timeout=3):
+        """启动时预热（建立连接、加载模型），返回检查结果"""
+        return None
+
+    def probe(self, timeout=3):
+        """就绪检查，在 timeout 秒内返回检查结果；默认与预热相同"""
+        return self.warm(timeout)
+
+
+class RemotePaddleOCRBackend(OCRBackend):
+    """PaddleOCR layout-parsing 远程接口"""
+
+    name = "remote"
+
+    def __init__(self, url, token, timeout=300):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.session = make_http_session()
+
+    def warm(self, timeout=3):
+        return probe(self.session, self.url, timeout)
+
+    def process(self, file_path):
+        try:
+            # 读取图片文件并转换为base64
+            with open(file_path, "rb") as file:
+                file_data = base64.b64encode(file.read()).decode("ascii")
+
+            headers = {
+                "Authorization": f"token {self.token}",
+                "Content-Type": "application/json"
+            }
+
+            # 设置请求数据（fileType=1 表示图片）
+            payload = {
+                "file": file_data,
+                "fileType": 1,
+                "useDocOrientationClassify": False,
+                "useDocUnwarping": False,
+                "useTextlineOrientation": False,
+                "useChartRecognition": False,
+            }
+
+            response = self.session.post(self.url, json=payload, headers=headers, timeout=self.timeout, verify=False)
+
+            if response.status_code == 200:
+                result = response.json()["result"]
+
+                # 提取Markdown文本内容
+                ocr_texts = []
+                for res in result["layoutParsingResults"]:
+                    if "markdown" in res and "text" in res["markdown"]:
+                        ocr_texts.append(res["markdown"]["text"])
+
+                return {
+                    "success": True,
+                    "text_content": "\n\n".join(ocr_texts),
+                    "raw_result": result
+                }
+            else:
+                logger.error(f"OCR API request failed with status {response.status_code}")
+                return {
+                    "success": False,
+                    "error": f"OCR API request failed with status {response.status_code}"
+                }
+
+        except Exception as e:
+            logger.error(f"Error processing image with OCR: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+
+# 工作进程内的OCR引擎，由 _init_worker 在进程启动时加载一次
+_engine = None
+
+
+def _init_worker(lang):
+    global _engine
+    from paddleocr import PaddleOCR
+    _engine = PaddleOCR(
+        lang=lang,
+        use_doc_orientation_classify=False,
+        use_doc_unwarping=False,
+        use_textline_orientation=False
+    )
+
+
+def _ping():
+    return _engine is not None
+
+
+def _run_local_ocr(file_path):
+    """在工作进程中识别图片，返回识别出的文本行"""
+    lines = []
+    if hasattr(_engine, 'predict'):
+        # PaddleOCR 3.x
+        for res in _engine.predict(file_path):
+            lines.extend(res['rec_texts'])
+    else:
+        # PaddleOCR 2.x: [[[box, (text, score)], ...]]
+        for page in _engine.ocr(file_path) or []:
+            for line in page or []:
+                lines.append(line[1][0])
+    return lines
+
+
+class LocalPaddleOCRBackend(OCRBackend):
+    """本地 PaddleOCR，运行在有界进程池中"""
+
+    name = "local"
+
+    def __init__(self, workers=2, max_queue=8, timeout=120, lang="ch"):
+        if importlib.util.find_spec('paddleocr') is None:
+            raise RuntimeError("OCR_BACKEND 'local' requires paddleocr: pip install paddleocr paddlepaddle")
+        self.workers = workers
+        self.timeout = timeout
+        self.lang = lang
+        # 进行中 + 排队的任务总数上限，超出时直接返回失败而不是无限排队
+        self.slots = threading.BoundedSemaphore(workers + max_queue)
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _get_executor(self):
+        # 首次使用时才启动进程池，避免 import app 的脚本也拉起工作进程
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.lang,)
+                )
+            return self.executor
+
+    def warm(self, timeout=3):
+        # 启动全部工作进程并加载模型；模型加载较慢，使用识别超时而不是探测超时
+        started = time.monotonic()
+        executor = self._get_executor()
+        try:
+            loaded = all(f.result(timeout=self.timeout) for f in [executor.submit(_ping) for _ in range(self.workers)])
+            return {"reachable": loaded, "workers": self.workers, "latency_ms": round((time.monotonic() - started) * 1000, 1)}
+        except Exception as e:
+            return {"reachable": False, "error": str(e)}
+
+    def probe(self, timeout=3):
+        # 就绪检查只确认已启动的工作进程能够响应，使用探测超时；进程池未启动时不在检查中拉起
+        with self.lock:
+            executor = self.executor
+        if executor is None:
+            return {"reachable": True, "workers": self.workers, "started": False}
+        started = time.monotonic()
+        try:
+            loaded = executor.submit(_ping).result(timeout=timeout)
+            return {"reachable": loaded, "workers": self.workers, "latency_ms": round((time.monotonic() - started) * 1000, 1)}
+        except FutureTimeoutError:
+            return {"reachable": False, "error": f"Local OCR workers did not respond within {timeout}s"}
+        except Exception as e:
+            return {"reachable": False, "error": str(e)}
+
+    def process(self, file_path):
+        if not self.slots.acquire(blocking=False):
+            logger.warning("Local OCR queue is full")
+            return {"success": False, "error": "Local OCR queue is full"}
+        try:
+            future = self._get_executor().submit(_run_local_ocr, file_path)
+            lines = future.result(timeout=self.timeout)
+            text_content = "\n".join(lines)
+            return {
+                "success": True,
+                "text_content": text_content,
+                # 与远程接口保持相同结构，便于下游统一处理
+                "raw_result": {
+                    "engine": "local",
+                    "layoutParsingResults": [{"markdown": {"text": text_content}}]
+                }
+            }
+        except FutureTimeoutError:
+            logger.error(f"Local OCR timed out after {self.timeout}s")
+            return {"success": False, "error": f"Local OCR timed out after {self.timeout}s"}
+        except Exception as e:
+            logger.error(f"Error processing image with local OCR: {str(e)}")
+            return {"success": False, "error": str(e)}
+        finally:
+            self.slots.release()
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+
+def create_ocr_backend(config, remote_url, remote_token):
+    """根据 config.json 创建OCR后端"""
+    backend = config.get("OCR_BACKEND", "remote")
+    if backend == "local":
+        options = {**DEFAULT_LOCAL_OCR, **config.get("LOCAL_OCR", {})}
+        return LocalPaddleOCRBackend(**options)
+    if backend != "remote":
+        raise ValueError(f"Unknown OCR_BACKEND: {backend}")
+    return RemotePaddleOCRBackend(remote_url, remote_token)
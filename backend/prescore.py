@@ -0,0 +1,180 @@
+"""
+提纲本地预评分
+
+加载题库时为每个标准提纲（以及题目+审题思路）预先计算字符 n-gram TF-IDF 向量，
+提交时对用户的 structured_content 计算余弦相似度，毫秒级给出结果，
+可用于判断提纲为空或偏题，从而跳过或推迟 LLM 对比。
+"""
+import json
+import logging
+import os
+import re
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRESCORE = {
+    # 有效字符数少于该值视为空提纲
+    "min_chars": 10,
+    # 与题目和标准提纲的最高相似度低于该值视为偏题
+    "off_topic_threshold": 0.05,
+    "ngram_range": [2, 3],
+    # 是否跳过空提纲/偏题提纲的 LLM 对比
+    "skip_empty": True,
+    "skip_off_topic": False,
+}
+
+_NON_TEXT_PATTERN = re.compile(r'[^0-9a-zA-Z\u3400-\u4dbf\u4e00-\u9fff]+')
+
+
+def normalize_text(text):
+    """去掉标点和空白，只保留中文、字母和数字"""
+    return _NON_TEXT_PATTERN.sub('', text or '').lower()
+
+
+def char_ngrams(text, ngram_range):
+    low, high = ngram_range
+    grams = []
+    for n in range(low, high + 1):
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+def outline_text(outline):
+    """提取提纲中参与比较的文本：主旨、各部分内容和引用"""
+    if not isinstance(outline, dict):
+        return ''
+    texts = [outline.get('subject', '')]
+    for part in outline.get('parts', []) or []:
+        if not isinstance(part, dict):
+            continue
+        texts.append(part.get('content', ''))
+        texts.extend(q for q in part.get('quotes', []) or [] if isinstance(q, str))
+    return '\n'.join(t for t in texts if isinstance(t, str))
+
+
+class OutlinePrescorer:
+    """基于 NumPy 的字符 n-gram TF-IDF 相似度引擎"""
+
+    def __init__(self, qbank_folder, options=None):
+        self.qbank_folder = qbank_folder
+        self.options = {**DEFAULT_PRESCORE, **(options or {})}
+        self.ngram_range = tuple(self.options["ngram_range"])
+        self.vocabulary = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        # question_id -> {"titles": [...], "outlines": 矩阵, "topic": 向量}
+        self.questions = {}
+        self.load()
+
+    def load(self):
+        """读取题库并预计算所有向量"""
+        started = time.monotonic()
+        documents = []  # (question_id, kind, title, text)
+        if os.path.exists(self.qbank_folder):
+            for filename in sorted(os.listdir(self.qbank_folder)):
+                if not (filename.startswith('question_') and filename.endswith('.json')):
+                    continue
+                question_id = filename[:-5]
+                try:
+                    with open(os.path.join(self.qbank_folder, filename), 'r', encoding='utf-8') as f:
+                        question_data = json.load(f)
+                except Exception as e:
+                    logger.error(f"Error loading question {question_id} for prescoring: {e}")
+                    continue
+                documents.append((question_id, 'topic', '',
+                                  question_data.get('question', '') + '\n' + question_data.get('think', '')))
+                for outline in question_data.get('outlines', []):
+                    documents.append((question_id, 'outline', outline.get('title', ''), outline_text(outline)))
+
+        grams_per_doc = [char_ngrams(normalize_text(text), self.ngram_range) for _, _, _, text in documents]
+        vocabulary = {}
+        for grams in grams_per_doc:
+            for gram in grams:
+                vocabulary.setdefault(gram, len(vocabulary))
+        self.vocabulary = vocabulary
+
+        counts = np.zeros((len(documents), len(vocabulary)), dtype=np.float32)
+        for row, grams in enumerate(grams_per_doc):
+            if grams:
+                indices = np.fromiter((vocabulary[g] for g in grams), dtype=np.int64, count=len(grams))
+                counts[row] = np.bincount(indices, minlength=len(vocabulary))
+
+        # 平滑 IDF，与 sklearn 的 smooth_idf 一致
+        document_frequency = (counts > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(documents)) / (1 + document_frequency)) + 1).astype(np.float32)
+        matrix = self._normalize(counts * self.idf)
+
+        questions = {}
+        for row, (question_id, kind, title, _) in enumerate(documents):
+            entry = questions.setdefault(question_id, {"titles": [], "rows": [], "topic": None})
+            if kind == 'topic':
+                entry["topic"] = matrix[row]
+            else:
+                entry["titles"].append(title)
+                entry["rows"].append(row)
+        for entry in questions.values():
+            entry["outlines"] = matrix[entry.pop("rows")] if entry["titles"] else np.zeros((0, len(vocabulary)), dtype=np.float32)
+        self.questions = questions
+        self.all_question_ids = list(questions)
+        self.all_topics = np.stack([questions[q]["topic"] for q in self.all_question_ids]) if questions else None
+
+        logger.info(f"Prescorer loaded {len(documents)} documents, {len(vocabulary)} n-grams "
+                    f"in {(time.monotonic() - started) * 1000:.1f}ms")
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+    def vectorize(self, text):
+        """将文本转换为归一化的 TF-IDF 向量，未登录的 n-gram 忽略"""
+        indices = [self.vocabulary[g] for g in char_ngrams(normalize_text(text), self.ngram_range) if g in self.vocabulary]
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        if indices:
+            vector = np.bincount(indices, minlength=len(self.vocabulary)).astype(np.float32) * self.idf
+        return self._normalize(vector)
+
+    def score(self, question_id, structured_content):
+        """对用户提纲预评分"""
+        started = time.monotonic()
+        text = outline_text(structured_content)
+        char_count = len(normalize_text(text))
+        result = {
+            "char_count": char_count,
+            "similarity": 0.0,
+            "topic_similarity": 0.0,
+            "best_outline_index": None,
+            "outlines": [],
+            "closest_question": None,
+            "verdict": "ok"
+        }
+
+        if char_count < self.options["min_chars"]:
+            result["verdict"] = "empty"
+        elif question_id in self.questions:
+            entry = self.questions[question_id]
+            vector = self.vectorize(text)
+            similarities = entry["outlines"] @ vector
+            result["outlines"] = [
+                {"index": i, "title": title, "similarity": round(float(sim), 4)}
+                for i, (title, sim) in enumerate(zip(entry["titles"], similarities))
+            ]
+            if len(similarities):
+                result["best_outline_index"] = int(np.argmax(similarities))
+                result["similarity"] = round(float(similarities.max()), 4)
+            result["topic_similarity"] = round(float(entry["topic"] @ vector), 4)
+            result["closest_question"] = self.all_question_ids[int(np.argmax(self.all_topics @ vector))]
+
+            if max(result["similarity"], result["topic_similarity"]) < self.options["off_topic_threshold"]:
+                result["verdict"] = "off_topic"
+
+        result["elapsed_ms"] = round((time.monotonic() - started) * 1000, 3)
+        return result
+
+    def should_skip_llm(self, prescore):
+        """根据配置判断是否跳过 LLM 对比"""
+        return ((prescore["verdict"] == "empty" and self.options["skip_empty"])
+                or (prescore["verdict"] == "off_topic" and self.options["skip_off_topic"]))
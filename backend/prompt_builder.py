@@ -0,0 +1,131 @@
+"""
+Prompt 构建工具
+
+负责估算 token 数、生成紧凑 JSON，并按预算裁剪注入 prompt 的内容（标准提纲、审题思路、OCR文本），
+同时记录每个阶段的 prompt 大小，便于衡量延迟与成本。
+"""
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# 各注入字段的默认 token 预算，可在 config.json 的 PROMPT_TOKEN_BUDGETS 中覆盖
+DEFAULT_TOKEN_BUDGETS = {
+    "user_content": 3000,
+    "std_thinking": 1500,
+    "std_outline": 2000,
+}
+
+TRUNCATED_MARK = "……（已截断）"
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符约 1 字 1 token，其余字符约 4 个字符 1 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def compact_json(data):
+    """生成不带缩进和多余空格的 JSON"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def truncate_text(text, budget):
+    """将文本截断到 token 预算以内"""
+    if not text or estimate_tokens(text) <= budget:
+        return text
+    # 二分查找满足预算的最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) + estimate_tokens(TRUNCATED_MARK) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + TRUNCATED_MARK
+
+
+def normalize_ocr_text(text):
+    """压缩OCR文本中的多余空白"""
+    if not text:
+        return text
+    text = re.sub(r'[ \t　]+', ' ', text)
+    text = re.sub(r'\n\s*\n+', '\n\n', text)
+    return text.strip()
+
+
+def _shrink_outline(outline, example_budget):
+    """裁剪单个标准提纲中的 example_content 段落"""
+    shrunk = dict(outline)
+    parts = []
+    for part in outline.get('parts', []):
+        part = dict(part)
+        if 'example_content' in part:
+            if example_budget <= 0:
+                part.pop('example_content')
+            else:
+                part['example_content'] = truncate_text(part['example_content'], example_budget)
+        parts.append(part)
+    shrunk['parts'] = parts
+    return shrunk
+
+
+def _truncate_strings(data, budget):
+    """将嵌套结构中的每个字符串截断到 budget 以内"""
+    if isinstance(data, str):
+        return truncate_text(data, budget)
+    if isinstance(data, list):
+        return [_truncate_strings(item, budget) for item in data]
+    if isinstance(data, dict):
+        return {key: _truncate_strings(value, budget) for key, value in data.items()}
+    return data
+
+
+def trim_std_outlines(outlines, budget):
+    """
+    将标准提纲裁剪到 token 预算以内，逐步执行：
+    1. 紧凑 JSON 原样输出
+    2. 逐级缩短各段 example_content，最后完全去掉
+    3. 从末尾开始丢弃整条提纲
+    4. 只剩一条仍超出预算时，逐级截断其中的文本，再从末尾丢弃段落，最后整条丢弃
+    """
+    if not outlines or estimate_tokens(compact_json(outlines)) <= budget:
+        return outlines
+
+    def fits(candidate):
+        return estimate_tokens(compact_json(candidate)) <= budget
+
+    for example_budget in (200, 100, 50, 0):
+        shrunk = [_shrink_outline(outline, example_budget) for outline in outlines]
+        if fits(shrunk):
+            return shrunk
+
+    while len(shrunk) > 1 and not fits(shrunk):
+        shrunk = shrunk[:-1]
+    if fits(shrunk):
+        return shrunk
+
+    last = shrunk[0]
+    for field_budget in (100, 50, 20):
+        last = _truncate_strings(last, field_budget)
+        if fits([last]):
+            return [last]
+    while last.get('parts') and not fits([last]):
+        last = dict(last, parts=last['parts'][:-1])
+    return [last] if fits([last]) else []
+
+
+def fill_template(template, replacements, stage):
+    """替换模板中的占位符，并记录该阶段的 prompt token 数"""
+    prompt = template
+    for key, value in replacements.items():
+        prompt = prompt.replace(key, value)
+    sizes = {key: estimate_tokens(value) for key, value in replacements.items()}
+    logger.info(f"Prompt size for stage '{stage}': ~{estimate_tokens(prompt)} tokens "
+                f"({len(prompt)} chars), fields: {sizes}")
+    return prompt
@@ -0,0 +1,197 @@
+"""
+限流与准入控制
+
+- RateLimiter: 按用户/session/IP 维护令牌桶，OCR 和 LLM 各自独立计费
+- AdmissionController: 全局并发上限 + 有界等待队列，队列已满或等待超时时拒绝（返回 429）
+"""
+import math
+import threading
+import time
+
+DEFAULT_RATE_LIMITS = {
+    # rate: 每秒补充的令牌数；burst: 桶容量
+    "ocr": {"rate": 0.1, "burst": 3},
+    "llm": {"rate": 0.2, "burst": 6},
+    "max_concurrent": 8,
+    "max_queue": 16,
+    "queue_timeout": 30,
+    # 服务前面的反向代理层数，大于 0 时按 X-Forwarded-For 识别客户端IP
+    "proxy_hops": 0,
+}
+
+# 桶数量超过该值时清理已回满的空闲桶
+MAX_BUCKETS = 10000
+
+
+def merge_limits(overrides):
+    """合并 config.json 的 RATE_LIMITS 与默认值，ocr/llm 只配置了部分字段时其余字段取默认值"""
+    limits = {key: dict(value) if isinstance(value, dict) else value for key, value in DEFAULT_RATE_LIMITS.items()}
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(limits.get(key), dict):
+            limits[key].update(value)
+        else:
+            limits[key] = value
+    return limits
+
+
+class TokenBucket:
+    """令牌桶，调用方负责加锁"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        # 新建的桶可能晚于调用方取到的 now，时间差为负时不扣减令牌
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def wait_time(self, cost):
+        """距离攒够 cost 个令牌还需等待的秒数"""
+        if self.tokens >= cost:
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (cost - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """按 key 和资源类型（ocr/llm）划分的令牌桶限流器"""
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.allowed = 0
+        self.refunded = 0
+        self.rejected = {kind: 0 for kind in limits}
+
+    def _bucket(self, kind, key):
+        bucket = self.buckets.get((kind, key))
+        if bucket is None:
+            limit = self.limits[kind]
+            bucket = TokenBucket(limit["rate"], limit["burst"])
+            self.buckets[(kind, key)] = bucket
+        return bucket
+
+    def _prune(self, now):
+        for bucket_key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[bucket_key]
+
+    def acquire(self, key, costs):
+        """
+        原子地从各资源的桶中扣除令牌。
+        返回 (是否允许, 建议的 Retry-After 秒数)；任一资源不足时不扣除任何令牌。
+        """
+        costs = {kind: cost for kind, cost in costs.items() if cost and kind in self.limits}
+        with self.lock:
+            now = time.monotonic()
+            if len(self.buckets) > MAX_BUCKETS:
+                self._prune(now)
+
+            retry_after = 0.0
+            for kind, cost in costs.items():
+                bucket = self._bucket(kind, key)
+                bucket.refill(now)
+                wait_time = bucket.wait_time(cost)
+                if wait_time > 0:
+                    self.rejected[kind] += 1
+                    retry_after = max(retry_after, wait_time)
+            if retry_after > 0:
+                return False, retry_after
+
+            for kind, cost in costs.items():
+                self.buckets[(kind, key)].tokens -= cost
+            self.allowed += 1
+            return True, 0.0
+
+    def refund(self, key, costs):
+        """退还 acquire 扣除的令牌（请求随后被准入控制拒绝或参数校验失败时）"""
+        costs = {kind: cost for kind, cost in costs.items() if cost and kind in self.limits}
+        with self.lock:
+            for kind, cost in costs.items():
+                bucket = self.buckets.get((kind, key))
+                if bucket is not None:
+                    bucket.tokens = min(bucket.capacity, bucket.tokens + cost)
+            self.refunded += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "allowed": self.allowed,
+                "refunded": self.refunded,
+                "rejected": dict(self.rejected),
+                "tracked_buckets": len(self.buckets)
+            }
+
+
+class AdmissionController:
+    """全局并发上限，超出时在有界队列中等待"""
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        # 请求平均处理时长（指数滑动平均），用于估算 Retry-After
+        self.avg_service_time = 1.0
+
+    def acquire(self):
+        """获取执行名额，返回 (是否获得, 建议的 Retry-After 秒数)"""
+        with self.cond:
+            if self.in_flight < self.max_concurrent:
+                self.in_flight += 1
+                self.admitted += 1
+                return True, 0.0
+            if self.waiting >= self.max_queue:
+                self.rejected_queue_full += 1
+                return False, self._estimate_retry_after()
+
+            self.waiting += 1
+            self.queued += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.in_flight >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_timeout += 1
+                        return False, self._estimate_retry_after()
+                    self.cond.wait(remaining)
+                self.in_flight += 1
+                self.admitted += 1
+                return True, 0.0
+            finally:
+                self.waiting -= 1
+
+    def release(self, service_time):
+        with self.cond:
+            self.in_flight -= 1
+            self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * service_time
+            self.cond.notify()
+
+    def _estimate_retry_after(self):
+        return self.avg_service_time * (self.waiting + 1) / self.max_concurrent
+
+    def stats(self):
+        with self.cond:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_timeout": self.rejected_timeout,
+                "avg_service_time": round(self.avg_service_time, 3)
+            }
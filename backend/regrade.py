@@ -0,0 +1,218 @@
+"""
+离线批量重新评阅工具
+
+遍历 data/sessions 中的历史 essay_outlines，按题目/日期筛选后重新调用 cmp_outline，
+结果与原始 cmp 并排写入 data/regrade/<run>/results.jsonl，便于修改 prompt 后做 A/B 对比。
+
+用法:
+    python regrade.py --run v2 --question question_01 --since 2025-01-01 \
+        --prompt ai_cmp_outline.txt --concurrency 4 --rate 1.0
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from export import parse_date
+from scheduler import SchedulerRejected, work_priority
+
+logger = logging.getLogger(__name__)
+
+# 被调度器拒绝后的首次退避秒数，之后每次翻倍（最长 60 秒）
+RETRY_BACKOFF = 5
+
+
+class RateLimiter:
+    """简单的全局限速器：保证相邻两次请求之间至少间隔 1/rate 秒"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+def iter_outlines(session_ids, load_session_data, question=None, since=None, until=None, sessions=None, invalid=None):
+    """
+    遍历session存储，按条件产出 (session_id, index, outline)。
+    submitted_at 无法解析且指定了日期范围的记录不产出，以 (session_id, index, outline, error) 追加到 invalid 中。
+    """
+    for session_id in sorted(session_ids):
+        if sessions and session_id not in sessions:
+            continue
+        session_data = load_session_data(session_id)
+        if question and session_data.get('question') != question:
+            continue
+        for index, outline in enumerate(session_data.get('essay_outlines', [])):
+            # 没有结构化提纲的记录（AI生成失败）无法重新比较
+            if not outline.get('structured_content'):
+                continue
+            try:
+                submitted_at = parse_date(outline.get('submitted_at'))
+            except (TypeError, ValueError) as e:
+                if since or until:
+                    logger.warning(f"Invalid submitted_at in {session_id}:{index}: {e}")
+                    if invalid is not None:
+                        invalid.append((session_id, index, outline, f"Invalid submitted_at: {e}"))
+                    continue
+                submitted_at = None
+            if since and (submitted_at is None or submitted_at < since):
+                continue
+            if until and (submitted_at is None or submitted_at >= until):
+                continue
+            yield session_id, index, outline
+
+
+def load_checkpoint(checkpoint_file):
+    """读取已完成的任务键，用于断点续跑"""
+    done = set()
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    done.add(line)
+    return done
+
+
+def regrade_one(cmp_outline, session_id, index, outline, prompt_file, limiter, run_name, retries=3):
+    """重新比较单条提纲，以 batch 优先级调度，被在线请求抢占时退避重试；任何异常都记为该条失败"""
+    started = time.monotonic()
+    try:
+        for attempt in range(retries + 1):
+            limiter.wait()
+            try:
+                with work_priority('batch', user=f"regrade:{run_name}"):
+                    result = cmp_outline(outline['structured_content'], session_id, prompt_file=prompt_file)
+                break
+            except SchedulerRejected as e:
+                if attempt == retries:
+                    result = {"success": False, "error": str(e)}
+                    break
+                time.sleep(min(60, RETRY_BACKOFF * 2 ** attempt))
+    except Exception as e:
+        logger.exception(f"Regrade raised for {session_id}:{index}")
+        result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+    return make_record(session_id, index, outline, prompt_file, result, started)
+
+
+def make_record(session_id, index, outline, prompt_file, result, started):
+    return {
+        "session_id": session_id,
+        "index": index,
+        "submitted_at": outline.get('submitted_at', ''),
+        "prompt_file": prompt_file,
+        "success": result["success"],
+        "error": result.get("error"),
+        "original_cmp": outline.get('cmp', {}),
+        "new_cmp": result.get("judgement", {}),
+        "elapsed": round(time.monotonic() - started, 3),
+        "regraded_at": datetime.now().isoformat()
+    }
+
+
+def run(args, backend):
+    """backend 提供 DATA_FOLDER、cmp_outline、list_session_ids、load_session_data 和 storage（即 app 模块）"""
+    run_dir = os.path.join(backend.DATA_FOLDER, 'regrade', args.run)
+    os.makedirs(run_dir, exist_ok=True)
+    results_file = os.path.join(run_dir, 'results.jsonl')
+    checkpoint_file = os.path.join(run_dir, 'checkpoint.txt')
+
+    done = load_checkpoint(checkpoint_file)
+    invalid = []
+    tasks = [
+        (session_id, index, outline)
+        for session_id, index, outline in iter_outlines(
+            backend.list_session_ids(), backend.load_session_data,
+            question=args.question,
+            since=parse_date(args.since),
+            until=parse_date(args.until),
+            sessions=set(args.session) if args.session else None,
+            invalid=invalid
+        )
+        if f"{session_id}:{index}" not in done
+    ]
+    # 无法筛选的记录也只记录一次
+    invalid = [item for item in invalid if f"{item[0]}:{item[1]}" not in done]
+    if args.limit:
+        tasks = tasks[:args.limit]
+
+    logger.info(f"Regrade run '{args.run}': {len(tasks)} outlines pending, {len(done)} already done, "
+                f"{len(invalid)} invalid")
+
+    limiter = RateLimiter(args.rate)
+    write_lock = threading.Lock()
+    succeeded = failed = 0
+    # 进度写入共享存储，可通过 /jobStatus?jobid=regrade:<run> 查询
+    jobid = f"regrade:{args.run}"
+    backend.storage.jobs.start(jobid, kind="regrade", state="running", total=len(tasks) + len(invalid),
+                       succeeded=0, failed=0)
+
+    # 无法筛选的记录直接记为失败并记入检查点（重跑也无法修复），不中断整个任务
+    with open(results_file, 'a', encoding='utf-8') as f, open(checkpoint_file, 'a', encoding='utf-8') as checkpoint:
+        for session_id, index, outline, error in invalid:
+            record = make_record(session_id, index, outline, args.prompt,
+                                 {"success": False, "error": error}, time.monotonic())
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            checkpoint.write(f"{session_id}:{index}\n")
+            failed += 1
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(regrade_one, backend.cmp_outline, session_id, index, outline, args.prompt, limiter, args.run)
+            for session_id, index, outline in tasks
+        ]
+        for future in as_completed(futures):
+            record = future.result()
+            key = f"{record['session_id']}:{record['index']}"
+            with write_lock:
+                with open(results_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                # 失败的任务不记入检查点，下次运行时会重试
+                if record["success"]:
+                    succeeded += 1
+                    with open(checkpoint_file, 'a', encoding='utf-8') as f:
+                        f.write(key + '\n')
+                else:
+                    failed += 1
+                    logger.warning(f"Regrade failed for {key}: {record['error']}")
+                backend.storage.jobs.update(jobid, succeeded=succeeded, failed=failed)
+
+    backend.storage.jobs.update(jobid, state="done")
+
+    logger.info(f"Regrade run '{args.run}' finished: {succeeded} succeeded, {failed} failed")
+    print(f"结果已写入 {results_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量重新评阅历史提纲")
+    parser.add_argument('--run', required=True, help="本次运行名称，结果和检查点保存在 data/regrade/<run>/")
+    parser.add_argument('--question', help="仅处理指定题目，如 question_01")
+    parser.add_argument('--session', action='append', help="仅处理指定session，可重复")
+    parser.add_argument('--since', help="提交时间下限（含），如 2025-01-01")
+    parser.add_argument('--until', help="提交时间上限（不含）")
+    parser.add_argument('--prompt', default='ai_cmp_outline.txt', help="prompts/ 下使用的比较prompt文件")
+    parser.add_argument('--concurrency', type=int, default=2, help="并发请求数")
+    parser.add_argument('--rate', type=float, default=1.0, help="每秒最多发起的LLM请求数，0表示不限速")
+    parser.add_argument('--limit', type=int, default=0, help="最多处理的条数，0表示不限")
+    args = parser.parse_args()
+
+    import app
+    run(args, app)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+OCR / LLM 优先级调度
+
+位于 OCR 和 LLM 客户端之前，按上游并发预算分配执行名额：
+- 优先级类别: interactive（学生提交）、batch（批量重新评阅等）、maintenance（重建、预热等后台任务）
+- 类别之间按权重公平分配（stride 调度），同一类别内按用户轮转，单个用户无法占满名额
+- 等待队列已满时，高优先级任务会抢占排队中的低优先级任务（被抢占者收到 SchedulerRejected）
+- 已在执行的任务不会被中断
+
+调用方通过 work_priority() 声明当前线程的优先级，未声明时视为 interactive。
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+PRIORITY_CLASSES = ('interactive', 'batch', 'maintenance')
+
+DEFAULT_SCHEDULER = {
+    # 上游并发预算
+    "ocr": {"concurrency": 4},
+    "llm": {"concurrency": 8},
+    # 所有类别合计的最大排队数
+    "max_queue": 64,
+    # weight: 名额分配权重；queue_timeout: 最长排队秒数
+    "classes": {
+        "interactive": {"weight": 8, "queue_timeout": 60},
+        "batch": {"weight": 2, "queue_timeout": 600},
+        "maintenance": {"weight": 1, "queue_timeout": 1800},
+    },
+}
+
+# 用于统计等待时间分位数的样本数
+WAIT_SAMPLES = 200
+
+_current_priority = contextvars.ContextVar('work_priority', default=('interactive', None))
+
+
+@contextmanager
+def work_priority(priority, user=None):
+    """声明当前线程（上下文）中 OCR/LLM 调用的优先级和所属用户"""
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {priority}")
+    token = _current_priority.set((priority, user))
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority():
+    return _current_priority.get()
+
+
+class SchedulerRejected(Exception):
+    """排队已满、等待超时或被高优先级任务抢占"""
+
+    def __init__(self, scheduler, reason, priority):
+        super().__init__(f"{scheduler} scheduler rejected {priority} work: {reason}")
+        self.reason = reason
+        self.priority = priority
+
+
+class _Waiter:
+    __slots__ = ('priority', 'user', 'enqueued', 'event', 'granted', 'error')
+
+    def __init__(self, priority, user):
+        self.priority = priority
+        self.user = user
+        self.enqueued = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+        self.error = None
+
+
+class PriorityScheduler:
+    """按优先级类别和用户加权公平分配并发名额"""
+
+    def __init__(self, name, concurrency, classes=None, max_queue=DEFAULT_SCHEDULER["max_queue"]):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.classes = {
+            cls: {**DEFAULT_SCHEDULER["classes"][cls], **(classes or {}).get(cls, {})}
+            for cls in PRIORITY_CLASSES
+        }
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        # 类别 -> 用户 -> 等待者队列
+        self.queues = {cls: {} for cls in PRIORITY_CLASSES}
+        # stride 调度的虚拟时间：类别之间按 1/weight 推进，类别内用户之间按 1 推进
+        self.virtual_time = 0.0
+        self.class_pass = {cls: 0.0 for cls in PRIORITY_CLASSES}
+        self.user_pass = {cls: {} for cls in PRIORITY_CLASSES}
+        self.user_virtual_time = {cls: 0.0 for cls in PRIORITY_CLASSES}
+        self.counters = {
+            cls: {"in_flight": 0, "started": 0, "preempted": 0, "rejected_queue_full": 0, "timed_out": 0}
+            for cls in PRIORITY_CLASSES
+        }
+        self.waits = {cls: deque(maxlen=WAIT_SAMPLES) for cls in PRIORITY_CLASSES}
+
+    def _queued(self, cls):
+        return sum(len(q) for q in self.queues[cls].values())
+
+    def _total_queued(self):
+        return sum(self._queued(cls) for cls in PRIORITY_CLASSES)
+
+    def _enqueue(self, waiter):
+        cls, user = waiter.priority, waiter.user
+        if not self._queued(cls):
+            # 空闲后重新进入的类别不能凭借旧的虚拟时间独占名额
+            self.class_pass[cls] = max(self.class_pass[cls], self.virtual_time)
+        if user not in self.queues[cls]:
+            self.queues[cls][user] = deque()
+            self.user_pass[cls][user] = max(self.user_pass[cls].get(user, 0.0), self.user_virtual_time[cls])
+        self.queues[cls][user].append(waiter)
+
+    def _remove(self, waiter):
+        queue = self.queues[waiter.priority].get(waiter.user)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[waiter.priority][waiter.user]
+                del self.user_pass[waiter.priority][waiter.user]
+
+    def _pick_victim(self, priority):
+        """选择被抢占的排队任务：优先级最低的类别中最晚入队的"""
+        rank = PRIORITY_CLASSES.index(priority)
+        for cls in reversed(PRIORITY_CLASSES[rank + 1:]):
+            waiters = [w for queue in self.queues[cls].values() for w in queue]
+            if waiters:
+                return max(waiters, key=lambda w: w.enqueued)
+        return None
+
+    def _grant(self, waiter, now):
+        waiter.granted = True
+        self.in_flight += 1
+        self.counters[waiter.priority]["in_flight"] += 1
+        self.counters[waiter.priority]["started"] += 1
+        self.waits[waiter.priority].append(now - waiter.enqueued)
+        waiter.event.set()
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self.in_flight < self.concurrency:
+            active = [cls for cls in PRIORITY_CLASSES if self.queues[cls]]
+            if not active:
+                return
+            # 虚拟时间最小的类别（相同时按优先级）
+            cls = min(active, key=lambda c: (self.class_pass[c], PRIORITY_CLASSES.index(c)))
+            user = min(self.queues[cls], key=lambda u: self.user_pass[cls][u])
+            waiter = self.queues[cls][user].popleft()
+
+            self.virtual_time = self.class_pass[cls]
+            self.class_pass[cls] += 1.0 / self.classes[cls]["weight"]
+            self.user_virtual_time[cls] = self.user_pass[cls][user]
+            self.user_pass[cls][user] += 1.0
+            if not self.queues[cls][user]:
+                del self.queues[cls][user]
+                del self.user_pass[cls][user]
+            self._grant(waiter, now)
+
+    def acquire(self, priority=None, user=None):
+        """获取执行名额，未指定时使用 work_priority() 声明的优先级；失败时抛出 SchedulerRejected"""
+        if priority is None:
+            priority, user = current_priority()
+        waiter = _Waiter(priority, user)
+        with self.lock:
+            if self.in_flight < self.concurrency and not self._total_queued():
+                self._grant(waiter, waiter.enqueued)
+                return
+            if self._total_queued() >= self.max_queue:
+                victim = self._pick_victim(priority)
+                if victim is None:
+                    self.counters[priority]["rejected_queue_full"] += 1
+                    raise SchedulerRejected(self.name, "queue full", priority)
+                self._remove(victim)
+                victim.error = "preempted"
+                self.counters[victim.priority]["preempted"] += 1
+                victim.event.set()
+            self._enqueue(waiter)
+
+        waiter.event.wait(self.classes[priority]["queue_timeout"])
+        with self.lock:
+            if waiter.granted:
+                return
+            if waiter.error is None:
+                self._remove(waiter)
+                waiter.error = "timeout"
+                self.counters[priority]["timed_out"] += 1
+        raise SchedulerRejected(self.name, waiter.error, priority)
+
+    def release(self, priority=None):
+        if priority is None:
+            priority = current_priority()[0]
+        with self.lock:
+            self.in_flight -= 1
+            self.counters[priority]["in_flight"] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority=None, user=None):
+        if priority is None:
+            priority, user = current_priority()
+        self.acquire(priority, user)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            classes = {}
+            for cls in PRIORITY_CLASSES:
+                waiting = [w for queue in self.queues[cls].values() for w in queue]
+                waits = sorted(self.waits[cls])
+                classes[cls] = {
+                    **self.counters[cls],
+                    "weight": self.classes[cls]["weight"],
+                    "queue_depth": len(waiting),
+                    "queued_users": len(self.queues[cls]),
+                    "oldest_wait": round(max((now - w.enqueued for w in waiting), default=0.0), 3),
+                    "avg_wait": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                    "p95_wait": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0
+                }
+            return {
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "max_queue": self.max_queue,
+                "classes": classes
+            }
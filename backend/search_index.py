@@ -0,0 +1,479 @@
+"""
+全文检索索引
+
+对题库（题目、审题思路、标准提纲）和已保存的提交（OCR文本 text_content、结构化提纲 structured_content、仿写作品）
+建立倒排索引。中文按字符二元组（bigram）切分，英文和数字按词切分，使用 BM25 排序。
+
+存储结构（data/search/）：
+- base_terms.json / base_postings.bin / docs.jsonl: 基础段，倒排表为 uint32 (doc_id, tf) 数组，查询时通过 mmap 读取
+- delta.jsonl: 增量日志，提交时追加；启动时重放，超过阈值后合并进基础段
+
+多个 worker 进程可以共用同一个索引目录：追加、合并和重建都在 index.lock 文件锁内进行，
+写入前先读入其他进程追加的增量日志，文档 id 由共享的日志分配，不会重复。
+
+用法:
+    python search_index.py rebuild        # 由题库和全部 session 重建
+    python search_index.py compact        # 将增量日志合并进基础段
+    python search_index.py query 苏轼
+"""
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import threading
+import uuid
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+
+from analytics import iter_strings
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_COMPACT_THRESHOLD = 500
+
+_CJK_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]+')
+_WORD = re.compile(r'[0-9a-zA-Z]+')
+
+
+def tokenize(text):
+    """中文连续片段切为字符二元组（单字片段保留单字），英文/数字按词切分并转小写"""
+    if not text:
+        return []
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(word.lower() for word in _WORD.findall(text))
+    return tokens
+
+
+def flatten_text(data):
+    return '\n'.join(iter_strings(data))
+
+
+class SearchIndex:
+    """基础段（mmap）+ 增量段（内存 + 追加日志）的倒排索引"""
+
+    def __init__(self, folder, compact_threshold=DEFAULT_COMPACT_THRESHOLD):
+        self.folder = folder
+        self.compact_threshold = compact_threshold
+        self.terms_path = os.path.join(folder, 'base_terms.json')
+        self.postings_path = os.path.join(folder, 'base_postings.bin')
+        self.docs_path = os.path.join(folder, 'docs.jsonl')
+        self.delta_path = os.path.join(folder, 'delta.jsonl')
+        self.lock_path = os.path.join(folder, 'index.lock')
+        self.version_path = os.path.join(folder, 'base_version')
+        os.makedirs(folder, exist_ok=True)
+
+        self.lock = threading.RLock()
+        self.docs = {}
+        self.key_to_id = {}
+        self.deleted = set()
+        self.base_terms = {}
+        self.base_file = None
+        self.base_mmap = None
+        self.base_postings = None
+        self.delta_postings = {}
+        self.delta_docs = 0
+        self.next_id = 0
+        # 已加载的基础段版本和已重放的增量日志字节数
+        self.base_version = None
+        self.delta_offset = 0
+        self.lock_depth = 0
+        self._load()
+
+    # ---- 加载与持久化 ----
+
+    def _reset(self):
+        self._close_postings()
+        self.docs = {}
+        self.key_to_id = {}
+        self.deleted = set()
+        self.base_terms = {}
+        self.delta_postings = {}
+        self.delta_docs = 0
+        self.next_id = 0
+
+    @contextmanager
+    def _writing(self):
+        """写入时持有进程内锁和文件锁（可重入），并先同步其他进程的改动"""
+        with self.lock:
+            if self.lock_depth:
+                self.lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self.lock_depth -= 1
+                return
+            with file_lock(self.lock_path):
+                self.lock_depth = 1
+                try:
+                    self._sync()
+                    yield
+                finally:
+                    self.lock_depth = 0
+
+    def _base_version(self):
+        # 每次写入基础段都生成新的版本号（inode 和修改时间可能在快速连续的合并之间重复）
+        try:
+            with open(self.version_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        with self.lock:
+            self._reset()
+            self.base_version = self._base_version()
+            self.delta_offset = 0
+            if all(os.path.exists(p) for p in (self.terms_path, self.postings_path, self.docs_path)):
+                with open(self.terms_path, 'r', encoding='utf-8') as f:
+                    self.base_terms = json.load(f)["terms"]
+                with open(self.docs_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            self._register_doc(json.loads(line))
+                self._open_postings()
+            self._read_delta()
+
+    def _read_delta(self):
+        """重放增量日志中尚未应用的完整行"""
+        if not os.path.exists(self.delta_path):
+            return
+        with open(self.delta_path, 'rb') as f:
+            f.seek(self.delta_offset)
+            data = f.read()
+        # 其他进程可能正在追加，最后一个不完整的行留到下次读取
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._apply(json.loads(line))
+        self.delta_offset += end
+
+    def _sync(self):
+        """加载其他进程（或重建命令）写入的改动"""
+        if self._base_version() != self.base_version:
+            self._load()
+            return
+        size = os.path.getsize(self.delta_path) if os.path.exists(self.delta_path) else 0
+        if size < self.delta_offset:
+            self._load()
+        elif size > self.delta_offset:
+            self._read_delta()
+
+    def _open_postings(self):
+        self._close_postings()
+        if os.path.getsize(self.postings_path) == 0:
+            return
+        self.base_file = open(self.postings_path, 'rb')
+        self.base_mmap = mmap.mmap(self.base_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.base_postings = memoryview(self.base_mmap).cast('I')
+
+    def _close_postings(self):
+        if self.base_postings is not None:
+            self.base_postings.release()
+            self.base_postings = None
+        if self.base_mmap is not None:
+            self.base_mmap.close()
+            self.base_mmap = None
+        if self.base_file is not None:
+            self.base_file.close()
+            self.base_file = None
+
+    def _register_doc(self, doc):
+        self.docs[doc["id"]] = doc
+        self.key_to_id[doc["key"]] = doc["id"]
+        self.next_id = max(self.next_id, doc["id"] + 1)
+
+    def _apply(self, op):
+        """应用一条增量日志"""
+        if op["op"] == "add":
+            doc = op["doc"]
+            self._register_doc(doc)
+            for term, tf in op["terms"].items():
+                self.delta_postings.setdefault(term, []).append((doc["id"], tf))
+            self.delta_docs += 1
+        elif op["op"] == "delete":
+            for doc_id in op["ids"]:
+                self.deleted.add(doc_id)
+                doc = self.docs.pop(doc_id, None)
+                if doc and self.key_to_id.get(doc["key"]) == doc_id:
+                    del self.key_to_id[doc["key"]]
+
+    def _log(self, op):
+        """追加一条增量日志，调用方需处于 _writing() 中"""
+        line = (json.dumps(op, ensure_ascii=False) + '\n').encode('utf-8')
+        with open(self.delta_path, 'ab') as f:
+            f.write(line)
+        self.delta_offset += len(line)
+        self._apply(op)
+
+    def _write_base(self, docs, postings):
+        """写入新的基础段并清空增量日志；docs: {id: doc}, postings: {term: [(id, tf), ...]}"""
+        os.makedirs(self.folder, exist_ok=True)
+        terms = {}
+        data = array('I')
+        for term in sorted(postings):
+            entries = sorted(postings[term])
+            terms[term] = [len(data) // 2, len(entries)]
+            for doc_id, tf in entries:
+                data.append(doc_id)
+                data.append(tf)
+
+        for path, writer in (
+            (self.postings_path, lambda f: data.tofile(f)),
+            (self.terms_path, lambda f: f.write(json.dumps({"terms": terms}, ensure_ascii=False).encode('utf-8'))),
+            (self.docs_path, lambda f: f.write(''.join(
+                json.dumps(doc, ensure_ascii=False) + '\n' for doc in docs.values()).encode('utf-8'))),
+        ):
+            # 临时文件名带进程号，多个 worker 共享 data 目录时同时重建不会互相覆盖
+            with open(f"{path}.{os.getpid()}.tmp", 'wb') as f:
+                writer(f)
+
+        with open(f"{self.version_path}.{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+            f.write(uuid.uuid4().hex)
+
+        self._reset()
+        for path in (self.postings_path, self.terms_path, self.docs_path, self.version_path):
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+        if os.path.exists(self.delta_path):
+            os.remove(self.delta_path)
+
+        self.base_terms = terms
+        for doc in docs.values():
+            self._register_doc(doc)
+        self._open_postings()
+        self.base_version = self._base_version()
+        self.delta_offset = 0
+
+    # ---- 写入 ----
+
+    def add(self, doc, text):
+        """
+        增量添加文档。doc 需包含唯一的 key，以及 kind/question_id/session_id 等元数据；
+        相同 key 的旧文档会被替换。
+        """
+        counts = Counter(tokenize(text))
+        with self._writing():
+            old_id = self.key_to_id.get(doc["key"])
+            if old_id is not None:
+                self._log({"op": "delete", "ids": [old_id]})
+            doc = dict(doc, id=self.next_id, length=sum(counts.values()))
+            self.next_id += 1
+            self._log({"op": "add", "doc": doc, "terms": dict(counts)})
+            if self.delta_docs >= self.compact_threshold:
+                self.compact()
+
+    def delete_session(self, session_id):
+        """删除某个 session 的全部文档"""
+        with self._writing():
+            ids = [doc_id for doc_id, doc in self.docs.items() if doc.get("session_id") == session_id]
+            if ids:
+                self._log({"op": "delete", "ids": ids})
+
+    def compact(self):
+        """合并基础段和增量段，去掉已删除的文档"""
+        with self._writing():
+            postings = {}
+            for term in set(self.base_terms) | set(self.delta_postings):
+                entries = [(doc_id, tf) for doc_id, tf in self._postings(term) if doc_id in self.docs]
+                if entries:
+                    postings[term] = entries
+            self._write_base(dict(self.docs), postings)
+            logger.info(f"Search index compacted: {len(self.docs)} documents, {len(postings)} terms")
+
+    def rebuild(self, documents):
+        """由 (doc, text) 序列重建整个索引"""
+        docs = {}
+        postings = {}
+        for doc_id, (doc, text) in enumerate(documents):
+            counts = Counter(tokenize(text))
+            docs[doc_id] = dict(doc, id=doc_id, length=sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+        with self._writing():
+            self._write_base(docs, postings)
+        logger.info(f"Search index rebuilt: {len(docs)} documents, {len(postings)} terms")
+        return len(docs)
+
+    def rebuild_if_empty(self, documents):
+        """
+        索引为空时由 documents 重建，返回文档数；已有文档时返回 None。
+        在文件锁内先同步再检查，多个 worker 同时启动时只有一个会重建，不会覆盖其他 worker 已写入的增量日志。
+        """
+        with self._writing():
+            if self.docs:
+                return None
+            return self.rebuild(documents)
+
+    # ---- 查询 ----
+
+    def _refresh(self):
+        # 查询时只在其他进程有改动时才取文件锁同步，避免读到正在替换的基础段
+        if self._base_version() != self.base_version or (
+                os.path.exists(self.delta_path) and os.path.getsize(self.delta_path) != self.delta_offset) or (
+                not os.path.exists(self.delta_path) and self.delta_offset):
+            with self._writing():
+                pass
+
+    def _postings(self, term):
+        if self.base_postings is not None and term in self.base_terms:
+            offset, count = self.base_terms[term]
+            view = self.base_postings[offset * 2:(offset + count) * 2]
+            # 复制出来后立即释放切片，避免合并时 mmap 仍被引用而无法关闭
+            values = view.tolist()
+            view.release()
+            yield from zip(values[0::2], values[1::2])
+        yield from self.delta_postings.get(term, ())
+
+    def search(self, query, page=1, page_size=10, kind=None, question_id=None):
+        """BM25 排序的分页查询，返回 (总命中数, 当前页 [(score, doc), ...])"""
+        terms = set(tokenize(query))
+        with self.lock:
+            self._refresh()
+            total_docs = len(self.docs)
+            if not terms or not total_docs:
+                return 0, []
+            avg_length = sum(doc["length"] for doc in self.docs.values()) / total_docs or 1
+
+            scores = {}
+            for term in terms:
+                postings = [(doc_id, tf) for doc_id, tf in self._postings(term) if doc_id in self.docs]
+                if not postings:
+                    continue
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings:
+                    length = self.docs[doc_id]["length"]
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (
+                        tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+
+            matches = [
+                (score, doc_id) for doc_id, score in scores.items()
+                if (not kind or self.docs[doc_id]["kind"] == kind)
+                and (not question_id or self.docs[doc_id].get("question_id") == question_id)
+            ]
+            top = heapq.nlargest(page * page_size, matches)[(page - 1) * page_size:]
+            return len(matches), [(round(score, 4), dict(self.docs[doc_id])) for score, doc_id in top]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "documents": len(self.docs),
+                "base_terms": len(self.base_terms),
+                "delta_documents": self.delta_docs,
+                "deleted_documents": len(self.deleted)
+            }
+
+
+# ---- 文档来源 ----
+
+def outline_document(session_id, question_id, index, outline_data):
+    doc = {"key": f"outline:{session_id}:{index}", "kind": "outline",
+           "session_id": session_id, "question_id": question_id, "index": index}
+    text = outline_data.get('text_content', '') + '\n' + flatten_text(outline_data.get('structured_content', {}))
+    return doc, text
+
+
+def imitation_document(session_id, question_id, imitid, index, work):
+    doc = {"key": f"imitation:{session_id}:{imitid}:{index}", "kind": "imitation",
+           "session_id": session_id, "question_id": question_id, "imitid": imitid, "index": index}
+    return doc, work.get('text_content', '')
+
+
+def iter_qbank_documents(qbank_folder):
+    """题库文档：每道题一个 question 文档，每个标准提纲一个 std_outline 文档"""
+    if not os.path.exists(qbank_folder):
+        return
+    for filename in sorted(os.listdir(qbank_folder)):
+        if not (filename.startswith('question_') and filename.endswith('.json')):
+            continue
+        question_id = filename[:-5]
+        try:
+            with open(os.path.join(qbank_folder, filename), 'r', encoding='utf-8') as f:
+                question_data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading question {question_id} for search index: {e}")
+            continue
+        yield ({"key": f"question:{question_id}", "kind": "question", "question_id": question_id},
+               question_data.get('question', '') + '\n' + question_data.get('think', ''))
+        for index, outline in enumerate(question_data.get('outlines', [])):
+            yield ({"key": f"std_outline:{question_id}:{index}", "kind": "std_outline",
+                    "question_id": question_id, "index": index, "title": outline.get('title', '')},
+                   flatten_text(outline))
+
+
+def iter_session_documents(session_ids, load_session_data):
+    for session_id in session_ids:
+        session_data = load_session_data(session_id)
+        question_id = session_data.get('question')
+        for index, outline_data in enumerate(session_data.get('essay_outlines', [])):
+            yield outline_document(session_id, question_id, index, outline_data)
+        for imitid, works in session_data.get('imitation_works', {}).items():
+            for index, work in enumerate(works):
+                yield imitation_document(session_id, question_id, imitid, index, work)
+
+
+def document_text(doc, load_session_data, get_essay_topics):
+    """取回文档原文，用于生成摘要"""
+    if doc["kind"] == "question":
+        topic = get_essay_topics(doc["question_id"])
+        return topic.get('question', '') + '\n' + topic.get('think', '')
+    if doc["kind"] == "std_outline":
+        outlines = get_essay_topics(doc["question_id"]).get('outlines', [])
+        return flatten_text(outlines[doc["index"]]) if doc["index"] < len(outlines) else ''
+    session_data = load_session_data(doc["session_id"])
+    try:
+        if doc["kind"] == "outline":
+            return outline_document(doc["session_id"], None, doc["index"], session_data['essay_outlines'][doc["index"]])[1]
+        return session_data['imitation_works'][doc["imitid"]][doc["index"]].get('text_content', '')
+    except (KeyError, IndexError):
+        return ''
+
+
+def make_snippet(text, query, width=40):
+    """截取第一个命中词附近的文本"""
+    positions = [text.find(token) for token in tokenize(query)]
+    positions = [p for p in positions if p >= 0]
+    start = max(0, min(positions) - width) if positions else 0
+    snippet = text[start:start + width * 3].replace('\n', ' ')
+    return ('…' if start > 0 else '') + snippet + ('…' if start + width * 3 < len(text) else '')
+
+
+def main():
+    import argparse
+
+    from app import QBANK_FOLDER, get_essay_topics, list_session_ids, load_session_data, search_index
+
+    parser = argparse.ArgumentParser(description="全文检索索引")
+    parser.add_argument('command', choices=['rebuild', 'compact', 'query'])
+    parser.add_argument('query', nargs='?', default='')
+    parser.add_argument('--page', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        session_ids = sorted(list_session_ids())
+        documents = list(iter_qbank_documents(QBANK_FOLDER)) + list(iter_session_documents(session_ids, load_session_data))
+        count = search_index.rebuild(documents)
+        print(f"已索引 {count} 个文档")
+    elif args.command == 'compact':
+        search_index.compact()
+        print(json.dumps(search_index.stats()))
+    else:
+        total, results = search_index.search(args.query, page=args.page)
+        print(f"共 {total} 条结果")
+        for score, doc in results:
+            text = document_text(doc, load_session_data, get_essay_topics)
+            print(f"[{score}] {doc['key']}  {make_snippet(text, args.query)}")
+
+
+if __name__ == '__main__':
+    main()
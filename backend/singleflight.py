@@ -0,0 +1,62 @@
+"""
+Single-flight 请求合并
+
+相同 key 的并发调用只执行一次，其余调用者等待同一个 Future 并获得相同结果，
+用于合并学生重复提交或前端重试导致的重复 OCR / LLM 请求。
+"""
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+
+
+def make_key(*parts):
+    """由任意可 JSON 序列化的参数生成稳定的 key"""
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """按 key 合并进行中的调用"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """执行 fn()；若相同 key 的调用正在进行中，则等待其结果"""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.calls[key] = future
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            # 结束后立即移除，之后的调用会重新执行（不做结果缓存）
+            with self.lock:
+                del self.calls[key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "upstream_calls": self.executed,
+                "coalesced_calls": self.coalesced,
+                "in_flight": len(self.calls)
+            }
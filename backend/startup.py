@@ -0,0 +1,281 @@
+"""
+启动预热与健康检查
+
+导入 app 时：
+1. 校验配置，加载并校验 prompts 和题库（结果留在 FileCache 中，首个请求不再读盘）
+2. 在后台线程中预先建立 OCR/LLM 上游连接（本地 OCR 则启动工作进程并加载模型）
+3. 记录 import 和初始化耗时
+
+预热只在服务启动时（app.serve()）执行，命令行工具 import app 时不会启动 OCR 工作进程或探测上游。
+/healthz 只表示进程存活；/readyz 在本地检查通过、预热结束且上游可达时返回 200，否则返回 503。
+"""
+import copy
+import logging
+import os
+import threading
+import time
+
+from upstream import make_http_session, probe
+
+logger = logging.getLogger(__name__)
+
+# 必需的 prompt 文件及其占位符
+REQUIRED_PROMPTS = {
+    "gen_user_outline.txt": ["$USER_CONTENT"],
+    "ai_judge_outline.txt": ["$USER_CONTENT", "$GENERATED_OUTLINE", "$STD_THINKING"],
+    "ai_cmp_outline.txt": ["$USER_OUTLINE", "$STD_OUTLINE", "$STD_THINKING"],
+}
+
+DEFAULT_READINESS = {
+    # 启动时是否预热上游连接
+    "warm_on_start": True,
+    # /readyz 是否检查上游可达性
+    "check_upstreams": True,
+    "timeout": 3,
+    # 上游检查结果的缓存秒数，避免探针频繁请求上游
+    "cache_seconds": 15,
+    # 覆盖默认的检查目标（OCR 接口和各 LLM 服务商），如指向本地桩服务：
+    # [{"name": "ocr", "url": "http://127.0.0.1:9001/"}]
+    "upstreams": None,
+}
+
+# 示例配置中的占位值
+PLACEHOLDER_MARKERS = ("your_", "_here")
+CONFIG_SECTIONS = ("RATE_LIMITS", "SCHEDULER", "PRESCORE", "ARCHIVE", "READINESS",
+                   "STROKE_RASTER", "PROMPT_TOKEN_BUDGETS", "LLM_STAGES", "LOCAL_OCR", "STORAGE")
+
+
+class FileCache:
+    """
+    按修改时间失效的文件缓存，文件改动后下一次读取自动重新加载。
+    返回的是缓存内容的副本，调用方修改返回值不会影响之后的请求。
+    """
+
+    def __init__(self, parse):
+        self.parse = parse
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, path):
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        entry = self.entries.get(path)
+        if entry and entry[0] == version:
+            return copy.deepcopy(entry[1])
+        with open(path, 'r', encoding='utf-8') as f:
+            value = self.parse(f.read())
+        with self.lock:
+            self.entries[path] = (version, value)
+        return copy.deepcopy(value)
+
+
+def _is_placeholder(value):
+    return not value or any(marker in value for marker in PLACEHOLDER_MARKERS)
+
+
+def validate_config(config, ocr_url, ocr_token, llm_key):
+    """校验配置，返回 (errors, warnings)"""
+    errors, warnings = [], []
+    if not config:
+        warnings.append("config.json 不存在，使用默认配置")
+    for section in CONFIG_SECTIONS:
+        if section in config and not isinstance(config[section], dict):
+            errors.append(f"{section} 应为 JSON 对象")
+    if config.get("OCR_BACKEND", "remote") == "remote":
+        if not ocr_url:
+            errors.append("PADDLE_OCR_API_URL 未配置")
+        elif _is_placeholder(ocr_token):
+            warnings.append("PADDLE_OCR_TOKEN 未配置或仍为示例值")
+    for i, provider in enumerate(config.get("LLM_PROVIDERS") or [{"name": "default", "api_key": llm_key}]):
+        if _is_placeholder(provider.get("api_key", "")):
+            warnings.append(f"LLM 服务商 {provider.get('name', f'provider_{i}')} 的 api_key 未配置或仍为示例值")
+    return errors, warnings
+
+
+def check_prompts(load_prompt_template):
+    """加载所有必需的 prompt 并检查占位符"""
+    errors = []
+    for filename, placeholders in REQUIRED_PROMPTS.items():
+        template = load_prompt_template(filename)
+        if not template:
+            errors.append(f"prompt {filename} 无法读取")
+            continue
+        missing = [p for p in placeholders if p not in template]
+        if missing:
+            errors.append(f"prompt {filename} 缺少占位符 {', '.join(missing)}")
+    return errors, []
+
+
+def check_qbank(qbank_folder, load_question):
+    """加载题库中所有题目并检查结构"""
+    errors, warnings = [], []
+    filenames = sorted(f for f in os.listdir(qbank_folder) if f.startswith('question_') and f.endswith('.json')) \
+        if os.path.exists(qbank_folder) else []
+    if not filenames:
+        warnings.append(f"题库 {qbank_folder} 为空")
+    for filename in filenames:
+        try:
+            question_data = load_question(os.path.join(qbank_folder, filename))
+        except Exception as e:
+            errors.append(f"{filename}: {e}")
+            continue
+        if not isinstance(question_data, dict) or not question_data.get('question'):
+            errors.append(f"{filename} 缺少 question 字段")
+        elif not isinstance(question_data.get('outlines', []), list):
+            errors.append(f"{filename} 的 outlines 应为数组")
+        elif not question_data.get('think'):
+            warnings.append(f"{filename} 缺少审题思路 think")
+    return errors, warnings
+
+
+class StartupMonitor:
+    """记录启动耗时、本地检查和上游预热结果，提供存活/就绪状态"""
+
+    def __init__(self, import_started, imports_finished, options=None):
+        self.options = {**DEFAULT_READINESS, **(options or {})}
+        self.import_started = import_started
+        self.import_ms = round((imports_finished - import_started) * 1000, 1)
+        self.init_ms = None
+        self.checks = {}
+        self.warmup = {"state": "not_started"}
+        self.probes = {}
+        self.lock = threading.Lock()
+        self.upstream_cache = None
+        # 进行中的上游检查，结束时 set
+        self.upstream_refresh = None
+
+    def run_checks(self, checks):
+        """执行本地检查，checks: {名称: 返回 (errors, warnings) 的函数}"""
+        for name, check in checks.items():
+            started = time.monotonic()
+            try:
+                errors, warnings = check()
+            except Exception as e:
+                errors, warnings = [str(e)], []
+            for message in errors:
+                logger.error(f"Startup check '{name}': {message}")
+            for message in warnings:
+                logger.warning(f"Startup check '{name}': {message}")
+            self.checks[name] = {
+                "ok": not errors,
+                "errors": errors,
+                "warnings": warnings,
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+            }
+
+    def set_probes(self, probes):
+        """设置上游检查，probes: {名称: probe(timeout) 函数}；配置了 upstreams 时改为检查配置的地址"""
+        if self.options["upstreams"]:
+            session = make_http_session(pool_size=len(self.options["upstreams"]))
+            probes = {
+                target.get("name", target["url"]): (lambda timeout, url=target["url"]: probe(session, url, timeout))
+                for target in self.options["upstreams"]
+            }
+        self.probes = probes
+
+    def _probe_all(self):
+        results = {}
+        threads = []
+        for name, fn in self.probes.items():
+            def run(name=name, fn=fn):
+                try:
+                    results[name] = fn(self.options["timeout"])
+                except Exception as e:
+                    results[name] = {"reachable": False, "error": str(e)}
+            thread = threading.Thread(target=run, daemon=True)
+            thread.start()
+            threads.append(thread)
+        deadline = time.monotonic() + self.options["timeout"] + 1
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        # 不遵守超时的检查按不可达处理，不等待它结束
+        return {name: results.get(name, {"reachable": False, "error": "probe timed out"}) for name in self.probes}
+
+    def start_warmup(self, warmers):
+        """在后台线程中预热上游连接，warmers: {名称: warm(timeout) 函数}"""
+        if not self.options["warm_on_start"]:
+            self.warmup = {"state": "skipped"}
+            return
+
+        def run():
+            started = time.monotonic()
+            results = {}
+            for name, warm in warmers.items():
+                try:
+                    results[name] = warm(self.options["timeout"])
+                except Exception as e:
+                    results[name] = {"reachable": False, "error": str(e)}
+            elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+            self.warmup = {"state": "done", "elapsed_ms": elapsed_ms, "results": results}
+            logger.info(f"Upstream connections warmed in {elapsed_ms}ms")
+
+        self.warmup = {"state": "running"}
+        threading.Thread(target=run, name='startup-warmup', daemon=True).start()
+
+    def finish(self):
+        """模块初始化结束时调用，记录启动耗时"""
+        self.init_ms = round((time.monotonic() - self.import_started) * 1000, 1)
+        checks_ms = sum(check["elapsed_ms"] for check in self.checks.values())
+        logger.info(f"Startup: imports {self.import_ms}ms, initialised in {self.init_ms}ms "
+                    f"(checks {round(checks_ms, 1)}ms)")
+
+    def upstream_status(self):
+        """
+        返回上游检查结果，缓存 cache_seconds 秒。检查在锁外进行，同一时间只有一个请求在检查：
+        其他并发请求直接返回上一次的结果，首次检查时等待其结束。
+        """
+        with self.lock:
+            cache = self.upstream_cache
+            if cache is not None and time.monotonic() - cache[0] <= self.options["cache_seconds"]:
+                return cache[1]
+            refresh = self.upstream_refresh
+            if refresh is None:
+                refresh = self.upstream_refresh = threading.Event()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            if cache is not None:
+                return cache[1]
+            refresh.wait(self.options["timeout"] + 2)
+            with self.lock:
+                if self.upstream_cache is not None:
+                    return self.upstream_cache[1]
+            return {name: {"reachable": False, "error": "probe in progress"} for name in self.probes}
+
+        results = None
+        try:
+            results = self._probe_all()
+            return results
+        finally:
+            with self.lock:
+                if results is not None:
+                    self.upstream_cache = (time.monotonic(), results)
+                self.upstream_refresh = None
+            refresh.set()
+
+    def liveness(self):
+        return {"status": "ok", "uptime": round(time.monotonic() - self.import_started, 1)}
+
+    def readiness(self):
+        """返回 (是否就绪, 详情)"""
+        reasons = [f"check '{name}' failed" for name, check in self.checks.items() if not check["ok"]]
+        if self.init_ms is None:
+            reasons.append("initialising")
+        if self.warmup["state"] == "running":
+            reasons.append("warming up")
+        upstreams = None
+        if self.options["check_upstreams"]:
+            upstreams = self.upstream_status()
+            reasons.extend(f"upstream '{name}' unreachable" for name, result in upstreams.items()
+                           if result and not result.get("reachable"))
+        return not reasons, {
+            "ready": not reasons,
+            "reasons": reasons,
+            "import_ms": self.import_ms,
+            "init_ms": self.init_ms,
+            "checks": self.checks,
+            "warmup": self.warmup,
+            "upstreams": upstreams
+        }
@@ -0,0 +1,499 @@
+"""
+共享存储后端
+
+session/用户等 JSON 文档、上传文件（blob）、分布式锁和任务状态的可插拔存储：
+- local: 本机文件系统（默认，与单机部署的目录结构一致），锁使用 flock，可在同一台机器的多个进程间互斥
+- redis: 通过 Redis 协议（RESP）共享，多个节点可以处理提交和 session 请求（全文索引等仍为节点本地状态）
+
+Redis 客户端为内置的最小实现，不依赖 redis-py；bench/redis_stub.py 提供用于测试的本地替身。
+一致性说明见 README.md「多节点部署」。
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import unquote, urlparse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORAGE = {
+    # local / redis
+    "backend": "local",
+    "redis_url": "redis://127.0.0.1:6379/0",
+    # 同一个 Redis 上部署多套服务时用于区分的键前缀
+    "prefix": "xessay:",
+    "pool_size": 16,
+    "socket_timeout": 5,
+    # 锁的自动过期时间和获取锁的最长等待时间（秒）
+    "lock_ttl": 30,
+    "lock_timeout": 10,
+    # 任务状态保留时间（秒）
+    "job_ttl": 86400,
+}
+
+
+class StorageError(Exception):
+    pass
+
+
+class LockTimeout(StorageError):
+    pass
+
+
+class RedisError(StorageError):
+    pass
+
+
+# ---- Redis 协议客户端 ----
+
+class RedisConnection:
+    """单个 RESP2 连接"""
+
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    @staticmethod
+    def _encode(value):
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode('utf-8')
+
+    def send(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = self._encode(arg)
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        self.sock.sendall(b''.join(parts))
+
+    def read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            raise RedisError(payload.decode('utf-8'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(payload)
+            if count < 0:
+                return None
+            return [self.read() for _ in range(count)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def execute(self, *args):
+        self.send(*args)
+        return self.read()
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisClient:
+    """带连接池的最小 Redis 客户端，url 格式 redis://[:password@]host[:port][/db]"""
+
+    def __init__(self, url, pool_size=16, timeout=5):
+        parsed = urlparse(url)
+        if parsed.scheme != 'redis':
+            raise ValueError(f"Unsupported Redis URL: {url}")
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        conn = RedisConnection(self.host, self.port, self.timeout)
+        if self.password:
+            conn.execute('AUTH', self.password)
+        if self.db:
+            conn.execute('SELECT', self.db)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except BaseException:
+            # 出错时连接可能停留在 MULTI/WATCH 状态或有未读的回复，直接丢弃
+            conn.close()
+            raise
+        self._put_back(conn)
+
+    def _put_back(self, conn):
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def execute(self, *args):
+        with self.connection() as conn:
+            return conn.execute(*args)
+
+    def transaction(self, *commands):
+        """在 MULTI/EXEC 中原子执行多条命令"""
+        with self.connection() as conn:
+            conn.execute('MULTI')
+            for command in commands:
+                conn.execute(*command)
+            return conn.execute('EXEC')
+
+
+# ---- 文档存储 ----
+
+class LocalDocumentStore:
+    """每个文档一个 JSON 文件：<root>/<namespace>/<id>.json"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, namespace, doc_id):
+        return os.path.join(self.root, namespace, f"{doc_id}.json")
+
+    def get(self, namespace, doc_id):
+        path = self._path(namespace, doc_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def put(self, namespace, doc_id, doc, ttl=None):
+        path = self._path(namespace, doc_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，读者不会看到写了一半的文件
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(doc, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+
+    def delete(self, namespace, doc_id):
+        path = self._path(namespace, doc_id)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def exists(self, namespace, doc_id):
+        return os.path.exists(self._path(namespace, doc_id))
+
+    def list_ids(self, namespace):
+        folder = os.path.join(self.root, namespace)
+        if not os.path.exists(folder):
+            return []
+        return [filename[:-5] for filename in os.listdir(folder) if filename.endswith('.json')]
+
+
+class RedisDocumentStore:
+    """文档保存为 <prefix><namespace>:<id> 字符串键，并在 <prefix><namespace>:ids 集合中登记（带 ttl 的文档不登记）"""
+
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, namespace, doc_id):
+        return f"{self.prefix}{namespace}:{doc_id}"
+
+    def _ids_key(self, namespace):
+        return f"{self.prefix}{namespace}:ids"
+
+    def get(self, namespace, doc_id):
+        data = self.client.execute('GET', self._key(namespace, doc_id))
+        return json.loads(data) if data is not None else None
+
+    def put(self, namespace, doc_id, doc, ttl=None):
+        data = json.dumps(doc, ensure_ascii=False)
+        if ttl:
+            self.client.execute('SET', self._key(namespace, doc_id), data, 'EX', int(ttl))
+        else:
+            self.client.transaction(('SET', self._key(namespace, doc_id), data),
+                                    ('SADD', self._ids_key(namespace), doc_id))
+
+    def delete(self, namespace, doc_id):
+        deleted, _ = self.client.transaction(('DEL', self._key(namespace, doc_id)),
+                                             ('SREM', self._ids_key(namespace), doc_id))
+        return bool(deleted)
+
+    def exists(self, namespace, doc_id):
+        return bool(self.client.execute('EXISTS', self._key(namespace, doc_id)))
+
+    def list_ids(self, namespace):
+        return [member.decode('utf-8') for member in self.client.execute('SMEMBERS', self._ids_key(namespace))]
+
+
+# ---- Blob 存储 ----
+
+class LocalBlobStore:
+    """blob 名称即 <root> 下的相对路径"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        path = os.path.normpath(os.path.join(self.root, name))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid blob name: {name}")
+        return path
+
+    def put(self, name, data):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def get(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def delete(self, name):
+        path = self._path(name)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+
+class RedisBlobStore:
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+
+    def put(self, name, data):
+        self.client.execute('SET', f"{self.prefix}blob:{name}", data)
+
+    def get(self, name):
+        return self.client.execute('GET', f"{self.prefix}blob:{name}")
+
+    def delete(self, name):
+        return bool(self.client.execute('DEL', f"{self.prefix}blob:{name}"))
+
+
+# ---- 锁 ----
+
+class LocalLockManager:
+    """
+    基于 flock 的文件锁，同一台机器上的进程和线程之间互斥；不支持 flock 的平台退化为进程内锁。
+    锁文件在释放时删除，不会随 session/用户数量累积：持有者在解锁前删除文件，
+    等待者获得锁后发现锁住的已不是当前路径上的文件，便重新打开再试。
+    """
+
+    def __init__(self, folder, timeout):
+        self.folder = folder
+        self.timeout = timeout
+        self.thread_locks = {}
+        self.guard = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.folder, f"{name.replace(':', '_')}.lock")
+
+    def _acquire(self, name, timeout):
+        path = self._path(name)
+        deadline = time.monotonic() + timeout
+        while True:
+            f = open(path, 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f"Timed out waiting for lock {name}")
+                time.sleep(0.01)
+                continue
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            # 上一个持有者已删除该文件，锁住的是旧文件
+            f.close()
+
+    @contextmanager
+    def lock(self, name, ttl=None, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        if fcntl is None:
+            with self.guard:
+                thread_lock = self.thread_locks.setdefault(name, threading.Lock())
+            if not thread_lock.acquire(timeout=timeout):
+                raise LockTimeout(f"Timed out waiting for lock {name}")
+            try:
+                yield
+            finally:
+                thread_lock.release()
+            return
+
+        f = self._acquire(name, timeout)
+        try:
+            yield
+        finally:
+            # 先删除再解锁（关闭文件即释放 flock）
+            try:
+                os.unlink(self._path(name))
+            except OSError as e:
+                logger.warning(f"Failed to remove lock file for {name}: {e}")
+            f.close()
+
+
+class RedisLockManager:
+    """
+    单实例 Redis 锁：SET key token NX PX ttl 获取，WATCH + MULTI 校验 token 后删除。
+    持有时间超过 ttl 时锁会自动释放，因此只应在短的读-改-写过程中持有。
+    """
+
+    def __init__(self, client, prefix, ttl, timeout):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.timeout = timeout
+
+    def _release(self, key, token):
+        """释放锁；失败时只记录日志（锁会在 ttl 后过期），不影响锁内已经完成的写入"""
+        try:
+            with self.client.connection() as conn:
+                conn.execute('WATCH', key)
+                if conn.execute('GET', key) == token.encode('utf-8'):
+                    conn.execute('MULTI')
+                    conn.execute('DEL', key)
+                    conn.execute('EXEC')
+                else:
+                    conn.execute('UNWATCH')
+                    logger.warning(f"Lock {key} expired before release")
+        except Exception as e:
+            logger.error(f"Failed to release lock {key}, it will expire after its ttl: {e}")
+
+    @contextmanager
+    def lock(self, name, ttl=None, timeout=None):
+        key = f"{self.prefix}lock:{name}"
+        token = uuid.uuid4().hex
+        ttl_ms = int((ttl or self.ttl) * 1000)
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        delay = 0.005
+        while self.client.execute('SET', key, token, 'NX', 'PX', ttl_ms) is None:
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"Timed out waiting for lock {name}")
+            time.sleep(delay)
+            delay = min(0.1, delay * 2)
+        try:
+            yield
+        finally:
+            self._release(key, token)
+
+
+# ---- 任务状态 ----
+
+class JobStore:
+    """进行中任务的状态，保存在共享文档存储中，任意节点都可以查询"""
+
+    # local 存储没有自动过期，每写入该次数清理一次过期任务
+    PRUNE_INTERVAL = 200
+
+    def __init__(self, documents, ttl):
+        self.documents = documents
+        self.ttl = ttl
+        self.node = f"{socket.gethostname()}:{os.getpid()}"
+        self.writes = 0
+
+    def start(self, job_id, **fields):
+        """创建任务记录，同名的旧记录被整体替换，不会残留上一次运行的字段"""
+        return self._write({"job_id": job_id, "created_at": time.time()}, fields)
+
+    def update(self, job_id, **fields):
+        """合并更新任务状态（同一任务只由一个节点写入，不加锁）"""
+        job = self.get(job_id) or {"job_id": job_id, "created_at": time.time()}
+        return self._write(job, fields)
+
+    def _write(self, job, fields):
+        now = time.time()
+        job_id = job["job_id"]
+        job.update(fields, node=self.node, updated_at=now, expires_at=now + self.ttl)
+        self.documents.put('jobs', job_id, job, ttl=self.ttl)
+        self.writes += 1
+        if isinstance(self.documents, LocalDocumentStore) and self.writes % self.PRUNE_INTERVAL == 0:
+            self.prune()
+        return job
+
+    def get(self, job_id):
+        job = self.documents.get('jobs', job_id)
+        if job is None or job.get("expires_at", 0) < time.time():
+            return None
+        return job
+
+    def prune(self):
+        now = time.time()
+        for job_id in self.documents.list_ids('jobs'):
+            try:
+                job = self.documents.get('jobs', job_id)
+                if job is not None and job.get("expires_at", 0) < now:
+                    self.documents.delete('jobs', job_id)
+            except Exception as e:
+                logger.warning(f"Error pruning job {job_id}: {e}")
+
+
+class Storage:
+    def __init__(self, name, documents, blobs, locks, jobs, client=None):
+        self.name = name
+        self.documents = documents
+        self.blobs = blobs
+        self.locks = locks
+        self.jobs = jobs
+        self.client = client
+
+    def probe(self, timeout=3):
+        """就绪检查：redis 后端检查连接"""
+        if self.client is None:
+            return None
+        started = time.monotonic()
+        try:
+            self.client.execute('PING')
+            return {"reachable": True, "latency_ms": round((time.monotonic() - started) * 1000, 1)}
+        except Exception as e:
+            return {"reachable": False, "error": str(e)}
+
+
+def create_storage(options, data_folder):
+    """根据 config.json 的 STORAGE 创建存储后端"""
+    options = {**DEFAULT_STORAGE, **(options or {})}
+    backend = options["backend"]
+    if backend == "local":
+        documents = LocalDocumentStore(data_folder)
+        return Storage("local", documents, LocalBlobStore(data_folder),
+                       LocalLockManager(os.path.join(data_folder, 'locks'), options["lock_timeout"]),
+                       JobStore(documents, options["job_ttl"]))
+    if backend == "redis":
+        client = RedisClient(options["redis_url"], options["pool_size"], options["socket_timeout"])
+        documents = RedisDocumentStore(client, options["prefix"])
+        return Storage("redis", documents, RedisBlobStore(client, options["prefix"]),
+                       RedisLockManager(client, options["prefix"], options["lock_ttl"], options["lock_timeout"]),
+                       JobStore(documents, options["job_ttl"]), client=client)
+    raise ValueError(f"Unknown STORAGE backend: {backend}")
@@ -0,0 +1,102 @@
+"""
+笔画提交格式
+
+前端 DrawingCanvas.toStrokes() 生成的紧凑笔画数据：
+    {"v": 1, "w": 画布宽(CSS像素), "h": 画布高, "q": 量化倍数,
+     "s": [[工具(0画笔/1橡皮), 粗细, x0, y0, dx1, dy1, ...], ...]}
+坐标乘以 q 后取整，并对相邻点做差分编码。后端按OCR需要的分辨率栅格化为PNG。
+"""
+import io
+import json
+
+from PIL import Image, ImageDraw
+
+from singleflight import make_key
+
+STROKES_VERSION = 1
+MAX_CANVAS_SIZE = 20000
+MAX_TOTAL_POINTS = 500000
+
+DEFAULT_STROKE_RASTER = {
+    # 栅格化后的图片宽度（像素），高度按画布比例计算
+    "width": 1600,
+    "max_height": 16000,
+}
+
+PEN_COLOR = (0, 0, 0)
+BACKGROUND_COLOR = (255, 255, 255)
+
+
+def decode_strokes(raw):
+    """解析并校验笔画数据，坐标还原为 CSS 像素；格式错误时抛出 ValueError"""
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode('utf-8')
+    try:
+        payload = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e}")
+    if not isinstance(payload, dict) or payload.get("v") != STROKES_VERSION:
+        raise ValueError(f"unsupported strokes version: {payload.get('v') if isinstance(payload, dict) else None}")
+
+    width, height, quantization = payload.get("w"), payload.get("h"), payload.get("q", 1)
+    for name, value in (("w", width), ("h", height)):
+        if not isinstance(value, int) or not 0 < value <= MAX_CANVAS_SIZE:
+            raise ValueError(f"invalid canvas size '{name}': {value}")
+    if not isinstance(quantization, (int, float)) or quantization <= 0:
+        raise ValueError(f"invalid quantization: {quantization}")
+    if not isinstance(payload.get("s"), list):
+        raise ValueError("missing stroke list 's'")
+
+    strokes = []
+    total_points = 0
+    for encoded in payload["s"]:
+        if (not isinstance(encoded, list) or len(encoded) < 4 or len(encoded) % 2 != 0
+                or not all(isinstance(n, (int, float)) for n in encoded)):
+            raise ValueError("each stroke must be [tool, size, x0, y0, dx1, dy1, ...]")
+        tool, size = encoded[0], encoded[1]
+        if tool not in (0, 1) or not 0 < size <= 200:
+            raise ValueError(f"invalid stroke tool/size: {tool}/{size}")
+
+        points = []
+        x = y = 0
+        for i in range(2, len(encoded), 2):
+            x += encoded[i]
+            y += encoded[i + 1]
+            points.append((x / quantization, y / quantization))
+        total_points += len(points)
+        if total_points > MAX_TOTAL_POINTS:
+            raise ValueError("too many points")
+
+        strokes.append({"eraser": tool == 1, "size": size, "points": points})
+
+    return {
+        "width": width,
+        "height": height,
+        "strokes": strokes,
+        # 在栅格化之前即可用于去重
+        "key": make_key("strokes", width, height, quantization, payload["s"])
+    }
+
+
+def rasterize_strokes(data, target_width=DEFAULT_STROKE_RASTER["width"], max_height=DEFAULT_STROKE_RASTER["max_height"]):
+    """将笔画绘制为白底黑字的PNG，返回图片字节"""
+    scale = target_width / data["width"]
+    image_height = min(max_height, max(1, round(data["height"] * scale)))
+    image = Image.new('RGB', (target_width, image_height), BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(image)
+
+    for stroke in data["strokes"]:
+        # 导出图片为白底，橡皮擦等同于用背景色绘制
+        color = BACKGROUND_COLOR if stroke["eraser"] else PEN_COLOR
+        width = max(1, round(stroke["size"] * scale))
+        points = [(x * scale, y * scale) for x, y in stroke["points"]]
+        if len(points) > 1:
+            draw.line(points, fill=color, width=width, joint='curve')
+        # 端点补圆，模拟 canvas 的 lineCap = 'round'
+        radius = width / 2
+        for x, y in (points[0], points[-1]):
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
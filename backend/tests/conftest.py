@@ -0,0 +1,5 @@
+"""测试直接导入 backend 下的模块（不导入 app，避免读取配置和启动后台任务）"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
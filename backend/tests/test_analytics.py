@@ -0,0 +1,129 @@
+import json
+import threading
+
+import pytest
+
+from analytics import AnalyticsStore, empty_aggregate, iter_stored_outlines
+from storage import LocalDocumentStore, LocalLockManager
+
+
+def outline(similarity=None, comments=(), submitted_at="2024-01-01T10:00:00"):
+    return {
+        "cmp": {"structure": "".join(f"<cmt-comm>{comment}</cmt-comm>" for comment in comments)},
+        "prescore": {"similarity": similarity, "verdict": "judge"} if similarity is not None else None,
+        "submitted_at": submitted_at,
+    }
+
+
+@pytest.fixture
+def documents(tmp_path):
+    return LocalDocumentStore(str(tmp_path / "data"))
+
+
+@pytest.fixture
+def store(tmp_path, documents):
+    return AnalyticsStore(documents, LocalLockManager(str(tmp_path / "locks"), timeout=5))
+
+
+def test_record_updates_only_its_question(store, documents):
+    store.record("q1", outline(0.35, ["偏题了"]), key="s1:0")
+    store.record("q1", outline(0.95, submitted_at="2024-01-02T10:00:00"), key="s1:1")
+    store.record("q2", outline(), key="s2:0")
+
+    q1 = store.get("q1")
+    assert q1["submissions"] == 2
+    assert q1["similarity_histogram"][3] == 1 and q1["similarity_histogram"][9] == 1
+    assert q1["top_themes"] == [{"theme": "审题立意", "count": 1}]
+    assert (q1["first_submission_at"], q1["last_submission_at"]) == ("2024-01-01T10:00:00", "2024-01-02T10:00:00")
+    assert sorted(documents.list_ids("analytics")) == ["q1", "q2"]
+    assert set(store.summary()) == {"q1", "q2"}
+    assert store.get("missing") is None
+
+
+def test_concurrent_records_are_not_lost(store):
+    def work():
+        for _ in range(10):
+            store.record("q1", outline())
+
+    workers = [threading.Thread(target=work) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert store.get("q1")["submissions"] == 40
+
+
+def test_rebuild_replaces_aggregates(store):
+    store.record("q1", outline(), key="old:0")
+    store.record("stale", outline(), key="old:1")
+
+    count = store.rebuild([("s1:0", "q1", outline()), ("s1:1", "q1", outline()), ("s2:0", "q2", outline())])
+
+    assert count == 3
+    assert store.get("q1")["submissions"] == 2
+    assert store.get("q2")["submissions"] == 1
+    assert store.get("stale") is None
+
+
+def test_rebuild_merges_submissions_recorded_during_scan(store, documents):
+    def outlines():
+        yield "s1:0", "q1", outline()
+        # 扫描期间到达的提交：s1:1 还会被扫描到，s9:0、s10:0 不会
+        store.record("q1", outline(), key="s1:1")
+        store.record("q1", outline(), key="s9:0")
+        store.record("q3", outline(), key="s10:0")
+        assert len(documents.list_ids(AnalyticsStore.JOURNAL_NAMESPACE)) == 3
+        yield "s1:1", "q1", outline()
+
+    count = store.rebuild(outlines())
+
+    assert count == 4
+    assert store.get("q1")["submissions"] == 3
+    assert store.get("q3")["submissions"] == 1
+    assert documents.list_ids(AnalyticsStore.JOURNAL_NAMESPACE) == []
+    assert not documents.exists(AnalyticsStore.REBUILD_NAMESPACE, "current")
+
+
+def test_failed_rebuild_keeps_aggregates_and_clears_journal(store, documents):
+    store.record("q1", outline(), key="s1:0")
+
+    def outlines():
+        yield "s1:0", "q1", outline()
+        store.record("q1", outline(), key="s1:1")
+        raise RuntimeError("scan failed")
+
+    with pytest.raises(RuntimeError):
+        store.rebuild(outlines())
+
+    assert store.get("q1")["submissions"] == 2
+    assert documents.list_ids(AnalyticsStore.JOURNAL_NAMESPACE) == []
+    assert not documents.exists(AnalyticsStore.REBUILD_NAMESPACE, "current")
+    # 之后的提交不再写日志
+    store.record("q1", outline(), key="s1:2")
+    assert documents.list_ids(AnalyticsStore.JOURNAL_NAMESPACE) == []
+
+
+def test_rebuild_discards_journal_left_by_crashed_rebuild(store, documents):
+    documents.put(AnalyticsStore.JOURNAL_NAMESPACE, "leftover",
+                  {"key": "x:0", "question_id": "q1", "metrics": {}})
+    store.rebuild([("s1:0", "q1", outline())])
+    assert store.get("q1")["submissions"] == 1
+
+
+def test_migrates_legacy_file(tmp_path, documents):
+    legacy_path = tmp_path / "analytics.json"
+    legacy_path.write_text(json.dumps({"questions": {"q1": {**empty_aggregate("q1"), "submissions": 7}}}),
+                           encoding="utf-8")
+    store = AnalyticsStore(documents, LocalLockManager(str(tmp_path / "locks"), timeout=5),
+                           legacy_path=str(legacy_path))
+
+    assert store.get("q1")["submissions"] == 7
+    assert not legacy_path.exists()
+    assert (tmp_path / "analytics.json.migrated").exists()
+
+
+def test_iter_stored_outlines():
+    sessions = {"b": {"question": "q2", "essay_outlines": [outline()]},
+                "a": {"question": "q1", "essay_outlines": [outline(), outline()]}}
+    keys = [(key, question_id) for key, question_id, _ in iter_stored_outlines(sessions, sessions.get)]
+    assert keys == [("a:0", "q1"), ("a:1", "q1"), ("b:0", "q2")]
@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from archive import ArchiveError, SessionArchive
+from storage import LocalLockManager
+
+OLD = time.time() - 90 * 86400
+
+
+def write_session(folder, session_id, mtime=OLD, **fields):
+    path = folder / f"{session_id}.json"
+    path.write_text(json.dumps({"session_id": session_id, **fields}, ensure_ascii=False, indent=2), encoding='utf-8')
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    folder = tmp_path / "sessions"
+    folder.mkdir()
+    return folder
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return SessionArchive(str(tmp_path / "archive"))
+
+
+def test_archive_moves_old_sessions(sessions, archive):
+    write_session(sessions, "old1", note="旧的")
+    write_session(sessions, "old2")
+    write_session(sessions, "new", mtime=time.time())
+
+    report = archive.archive(str(sessions), after_days=30)
+    assert report["archived"] == 2 and report["errors"] == []
+    assert sorted(p.name for p in sessions.iterdir()) == ["new.json"]
+    assert archive.load("old1") == {"session_id": "old1", "note": "旧的"}
+    assert archive.load("new") is None
+    assert archive.contains("old2") and not archive.contains("new")
+    assert archive.stats()["sessions"] == 2
+
+
+@pytest.fixture
+def locks(tmp_path):
+    return LocalLockManager(str(tmp_path / "locks"), timeout=5)
+
+
+def test_skips_session_locked_by_a_submission(sessions, archive, locks):
+    write_session(sessions, "busy")
+    write_session(sessions, "idle")
+    with locks.lock("session:busy"):
+        report = archive.archive(str(sessions), after_days=30,
+                                 lock_session=lambda session_id: locks.lock(f"session:{session_id}", timeout=0))
+    assert report["archived"] == 1 and report["changed_during_archive"] == 1
+    assert (sessions / "busy.json").exists() and not archive.contains("busy")
+    assert archive.contains("idle")
+
+
+def test_write_during_archive_is_not_lost(sessions, archive, locks):
+    """归档持有 session 锁期间到达的提交等到归档完成后再读-改-写，不会被删除文件覆盖"""
+    path = write_session(sessions, "s1", submissions=1)
+    writers = []
+
+    def submit():
+        with locks.lock("session:s1"):
+            data = json.loads(path.read_text(encoding='utf-8')) if path.exists() else archive.load("s1")
+            data["submissions"] += 1
+            path.write_text(json.dumps(data), encoding='utf-8')
+
+    @contextmanager
+    def lock_session(session_id):
+        with locks.lock(f"session:{session_id}", timeout=0):
+            # 归档拿到锁之后到达的提交
+            writer = threading.Thread(target=submit)
+            writer.start()
+            writers.append(writer)
+            time.sleep(0.05)
+            yield
+
+    report = archive.archive(str(sessions), after_days=30, lock_session=lock_session)
+    writers[0].join()
+    assert report["archived"] == 1
+    assert json.loads(path.read_text(encoding='utf-8'))["submissions"] == 2
+
+
+def test_dry_run_changes_nothing(sessions, archive):
+    write_session(sessions, "old1")
+    report = archive.archive(str(sessions), after_days=30, dry_run=True)
+    assert report["archived"] == 1
+    assert (sessions / "old1.json").exists()
+    assert archive.load("old1") is None
+
+
+def test_rearchive_replaces_previous_version(sessions, archive):
+    write_session(sessions, "s1", version=1)
+    archive.archive(str(sessions), after_days=30)
+    write_session(sessions, "s1", version=2)
+    archive.archive(str(sessions), after_days=30)
+    assert archive.load("s1")["version"] == 2
+    assert archive.session_ids() == ["s1"]
+
+
+def test_delete_and_compact(sessions, archive):
+    for i in range(3):
+        write_session(sessions, f"s{i}", text="内容" * 100)
+    archive.archive(str(sessions), after_days=30)
+    size_before = archive.stats()["pack_bytes"]
+
+    assert archive.delete("s1")
+    assert not archive.delete("s1")
+    assert archive.load("s1") is None
+    assert archive.compact()["reclaimed_bytes"] > 0
+    assert archive.stats()["pack_bytes"] < size_before
+    assert archive.load("s0")["text"] == "内容" * 100
+    assert archive.load("s2")["session_id"] == "s2"
+
+
+def test_other_instance_sees_changes(sessions, archive, tmp_path):
+    """归档命令在服务进程外运行时，服务中的实例能读到新的索引"""
+    reader = SessionArchive(str(tmp_path / "archive"))
+    write_session(sessions, "s1")
+    write_session(sessions, "s2")
+    archive.archive(str(sessions), after_days=30)
+    assert reader.load("s2")["session_id"] == "s2"
+    archive.delete("s1")
+    archive.compact()
+    assert reader.load("s1") is None
+    assert reader.load("s2")["session_id"] == "s2"
+
+
+def test_corrupted_record_raises(sessions, archive, tmp_path):
+    write_session(sessions, "s1")
+    archive.archive(str(sessions), after_days=30)
+    pack = next((tmp_path / "archive").glob("*.pack"))
+    pack.write_bytes(b'\0' * pack.stat().st_size)
+    with pytest.raises(ArchiveError):
+        archive.load("s1")
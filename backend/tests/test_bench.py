@@ -0,0 +1,33 @@
+import io
+import json
+
+import requests
+from PIL import Image
+
+from bench.load import make_png
+from bench.stubs import start_llm_stub, start_ocr_stub
+
+
+def test_make_png_varies_with_seed():
+    images = {make_png(seed=f"{user}:{iteration}") for user in range(3) for iteration in range(3)}
+    assert len(images) == 9
+    assert make_png(seed="0:0") == make_png(seed="0:0")
+    assert Image.open(io.BytesIO(make_png(seed="0:0"))).size == (64, 64)
+
+
+def test_stub_responses_depend_on_request():
+    ocr = start_ocr_stub(latency=0)
+    llm = start_llm_stub(latency=0)
+    try:
+        ocr_url = f"http://127.0.0.1:{ocr.server_address[1]}/layout-parsing"
+        llm_url = f"http://127.0.0.1:{llm.server_address[1]}/v1/chat/completions"
+        texts = {requests.post(ocr_url, json={"file": name}).json()["result"]["layoutParsingResults"][0]["markdown"]["text"]
+                 for name in ("a", "b")}
+        assert len(texts) == 2
+        outlines = {requests.post(llm_url, json={"messages": [{"content": text}]}).json()["choices"][0]["message"]["content"]
+                    for text in texts}
+        assert len(outlines) == 2
+        assert all(json.loads(o.split("```json\n")[1].split("\n```")[0])["parts"] for o in outlines)
+    finally:
+        ocr.shutdown()
+        llm.shutdown()
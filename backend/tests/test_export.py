@@ -0,0 +1,162 @@
+import copy
+import gzip
+import io
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+from export import gzip_chunks, import_records, iter_ndjson, iter_records, parse_date, to_ndjson
+
+
+def make_session(session_id, username="alice", outlines=2, imitations=1):
+    return {
+        "session_id": session_id,
+        "username": username,
+        "question": "question_01",
+        "created_at": "2025-03-01T08:00:00Z",
+        "essay_outlines": [{"text_content": f"outline {i}", "submitted_at": f"2025-03-0{i + 1}T09:00:00"}
+                           for i in range(outlines)],
+        "imitation_works": {"1": [{"text_content": f"work {i}", "submitted_at": f"2025-03-0{i + 1}T10:00:00"}
+                                  for i in range(imitations)]},
+        "metadata": {"total_submissions": outlines + imitations}
+    }
+
+
+class MemoryStore:
+    """模拟 app 中的 session 存储和 update_session_data"""
+
+    def __init__(self, sessions=None):
+        self.sessions = {s["session_id"]: copy.deepcopy(s) for s in sessions or []}
+        self.user_sessions = []
+
+    def load(self, session_id):
+        return copy.deepcopy(self.sessions.get(session_id) or {
+            "session_id": session_id, "essay_outlines": [], "imitation_works": {}, "metadata": {"total_submissions": 0}})
+
+    def update(self, session_id, mutate):
+        session_data = self.load(session_id)
+        mutate(session_data)
+        self.sessions[session_id] = session_data
+        return session_data
+
+    def exists(self, session_id):
+        return session_id in self.sessions
+
+    def add_session_to_user(self, username, session_id, session_name, question_id):
+        self.user_sessions.append((username, session_id))
+        return True
+
+    def import_records(self, records, mode):
+        return import_records(records, self.update, self.exists, self.add_session_to_user, mode=mode)
+
+
+def export(store, **filters):
+    return list(iter_records(sorted(store.sessions), store.load, **filters))
+
+
+def test_export_filters():
+    store = MemoryStore([make_session("s1"), make_session("s2", username="bob")])
+    records = export(store, user="alice")
+    assert {r["session_id"] for r in records} == {"s1"}
+    assert [r["type"] for r in records] == ["session", "outline", "outline", "imitation"]
+
+    records = export(store, since=parse_date("2025-03-02"), types=("outline",))
+    assert [(r["session_id"], r["index"]) for r in records] == [("s1", 1), ("s2", 1)]
+
+
+@pytest.fixture
+def shanghai_time(monkeypatch):
+    """将服务器本地时区设为 UTC+8"""
+    monkeypatch.setenv("TZ", "Asia/Shanghai")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_parse_date_converts_offsets_to_local_time(shanghai_time):
+    assert parse_date("2025-03-02T09:00:00") == datetime(2025, 3, 2, 9)
+    assert parse_date("2025-03-02T01:00:00Z") == datetime(2025, 3, 2, 9)
+    assert parse_date("2025-03-02T00:00:00-01:00") == datetime(2025, 3, 2, 9)
+    with pytest.raises(TypeError):
+        parse_date(20250302)
+
+
+def test_export_with_offset_bounds(shanghai_time):
+    store = MemoryStore([make_session("s1", outlines=3)])
+    records = export(store, since=parse_date("2025-03-02T09:00:00+08:00"), until=parse_date("2025-03-03T02:00:00Z"),
+                     types=("outline",))
+    assert [r["index"] for r in records] == [1, 2]
+
+
+def test_export_skips_non_string_timestamps():
+    session = make_session("s1")
+    session["essay_outlines"][1]["submitted_at"] = 1740906000
+    records = export(MemoryStore([session]), since=parse_date("2025-03-01"), types=("outline",))
+    assert [r["index"] for r in records] == [0]
+
+
+def test_round_trip_into_empty_store():
+    source = MemoryStore([make_session("s1"), make_session("s2", username="bob")])
+    target = MemoryStore()
+    stats = target.import_records(export(source), mode='merge')
+    assert stats == {"sessions": 2, "skipped_sessions": 0, "outlines": 4, "imitations": 2}
+    assert target.sessions == source.sessions
+    assert target.user_sessions == [("alice", "s1"), ("bob", "s2")]
+
+
+def test_merge_deduplicates():
+    store = MemoryStore([make_session("s1")])
+    stats = store.import_records(export(MemoryStore([make_session("s1", outlines=3)])), mode='merge')
+    assert stats["outlines"] == 1 and stats["imitations"] == 0
+    assert len(store.sessions["s1"]["essay_outlines"]) == 3
+    assert store.sessions["s1"]["metadata"]["total_submissions"] == 4
+    assert store.user_sessions == []
+
+
+def test_skip_keeps_existing():
+    store = MemoryStore([make_session("s1", outlines=1)])
+    stats = store.import_records(export(MemoryStore([make_session("s1", outlines=3)])), mode='skip')
+    assert stats["skipped_sessions"] == 1 and stats["sessions"] == 0
+    assert len(store.sessions["s1"]["essay_outlines"]) == 1
+
+
+def test_overwrite_replaces_existing():
+    existing = make_session("s1", outlines=3)
+    existing["essay_outlines"][0]["text_content"] = "local only"
+    store = MemoryStore([existing])
+    source = MemoryStore([make_session("s1", outlines=1, imitations=2)])
+    stats = store.import_records(export(source), mode='overwrite')
+    assert stats == {"sessions": 1, "skipped_sessions": 0, "outlines": 1, "imitations": 2}
+    assert store.sessions["s1"] == source.sessions["s1"]
+
+
+def test_overwrite_merges_non_contiguous_records():
+    """同一 session 的记录不连续时，后出现的部分合并到本次已写入的数据中"""
+    store = MemoryStore([make_session("s1", outlines=3)])
+    records = export(MemoryStore([make_session("s1", outlines=2), make_session("s2")]))
+    s1 = [r for r in records if r["session_id"] == "s1"]
+    s2 = [r for r in records if r["session_id"] == "s2"]
+    stats = store.import_records(s1[:2] + s2 + s1[2:], mode='overwrite')
+    assert stats["sessions"] == 2
+    assert [o["text_content"] for o in store.sessions["s1"]["essay_outlines"]] == ["outline 0", "outline 1"]
+    assert store.sessions["s1"]["imitation_works"]["1"][0]["text_content"] == "work 0"
+
+
+def test_import_rejects_invalid_records():
+    with pytest.raises(ValueError):
+        MemoryStore().import_records([{"type": "unknown", "session_id": "s1"}], mode='merge')
+    with pytest.raises(ValueError):
+        MemoryStore().import_records([], mode='replace')
+
+
+def test_ndjson_gzip_round_trip():
+    records = export(MemoryStore([make_session("s1")]))
+    raw = b''.join(gzip_chunks(to_ndjson(records), chunk_size=16))
+    assert json.loads(gzip.decompress(raw).decode('utf-8').splitlines()[0])["type"] == "session"
+    assert list(iter_ndjson(io.BytesIO(raw))) == records
+    assert list(iter_ndjson(io.BytesIO(''.join(to_ndjson(records)).encode('utf-8')))) == records
+    with pytest.raises(ValueError):
+        list(iter_ndjson(io.BytesIO(b'{"type": "session"}\nnot json\n')))
@@ -0,0 +1,154 @@
+import threading
+import time
+
+import pytest
+
+from llm_router import DEFAULT_MAX_TOKENS, LLMProvider, LLMRouter
+
+
+class FakeResponse:
+    def __init__(self, status_code, provider):
+        self.status_code = status_code
+        self.provider = provider
+
+
+class FakeProvider(LLMProvider):
+    """按预设的延迟和状态码响应，不发送网络请求"""
+
+    def __init__(self, name, delay=0.0, status=200, error=None, timeout=10):
+        super().__init__(name, f"http://{name}.invalid/v1/chat/completions", "key", f"{name}-model", timeout=timeout)
+        self.delay = delay
+        self.status = status
+        self.error = error
+        self.payloads = []
+        self.cancelled = threading.Event()
+
+    def post(self, payload):
+        self.payloads.append(payload)
+        if self.cancelled.wait(self.delay):
+            raise ConnectionError("cancelled")
+        if self.error:
+            raise self.error
+        return FakeResponse(self.status, self.name)
+
+
+MESSAGES = [{"role": "user", "content": "提纲"}]
+
+
+@pytest.fixture
+def cleanup():
+    providers = []
+    yield providers
+    for provider in providers:
+        provider.cancelled.set()
+
+
+def make_router(cleanup, *providers, **kwargs):
+    cleanup.extend(providers)
+    return LLMRouter(list(providers), **kwargs)
+
+
+def test_requires_providers():
+    with pytest.raises(ValueError):
+        LLMRouter([])
+
+
+def test_ranks_by_p95(cleanup):
+    slow, fast, fresh = FakeProvider("slow"), FakeProvider("fast"), FakeProvider("fresh")
+    for _ in range(20):
+        slow.record_success(2.0)
+        fast.record_success(0.5)
+    # 单个离群样本不影响 p95
+    fast.record_success(3.0)
+    assert fast.p95() == 0.5
+    router = make_router(cleanup, slow, fast, fresh)
+    # 没有样本的服务商排在最前面以便探测
+    assert [p.name for p in router.ranked_providers()] == ["fresh", "fast", "slow"]
+
+
+def test_failover_on_error_and_status(cleanup):
+    broken = FakeProvider("broken", error=ConnectionError("refused"))
+    erroring = FakeProvider("erroring", status=500)
+    healthy = FakeProvider("healthy")
+    router = make_router(cleanup, broken, erroring, healthy)
+    response = router.chat(MESSAGES)
+    assert response.provider == "healthy"
+    assert broken.failures == 1 and erroring.failures == 1 and healthy.failures == 0
+
+
+def test_returns_last_response_or_raises(cleanup):
+    router = make_router(cleanup, FakeProvider("a", status=502), FakeProvider("b", status=503))
+    assert router.chat(MESSAGES).status_code in (502, 503)
+    router = make_router(cleanup, FakeProvider("c", error=TimeoutError("slow")))
+    with pytest.raises(TimeoutError):
+        router.chat(MESSAGES)
+
+
+def test_cooldown_after_failures(cleanup):
+    provider = FakeProvider("flaky")
+    provider.record_failure(0.01)
+    assert not provider.available()
+    assert provider.cooldown_until - time.monotonic() == pytest.approx(2, abs=0.1)
+    provider.record_failure(0.01)
+    assert provider.cooldown_until - time.monotonic() == pytest.approx(4, abs=0.1)
+    provider.record_success(0.1)
+    assert provider.available() and provider.consecutive_failures == 0
+
+
+def test_cooling_providers_are_ranked_last(cleanup):
+    cooling, healthy = FakeProvider("cooling"), FakeProvider("healthy")
+    cooling.record_failure(0.01)
+    healthy.record_success(5.0)
+    router = make_router(cleanup, cooling, healthy)
+    assert [p.name for p in router.ranked_providers()] == ["healthy", "cooling"]
+    # 全部冷却时仍会尝试冷却中的服务商
+    healthy.cooldown_until = cooling.cooldown_until + 1
+    assert router.chat(MESSAGES).provider == "cooling"
+
+
+def test_fast_failures_count_as_timeout(cleanup):
+    provider = FakeProvider("fast_fail", timeout=30)
+    provider.record_failure(0.01)
+    assert provider.p95() == 30
+
+
+def test_hedges_after_delay(cleanup):
+    slow, backup = FakeProvider("slow", delay=5), FakeProvider("backup")
+    router = make_router(cleanup, slow, backup, hedge_delay=0.05)
+    started = time.monotonic()
+    response = router.chat(MESSAGES)
+    assert response.provider == "backup"
+    assert time.monotonic() - started < 1
+    assert len(slow.payloads) == 1 and len(backup.payloads) == 1
+
+
+def test_no_hedge_when_fast_enough(cleanup):
+    quick, backup = FakeProvider("quick", delay=0.01), FakeProvider("backup")
+    quick.record_success(0.01)
+    backup.record_success(1.0)
+    router = make_router(cleanup, quick, backup, hedge_delay=0.5)
+    assert router.chat(MESSAGES).provider == "quick"
+    assert backup.payloads == []
+
+
+def test_hedging_disabled(cleanup):
+    slow, backup = FakeProvider("slow", delay=0.2), FakeProvider("backup")
+    router = make_router(cleanup, slow, backup, hedge_delay=0)
+    assert router.chat(MESSAGES).provider == "slow"
+    assert backup.payloads == []
+
+
+def test_stage_parameters(cleanup):
+    provider = FakeProvider("p")
+    router = make_router(cleanup, provider, stages={"cmp_outline": {"model": "big", "max_tokens": 4096}})
+    router.chat(MESSAGES, stage="cmp_outline")
+    router.chat(MESSAGES, stage="other", temperature=0.1)
+    first, second = provider.payloads
+    assert (first["model"], first["max_tokens"]) == ("big", 4096)
+    assert (second["model"], second["max_tokens"], second["temperature"]) == ("p-model", DEFAULT_MAX_TOKENS, 0.1)
+
+
+def test_from_config_defaults():
+    router = LLMRouter.from_config({}, "http://default.invalid/v1", "key", "qwen-max")
+    assert [(p.name, p.model) for p in router.providers] == [("default", "qwen-max")]
+    assert router.stats()["hedge_delay"] == 0
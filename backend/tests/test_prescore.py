@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from prescore import OutlinePrescorer, normalize_text, outline_text
+
+QUESTIONS = {
+    "question_01": {
+        "question": "阅读经典，涵养书卷气",
+        "think": "围绕书卷气的内涵和青年如何涵养书卷气展开",
+        "outlines": [{"title": "腹有诗书气自华", "subject": "青年应在阅读经典中涵养书卷气",
+                      "parts": [{"content": "读书使人从容笃定", "quotes": ["腹有诗书气自华"]}]}]
+    },
+    "question_02": {
+        "question": "科技创新与工匠精神",
+        "think": "讨论科技创新离不开精益求精的工匠精神",
+        "outlines": [{"title": "匠心筑梦", "subject": "以工匠精神推动科技创新",
+                      "parts": [{"content": "精益求精是创新的基础", "quotes": []}]}]
+    }
+}
+
+
+@pytest.fixture
+def prescorer(tmp_path):
+    for question_id, data in QUESTIONS.items():
+        (tmp_path / f"{question_id}.json").write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    # 非题目文件被忽略
+    (tmp_path / "index.json").write_text("{}", encoding='utf-8')
+    return OutlinePrescorer(str(tmp_path), {"skip_off_topic": True})
+
+
+def test_helpers():
+    assert normalize_text("书卷气， Hello!") == "书卷气hello"
+    assert outline_text({"subject": "主旨", "parts": [{"content": "内容", "quotes": ["引用", 1]}]}) == "主旨\n内容\n引用"
+    assert outline_text(None) == ''
+
+
+def test_matching_outline_scores_highest(prescorer):
+    result = prescorer.score("question_01", {"subject": "青年要阅读经典，涵养书卷气", "parts": [{"content": "读书使人从容"}]})
+    assert result["verdict"] == "ok"
+    assert result["best_outline_index"] == 0
+    assert result["similarity"] > 0.3
+    assert result["closest_question"] == "question_01"
+    assert not prescorer.should_skip_llm(result)
+
+
+def test_empty_outline(prescorer):
+    result = prescorer.score("question_01", {"subject": "书卷气"})
+    assert result["verdict"] == "empty"
+    assert prescorer.should_skip_llm(result)
+
+
+def test_off_topic_outline(prescorer):
+    result = prescorer.score("question_01", {"subject": "今天天气很好我们去公园散步吧"})
+    assert result["verdict"] == "off_topic"
+    assert prescorer.should_skip_llm(result)
+
+
+def test_other_question_is_closest(prescorer):
+    result = prescorer.score("question_01", {"subject": "以精益求精的工匠精神推动科技创新"})
+    assert result["closest_question"] == "question_02"
+
+
+def test_unknown_question(prescorer):
+    result = prescorer.score("question_99", {"subject": "青年应在阅读经典中涵养书卷气"})
+    assert result["verdict"] == "ok"
+    assert result["outlines"] == [] and result["closest_question"] is None
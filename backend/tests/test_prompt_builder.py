@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from prompt_builder import (TRUNCATED_MARK, compact_json, estimate_tokens, fill_template, normalize_ocr_text,
+                            trim_std_outlines, truncate_text)
+
+
+def make_outline(title, parts=3, example="例子" * 200, content="论证内容"):
+    return {
+        "title": title,
+        "subject": "阐述书卷气的内涵及新时代青年涵养书卷气的重要性和途径",
+        "parts": [{"part_title": f"第{i}部分", "content": content, "quotes": ["腹有诗书气自华"],
+                   "example_content": example} for i in range(parts)]
+    }
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("书卷气") == 3
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_compact_json():
+    assert compact_json({"a": [1, "书"]}) == '{"a":[1,"书"]}'
+
+
+def test_truncate_text_respects_budget():
+    text = "书卷气" * 100
+    assert truncate_text(text, 1000) == text
+    truncated = truncate_text(text, 50)
+    assert truncated.endswith(TRUNCATED_MARK)
+    assert estimate_tokens(truncated) <= 50
+
+
+def test_normalize_ocr_text():
+    assert normalize_ocr_text("  第一段\t 文字\n\n\n\n第二段  ") == "第一段 文字\n\n第二段"
+
+
+def test_outlines_within_budget_are_unchanged():
+    outlines = [make_outline("标题", example="短例子")]
+    assert trim_std_outlines(outlines, 2000) is outlines
+
+
+def test_examples_are_shortened_before_dropping_outlines():
+    outlines = [make_outline("标题一"), make_outline("标题二")]
+    trimmed = trim_std_outlines(outlines, 1200)
+    assert [o["title"] for o in trimmed] == ["标题一", "标题二"]
+    assert estimate_tokens(compact_json(trimmed)) <= 1200
+    # 不修改原始数据
+    assert outlines[0]["parts"][0]["example_content"] == "例子" * 200
+
+
+def test_outlines_are_dropped_from_the_end():
+    outlines = [make_outline(f"标题{i}", example="") for i in range(5)]
+    budget = estimate_tokens(compact_json(outlines[:2])) + 5
+    trimmed = trim_std_outlines(outlines, budget)
+    assert [o["title"] for o in trimmed] == ["标题0", "标题1"]
+
+
+@pytest.mark.parametrize("budget", [300, 120, 60])
+def test_single_outline_over_budget_is_truncated(budget):
+    outlines = [make_outline("标题", parts=8, content="论证内容" * 100)]
+    trimmed = trim_std_outlines(outlines, budget)
+    assert trimmed and trimmed[0]["title"] == "标题"
+    assert estimate_tokens(compact_json(trimmed)) <= budget
+
+
+def test_outline_that_cannot_fit_is_dropped():
+    outlines = [make_outline("很长的标题" * 50, parts=1, content="论证内容" * 100)]
+    assert trim_std_outlines(outlines, 10) == []
+
+
+def test_fill_template():
+    prompt = fill_template("提纲：$USER_OUTLINE\n思路：$STD_THINKING", {
+        "$USER_OUTLINE": compact_json({"subject": "主旨"}), "$STD_THINKING": "思路"}, stage='test')
+    assert prompt == '提纲：{"subject":"主旨"}\n思路：思路'
+    assert json.loads(prompt.splitlines()[0][3:]) == {"subject": "主旨"}
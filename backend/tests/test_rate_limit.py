@@ -0,0 +1,88 @@
+import threading
+import time
+
+from rate_limit import DEFAULT_RATE_LIMITS, AdmissionController, RateLimiter, TokenBucket, merge_limits
+
+
+def test_merge_limits_keeps_defaults_for_missing_fields():
+    limits = merge_limits({"ocr": {"burst": 10}, "max_queue": 4})
+    assert limits["ocr"] == {"rate": DEFAULT_RATE_LIMITS["ocr"]["rate"], "burst": 10}
+    assert limits["llm"] == DEFAULT_RATE_LIMITS["llm"]
+    assert limits["max_queue"] == 4
+    assert limits["proxy_hops"] == 0
+    # 不修改默认值
+    assert DEFAULT_RATE_LIMITS["ocr"]["burst"] == 3
+
+
+def test_token_bucket_refill_is_capped():
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.tokens = 0
+    bucket.refill(bucket.updated + 10)
+    assert bucket.tokens == 2
+    # 早于上次更新时间的 now 不扣减令牌
+    bucket.refill(bucket.updated - 5)
+    assert bucket.tokens == 2
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(rate=0.5, capacity=2)
+    bucket.tokens = 1
+    assert bucket.wait_time(1) == 0.0
+    assert bucket.wait_time(2) == 2.0
+    assert TokenBucket(rate=0, capacity=1).wait_time(2) == float('inf')
+
+
+def test_acquire_rejects_when_burst_exhausted():
+    limiter = RateLimiter(merge_limits({"ocr": {"rate": 0.001, "burst": 2}}))
+    assert limiter.acquire("alice", {"ocr": 1}) == (True, 0.0)
+    assert limiter.acquire("alice", {"ocr": 1}) == (True, 0.0)
+    allowed, retry_after = limiter.acquire("alice", {"ocr": 1})
+    assert not allowed and retry_after > 0
+    # 每个 key 独立计费
+    assert limiter.acquire("bob", {"ocr": 1})[0]
+    assert limiter.stats()["rejected"]["ocr"] == 1
+
+
+def test_acquire_is_all_or_nothing():
+    limiter = RateLimiter(merge_limits({"ocr": {"rate": 0.001, "burst": 5}, "llm": {"rate": 0.001, "burst": 1}}))
+    assert not limiter.acquire("alice", {"ocr": 1, "llm": 2})[0]
+    # llm 不足时 ocr 也不扣除
+    assert limiter.buckets[("ocr", "alice")].tokens == 5
+
+
+def test_refund_restores_tokens():
+    limiter = RateLimiter(merge_limits({"llm": {"rate": 0.001, "burst": 2}}))
+    assert limiter.acquire("alice", {"llm": 2})[0]
+    assert not limiter.acquire("alice", {"llm": 1})[0]
+    limiter.refund("alice", {"llm": 2})
+    assert limiter.acquire("alice", {"llm": 2})[0]
+    assert limiter.stats()["refunded"] == 1
+
+
+def test_admission_rejects_when_queue_full():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=1)
+    assert controller.acquire() == (True, 0.0)
+    allowed, retry_after = controller.acquire()
+    assert not allowed and retry_after > 0
+    assert controller.stats()["rejected_queue_full"] == 1
+
+
+def test_admission_times_out_in_queue():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.05)
+    assert controller.acquire()[0]
+    assert not controller.acquire()[0]
+    assert controller.stats()["rejected_timeout"] == 1
+
+
+def test_admission_admits_waiter_after_release():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+    assert controller.acquire()[0]
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(controller.acquire()))
+    waiter.start()
+    while controller.stats()["waiting"] == 0:
+        time.sleep(0.001)
+    controller.release(0.1)
+    waiter.join()
+    assert results == [(True, 0.0)]
+    assert controller.stats()["queued"] == 1
@@ -0,0 +1,125 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import regrade
+from scheduler import SchedulerRejected
+from storage import JobStore, LocalDocumentStore
+
+
+def outline(submitted_at, text="提纲"):
+    return {"structured_content": {"subject": text}, "submitted_at": submitted_at, "cmp": {"score": 1}}
+
+
+SESSIONS = {
+    "s1": {"question": "question_01", "essay_outlines": [outline("2025-03-01T10:00:00"), outline("2025-03-02T10:00:00")]},
+    "s2": {"question": "question_01", "essay_outlines": [outline("bad date"), {"structured_content": {}}]},
+    "s3": {"question": "question_02", "essay_outlines": [outline("2025-03-01T10:00:00")]},
+}
+
+
+class FakeBackend:
+    def __init__(self, folder):
+        self.DATA_FOLDER = str(folder)
+        self.storage = SimpleNamespace(jobs=JobStore(LocalDocumentStore(str(folder)), ttl=60))
+        self.failing = set()
+        self.calls = []
+
+    def list_session_ids(self):
+        return list(SESSIONS)
+
+    def load_session_data(self, session_id):
+        return SESSIONS[session_id]
+
+    def cmp_outline(self, structured_content, session_id, prompt_file):
+        self.calls.append(session_id)
+        if session_id in self.failing:
+            return {"success": False, "error": "LLM API request failed with status 500"}
+        return {"success": True, "judgement": {"score": 2}}
+
+
+def make_args(**overrides):
+    args = dict(run="v2", question="question_01", session=None, since="2025-01-01", until=None,
+                prompt="ai_cmp_outline.txt", concurrency=2, rate=0, limit=0)
+    args.update(overrides)
+    return SimpleNamespace(**args)
+
+
+def read_results(backend):
+    with open(f"{backend.DATA_FOLDER}/regrade/v2/results.jsonl", encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resume_skips_finished_and_retries_failed(tmp_path):
+    backend = FakeBackend(tmp_path)
+    backend.failing = {"s1"}
+    regrade.run(make_args(), backend)
+    results = read_results(backend)
+    # s1 的两条失败，s2 的日期无法解析，s3 不属于该题目
+    assert sorted((r["session_id"], r["index"], r["success"]) for r in results) == [
+        ("s1", 0, False), ("s1", 1, False), ("s2", 0, False)]
+    job = backend.storage.jobs.get("regrade:v2")
+    assert (job["state"], job["total"], job["failed"]) == ("done", 3, 3)
+
+    backend.failing = set()
+    backend.calls = []
+    regrade.run(make_args(), backend)
+    assert backend.calls == ["s1", "s1"]
+    results = read_results(backend)
+    # 无效记录已记入检查点，不会重复写入
+    assert [(r["session_id"], r["success"]) for r in results[3:]] == [("s1", True), ("s1", True)]
+
+    backend.calls = []
+    regrade.run(make_args(), backend)
+    assert backend.calls == [] and len(read_results(backend)) == 5
+    assert backend.storage.jobs.get("regrade:v2")["total"] == 0
+
+
+def test_limit(tmp_path):
+    backend = FakeBackend(tmp_path)
+    regrade.run(make_args(limit=1, since=None), backend)
+    assert len(backend.calls) == 1
+
+
+def test_scheduler_rejection_is_retried(monkeypatch):
+    monkeypatch.setattr(regrade, "RETRY_BACKOFF", 0)
+    attempts = []
+
+    def cmp_outline(structured_content, session_id, prompt_file):
+        attempts.append(session_id)
+        if len(attempts) < 3:
+            raise SchedulerRejected("llm", "preempted", "batch")
+        return {"success": True, "judgement": {}}
+
+    record = regrade.regrade_one(cmp_outline, "s1", 0, outline(""), "p.txt", regrade.RateLimiter(0), "v2")
+    assert record["success"] and len(attempts) == 3
+
+    def always_rejected(structured_content, session_id, prompt_file):
+        attempts.append(session_id)
+        raise SchedulerRejected("llm", "timeout", "batch")
+
+    attempts.clear()
+    record = regrade.regrade_one(always_rejected, "s1", 0, outline(""), "p.txt", regrade.RateLimiter(0), "v2", retries=1)
+    assert not record["success"] and "timeout" in record["error"] and len(attempts) == 2
+
+
+def test_other_errors_are_not_retried():
+    attempts = []
+
+    def cmp_outline(structured_content, session_id, prompt_file):
+        attempts.append(1)
+        return {"success": False, "error": "scheduler rejected by upstream proxy"}
+
+    record = regrade.regrade_one(cmp_outline, "s1", 0, outline(""), "p.txt", regrade.RateLimiter(0), "v2")
+    assert not record["success"] and attempts == [1]
+
+
+@pytest.mark.parametrize("since, expected, invalid_count", [(None, 3, 0), ("2025-03-02", 1, 1)])
+def test_iter_outlines_date_filter(since, expected, invalid_count):
+    """未指定日期范围时不检查 submitted_at；没有结构化提纲的记录总是跳过"""
+    invalid = []
+    outlines = list(regrade.iter_outlines(SESSIONS, SESSIONS.get, question="question_01",
+                                          since=regrade.parse_date(since), invalid=invalid))
+    assert len(outlines) == expected
+    assert len(invalid) == invalid_count
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import PriorityScheduler, SchedulerRejected, current_priority, work_priority
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def queue_depth(scheduler, cls):
+    return scheduler.stats()["classes"][cls]["queue_depth"]
+
+
+def test_work_priority_context():
+    assert current_priority() == ('interactive', None)
+    with work_priority('batch', user='alice'):
+        assert current_priority() == ('batch', 'alice')
+    assert current_priority() == ('interactive', None)
+    with pytest.raises(ValueError):
+        with work_priority('urgent'):
+            pass
+
+
+def test_slot_grants_and_releases():
+    scheduler = PriorityScheduler("test", concurrency=2)
+    with scheduler.slot('interactive', 'alice'):
+        assert scheduler.in_flight == 1
+    assert scheduler.in_flight == 0
+    assert scheduler.stats()["classes"]["interactive"]["started"] == 1
+
+
+def test_queue_timeout():
+    scheduler = PriorityScheduler("test", concurrency=1, classes={"batch": {"queue_timeout": 0.05}})
+    scheduler.acquire('interactive')
+    with pytest.raises(SchedulerRejected) as excinfo:
+        scheduler.acquire('batch')
+    assert excinfo.value.reason == "timeout"
+    assert scheduler.stats()["classes"]["batch"]["timed_out"] == 1
+
+
+def test_queue_full_preempts_lower_priority():
+    scheduler = PriorityScheduler("test", concurrency=1, max_queue=1)
+    scheduler.acquire('interactive')
+    errors = []
+
+    def batch():
+        try:
+            scheduler.acquire('batch')
+        except SchedulerRejected as e:
+            errors.append(e.reason)
+
+    thread = threading.Thread(target=batch)
+    thread.start()
+    wait_for(lambda: queue_depth(scheduler, 'batch') == 1)
+
+    granted = []
+    interactive = threading.Thread(target=lambda: granted.append(scheduler.acquire('interactive', 'bob')))
+    interactive.start()
+    thread.join(5)
+    assert errors == ["preempted"]
+
+    scheduler.release('interactive')
+    interactive.join(5)
+    assert granted == [None]
+    assert scheduler.stats()["classes"]["batch"]["preempted"] == 1
+
+
+def test_queue_full_rejects_same_priority():
+    scheduler = PriorityScheduler("test", concurrency=1, max_queue=1)
+    scheduler.acquire('batch')
+    thread = threading.Thread(target=lambda: scheduler.acquire('batch'))
+    thread.start()
+    wait_for(lambda: queue_depth(scheduler, 'batch') == 1)
+    with pytest.raises(SchedulerRejected) as excinfo:
+        scheduler.acquire('batch')
+    assert excinfo.value.reason == "queue full"
+    scheduler.release('batch')
+    thread.join(5)
+
+
+def test_users_are_served_round_robin():
+    scheduler = PriorityScheduler("test", concurrency=1)
+    scheduler.acquire('interactive', 'holder')
+    order = []
+    lock = threading.Lock()
+
+    def run(user):
+        scheduler.acquire('interactive', user)
+        with lock:
+            order.append(user)
+        scheduler.release('interactive')
+
+    # alice 先排入三个任务，bob 之后排入一个
+    threads = []
+    for user in ('alice', 'alice', 'alice', 'bob'):
+        thread = threading.Thread(target=run, args=(user,))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: queue_depth(scheduler, 'interactive') == len(threads))
+    scheduler.release('interactive')
+    for thread in threads:
+        thread.join(5)
+    assert order.index('bob') <= 1
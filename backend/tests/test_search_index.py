@@ -0,0 +1,109 @@
+import pytest
+
+from search_index import SearchIndex, imitation_document, outline_document, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SearchIndex(str(tmp_path / "search"), compact_threshold=1000)
+
+
+def add_work(index, session_id, imitid, position, text, question_id="question_01"):
+    index.add(*imitation_document(session_id, question_id, imitid, position, {"text_content": text}))
+
+
+def keys(results):
+    return [doc["key"] for _, doc in results]
+
+
+def test_tokenize_mixes_cjk_bigrams_and_words():
+    tokens = tokenize("书卷气 AI")
+    assert "书卷" in tokens and "卷气" in tokens and "ai" in tokens
+
+
+def test_add_and_search(index):
+    add_work(index, "s1", "1", 0, "腹有诗书气自华")
+    add_work(index, "s2", "1", 0, "科技创新需要工匠精神")
+    index.add(*outline_document("s3", "question_02", 0, {"text_content": "工匠精神", "structured_content": {}}))
+
+    total, results = index.search("工匠精神")
+    assert total == 2
+    assert set(keys(results)) == {"imitation:s2:1:0", "outline:s3:0"}
+    total, results = index.search("工匠精神", kind="imitation")
+    assert keys(results) == ["imitation:s2:1:0"]
+    assert index.search("工匠精神", question_id="question_02")[0] == 1
+    assert index.search("不存在的词语") == (0, [])
+
+
+def test_same_key_replaces_document(index):
+    add_work(index, "s1", "1", 0, "第一稿书卷气")
+    add_work(index, "s1", "1", 0, "第二稿工匠精神")
+    assert index.search("书卷气")[0] == 0
+    assert index.search("工匠")[0] == 1
+    assert index.stats()["documents"] == 1
+
+
+def test_delete_session(index):
+    add_work(index, "s1", "1", 0, "书卷气")
+    add_work(index, "s1", "2", 0, "书卷气")
+    add_work(index, "s2", "1", 0, "书卷气")
+    index.delete_session("s1")
+    total, results = index.search("书卷气")
+    assert total == 1 and keys(results) == ["imitation:s2:1:0"]
+
+
+def test_compact_preserves_results(index, tmp_path):
+    for i in range(20):
+        add_work(index, f"s{i}", "1", 0, f"书卷气 第{i}篇" + (" 工匠精神" if i % 2 else ""))
+    index.delete_session("s1")
+    before = index.search("工匠精神", page_size=50)
+    index.compact()
+    stats = index.stats()
+    assert stats["delta_documents"] == 0 and stats["deleted_documents"] == 0
+    assert index.search("工匠精神", page_size=50) == before
+    assert before[0] == 9
+
+    # 重新打开时从基础段加载
+    reopened = SearchIndex(str(tmp_path / "search"))
+    assert reopened.search("工匠精神", page_size=50) == before
+
+
+def test_automatic_compaction(tmp_path):
+    index = SearchIndex(str(tmp_path / "search"), compact_threshold=5)
+    for i in range(12):
+        add_work(index, f"s{i}", "1", 0, "书卷气")
+    assert index.stats()["delta_documents"] < 5
+    assert index.search("书卷气", page_size=20)[0] == 12
+
+
+def test_pagination(index):
+    for i in range(25):
+        add_work(index, f"s{i}", "1", 0, "书卷气" * (i + 1))
+    total, first = index.search("书卷气", page=1, page_size=10)
+    _, third = index.search("书卷气", page=3, page_size=10)
+    assert total == 25 and len(first) == 10 and len(third) == 5
+    assert not set(keys(first)) & set(keys(third))
+
+
+def test_other_instance_sees_writes(index, tmp_path):
+    """多个 worker 进程共用同一个索引目录"""
+    other = SearchIndex(str(tmp_path / "search"))
+    add_work(index, "s1", "1", 0, "书卷气")
+    assert other.search("书卷气")[0] == 1
+    add_work(other, "s2", "1", 0, "书卷气")
+    index.compact()
+    assert other.search("书卷气")[0] == 2
+    assert index.search("书卷气")[0] == 2
+
+
+def test_rebuild_if_empty_rechecks_under_lock(tmp_path):
+    """两个 worker 同时启动时都看到空索引，后重建的一方不能覆盖先启动一方已写入的提交"""
+    first = SearchIndex(str(tmp_path / "search"))
+    second = SearchIndex(str(tmp_path / "search"))
+    qbank = [({"key": "question:q1", "kind": "question", "question_id": "q1"}, "书卷气")]
+
+    assert first.rebuild_if_empty(qbank) == 1
+    add_work(first, "s1", "1", 0, "书卷气")
+    assert second.rebuild_if_empty(qbank) is None
+    assert second.search("书卷气")[0] == 2
+    assert first.search("书卷气")[0] == 2
@@ -0,0 +1,53 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, make_key
+
+
+def test_make_key_is_stable():
+    assert make_key("ocr", {"b": 1, "a": 2}) == make_key("ocr", {"a": 2, "b": 1})
+    assert make_key("ocr", 1) != make_key("ocr", 2)
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight("test")
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", work)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", work))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    while flight.stats()["coalesced_calls"] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"upstream_calls": 1, "coalesced_calls": 4, "in_flight": 0}
+
+
+def test_exceptions_propagate_and_are_not_cached():
+    flight = SingleFlight("test")
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.do("k", fail)
+    assert flight.do("k", lambda: 42) == 42
+    assert flight.stats()["upstream_calls"] == 2
@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from ocr_backends import LocalPaddleOCRBackend
+from startup import FileCache, StartupMonitor, validate_config
+
+
+def make_monitor(**options):
+    now = time.monotonic()
+    monitor = StartupMonitor(now, now, {"timeout": 0.5, "cache_seconds": 60, **options})
+    monitor.run_checks({"config": lambda: ([], [])})
+    monitor.finish()
+    return monitor
+
+
+# ---- FileCache ----
+
+def test_file_cache_reloads_after_change(tmp_path):
+    path = tmp_path / "question.json"
+    path.write_text(json.dumps({"question": "旧题"}), encoding="utf-8")
+    parses = []
+    cache = FileCache(lambda text: parses.append(text) or json.loads(text))
+
+    assert cache.get(str(path)) == {"question": "旧题"}
+    assert cache.get(str(path)) == {"question": "旧题"}
+    assert len(parses) == 1
+
+    path.write_text(json.dumps({"question": "新题目"}), encoding="utf-8")
+    os.utime(path, ns=(time.time_ns() + 10 ** 9,) * 2)
+    assert cache.get(str(path)) == {"question": "新题目"}
+    assert len(parses) == 2
+
+
+def test_file_cache_returns_copies(tmp_path):
+    path = tmp_path / "question.json"
+    path.write_text(json.dumps({"outlines": []}), encoding="utf-8")
+    cache = FileCache(json.loads)
+    cache.get(str(path))["outlines"].append("改动")
+    assert cache.get(str(path)) == {"outlines": []}
+
+
+# ---- validate_config ----
+
+def test_validate_config():
+    errors, warnings = validate_config({}, "", "", "")
+    assert errors == ["PADDLE_OCR_API_URL 未配置"]
+    assert "config.json 不存在，使用默认配置" in warnings
+
+    errors, warnings = validate_config({"RATE_LIMITS": [], "LLM_PROVIDERS": [{"name": "a", "api_key": "your_key"}]},
+                                       "http://ocr", "token", "")
+    assert errors == ["RATE_LIMITS 应为 JSON 对象"]
+    assert warnings == ["LLM 服务商 a 的 api_key 未配置或仍为示例值"]
+
+    assert validate_config({"OCR_BACKEND": "local"}, "", "", "sk-real") == ([], [])
+
+
+# ---- 就绪检查 ----
+
+def test_readiness_reports_failures():
+    monitor = make_monitor()
+    monitor.run_checks({"qbank": lambda: (["question_01.json 缺少 question 字段"], [])})
+    monitor.set_probes({"ocr": lambda timeout: {"reachable": False, "error": "refused"}})
+    ready, details = monitor.readiness()
+    assert not ready
+    assert details["reasons"] == ["check 'qbank' failed", "upstream 'ocr' unreachable"]
+
+
+def test_probes_receive_timeout_and_results_are_cached():
+    monitor = make_monitor()
+    calls = []
+    monitor.set_probes({"llm": lambda timeout: calls.append(timeout) or {"reachable": True}})
+    assert monitor.readiness()[0]
+    assert monitor.readiness()[0]
+    assert calls == [0.5]
+
+
+def test_slow_probe_does_not_block_other_requests():
+    monitor = make_monitor(cache_seconds=0)
+    release = threading.Event()
+    calls = []
+
+    def slow(timeout):
+        calls.append(timeout)
+        if len(calls) > 1:
+            release.wait(5)
+        return {"reachable": True}
+
+    monitor.set_probes({"ocr": slow})
+    assert monitor.upstream_status() == {"ocr": {"reachable": True}}
+
+    refresher = threading.Thread(target=monitor.upstream_status)
+    refresher.start()
+    while len(calls) < 2:
+        time.sleep(0.01)
+    # 检查进行中时其他请求立即返回上一次的结果
+    started = time.monotonic()
+    assert monitor.upstream_status() == {"ocr": {"reachable": True}}
+    assert time.monotonic() - started < 0.2
+    assert len(calls) == 2
+    release.set()
+    refresher.join()
+
+
+def test_probe_ignoring_timeout_counts_as_unreachable():
+    monitor = make_monitor(timeout=0.1)
+    hang = threading.Event()
+    monitor.set_probes({"ocr": lambda timeout: hang.wait(5) and {"reachable": True}})
+    started = time.monotonic()
+    assert monitor.upstream_status() == {"ocr": {"reachable": False, "error": "probe timed out"}}
+    assert time.monotonic() - started < 2
+    hang.set()
+
+
+def test_local_ocr_probe_uses_probe_timeout():
+    class StuckExecutor:
+        def submit(self, fn):
+            return Future()
+
+    backend = LocalPaddleOCRBackend.__new__(LocalPaddleOCRBackend)
+    backend.workers, backend.timeout, backend.lock = 2, 120, threading.Lock()
+    backend.executor = None
+    assert backend.probe(timeout=0.1)["started"] is False
+
+    backend.executor = StuckExecutor()
+    started = time.monotonic()
+    result = backend.probe(timeout=0.1)
+    assert result["reachable"] is False
+    assert time.monotonic() - started < 1
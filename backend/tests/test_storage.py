@@ -0,0 +1,248 @@
+import os
+import threading
+import time
+
+import pytest
+
+from bench.redis_stub import start_redis_stub
+from storage import (JobStore, LocalDocumentStore, LocalLockManager, LockTimeout, RedisClient,
+                     RedisDocumentStore, RedisError, RedisLockManager, create_storage)
+
+
+@pytest.fixture(scope='module')
+def redis_url():
+    server = start_redis_stub()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(redis_url):
+    client = RedisClient(redis_url, pool_size=4)
+    client.execute('FLUSHDB')
+    return client
+
+
+def count_under_lock(locks, threads=8, rounds=10):
+    """多个线程在锁内做非原子的读-改-写，返回最终计数"""
+    counter = {"value": 0}
+
+    def work():
+        for _ in range(rounds):
+            with locks.lock("counter"):
+                value = counter["value"]
+                time.sleep(0.0005)
+                counter["value"] = value + 1
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return counter["value"]
+
+
+# ---- RESP 客户端 ----
+
+def test_client_execute(client):
+    assert client.execute('PING') == 'PONG'
+    assert client.execute('SET', 'k', '值') == 'OK'
+    assert client.execute('GET', 'k') == '值'.encode('utf-8')
+    assert client.execute('GET', 'missing') is None
+    assert client.execute('SADD', 's', 'a', 'b') == 2
+    assert sorted(client.execute('SMEMBERS', 's')) == [b'a', b'b']
+
+
+def test_client_error_reply(client):
+    with pytest.raises(RedisError):
+        client.execute('NOSUCHCOMMAND')
+    # 出错的连接被丢弃，之后的命令不受影响
+    assert client.execute('PING') == 'PONG'
+
+
+def test_client_transaction(client):
+    assert client.transaction(('SET', 'a', '1'), ('SADD', 'ids', 'a'), ('GET', 'a')) == ['OK', 1, b'1']
+
+
+def test_client_pools_connections(client):
+    def ping():
+        for _ in range(20):
+            assert client.execute('PING') == 'PONG'
+
+    workers = [threading.Thread(target=ping) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert client.pool.qsize() <= 4
+
+
+def test_client_rejects_other_schemes():
+    with pytest.raises(ValueError):
+        RedisClient("http://127.0.0.1:6379")
+
+
+# ---- 文档存储 ----
+
+def test_redis_document_store(client):
+    documents = RedisDocumentStore(client, "test:")
+    assert documents.get('sessions', 's1') is None
+    documents.put('sessions', 's1', {"name": "作文"})
+    documents.put('sessions', 's2', {"name": "仿写"})
+    assert documents.get('sessions', 's1') == {"name": "作文"}
+    assert documents.exists('sessions', 's1')
+    assert sorted(documents.list_ids('sessions')) == ['s1', 's2']
+
+    assert documents.delete('sessions', 's1')
+    assert not documents.delete('sessions', 's1')
+    assert documents.get('sessions', 's1') is None
+    assert documents.list_ids('sessions') == ['s2']
+
+
+def test_redis_document_ttl(client):
+    documents = RedisDocumentStore(client, "test:")
+    documents.put('jobs', 'j1', {"state": "ocr"}, ttl=1)
+    # 带 ttl 的文档不登记到 ids 集合
+    assert documents.list_ids('jobs') == []
+    assert documents.get('jobs', 'j1') == {"state": "ocr"}
+    time.sleep(1.05)
+    assert documents.get('jobs', 'j1') is None
+
+
+def test_local_document_store(tmp_path):
+    documents = LocalDocumentStore(str(tmp_path))
+    assert documents.get('users', 'alice') is None
+    documents.put('users', 'alice', {"sessions": []})
+    assert documents.get('users', 'alice') == {"sessions": []}
+    assert documents.list_ids('users') == ['alice']
+    assert documents.delete('users', 'alice') and not documents.exists('users', 'alice')
+
+
+# ---- 锁 ----
+
+def test_redis_lock_mutual_exclusion(client):
+    assert count_under_lock(RedisLockManager(client, "test:", ttl=5, timeout=10)) == 80
+
+
+def test_redis_lock_timeout(client):
+    locks = RedisLockManager(client, "test:", ttl=5, timeout=0.05)
+    with locks.lock("s1"):
+        started = time.monotonic()
+        with pytest.raises(LockTimeout):
+            with locks.lock("s1"):
+                pass
+        assert time.monotonic() - started < 1
+        # 其他名称的锁不受影响
+        with locks.lock("s2"):
+            pass
+    with locks.lock("s1"):
+        pass
+
+
+def test_redis_lock_released_after_ttl(client):
+    locks = RedisLockManager(client, "test:", ttl=0.05, timeout=1)
+    with locks.lock("s1"):
+        time.sleep(0.1)
+        # 持有者超时后锁自动释放，其他节点可以获取
+        with locks.lock("s1", ttl=5):
+            pass
+    assert client.execute('GET', 'test:lock:s1') is None
+
+
+def test_redis_lock_expired_release_keeps_new_holder(client):
+    """过期后才释放的持有者不能删除其他持有者的锁"""
+    locks = RedisLockManager(client, "test:", ttl=0.05, timeout=1)
+    other = RedisLockManager(client, "test:", ttl=5, timeout=0.05)
+    with locks.lock("s1"):
+        time.sleep(0.1)
+        holder = other.lock("s1")
+        holder.__enter__()
+    try:
+        assert client.execute('GET', 'test:lock:s1') is not None
+        with pytest.raises(LockTimeout):
+            with other.lock("s1"):
+                pass
+    finally:
+        holder.__exit__(None, None, None)
+    assert client.execute('GET', 'test:lock:s1') is None
+
+
+def test_redis_lock_release_failure_is_logged(client, monkeypatch, caplog):
+    """释放失败不能让锁内已完成的写入报错，锁在 ttl 后过期"""
+    locks = RedisLockManager(client, "test:", ttl=0.1, timeout=1)
+
+    def broken_connection():
+        raise RedisError("connection reset")
+
+    with locks.lock("s1"):
+        client.execute('SET', 'test:doc', 'written')
+        monkeypatch.setattr(client, 'connection', broken_connection)
+    monkeypatch.undo()
+    assert "Failed to release lock test:lock:s1" in caplog.text
+    assert client.execute('GET', 'test:doc') == b'written'
+    time.sleep(0.15)
+    with locks.lock("s1", timeout=0):
+        pass
+
+
+def test_local_lock(tmp_path):
+    locks = LocalLockManager(str(tmp_path), timeout=10)
+    assert count_under_lock(locks) == 80
+    short = LocalLockManager(str(tmp_path), timeout=0.05)
+    with locks.lock("session:s1"):
+        with pytest.raises(LockTimeout):
+            with short.lock("session:s1"):
+                pass
+    assert os.listdir(tmp_path) == []
+
+
+def test_local_lock_files_removed_under_contention(tmp_path):
+    """释放时删除锁文件，等待者重新打开新文件后仍然互斥"""
+    locks = LocalLockManager(str(tmp_path), timeout=10)
+    assert count_under_lock(locks, threads=16, rounds=20) == 320
+    with locks.lock("user:alice"), locks.lock("session:s1"):
+        assert sorted(os.listdir(tmp_path)) == ["session_s1.lock", "user_alice.lock"]
+    assert os.listdir(tmp_path) == []
+
+
+# ---- 任务状态 ----
+
+@pytest.fixture(params=['local', 'redis'])
+def jobs(request, tmp_path, client):
+    if request.param == 'local':
+        return JobStore(LocalDocumentStore(str(tmp_path)), ttl=60)
+    return JobStore(RedisDocumentStore(client, "test:"), ttl=60)
+
+
+def test_job_update_merges_fields(jobs):
+    jobs.start("j1", kind="imitation", state="ocr")
+    jobs.update("j1", state="done")
+    job = jobs.get("j1")
+    assert job["kind"] == "imitation" and job["state"] == "done"
+    assert job["node"] == jobs.node and job["expires_at"] > time.time()
+    assert jobs.get("missing") is None
+
+
+def test_job_start_replaces_previous_run(jobs):
+    jobs.start("regrade:run1", state="running", failed=3)
+    jobs.update("regrade:run1", state="done")
+    jobs.start("regrade:run1", state="running")
+    assert "failed" not in jobs.get("regrade:run1")
+
+
+def test_expired_jobs(tmp_path):
+    documents = LocalDocumentStore(str(tmp_path))
+    jobs = JobStore(documents, ttl=-1)
+    jobs.start("j1", state="ocr")
+    assert jobs.get("j1") is None
+    jobs.prune()
+    assert documents.list_ids('jobs') == []
+
+
+def test_create_storage(tmp_path, redis_url):
+    assert create_storage(None, str(tmp_path)).name == 'local'
+    storage = create_storage({"backend": "redis", "redis_url": redis_url}, str(tmp_path))
+    assert storage.probe()["reachable"]
+    with pytest.raises(ValueError):
+        create_storage({"backend": "s3"}, str(tmp_path))
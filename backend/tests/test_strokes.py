@@ -0,0 +1,57 @@
+import io
+import json
+
+import pytest
+from PIL import Image
+
+from strokes import decode_strokes, rasterize_strokes
+
+
+def payload(**overrides):
+    data = {"v": 1, "w": 100, "h": 50, "q": 2, "s": [[0, 4, 20, 20, 40, 0, 0, 40], [1, 10, 60, 60]]}
+    data.update(overrides)
+    return json.dumps(data)
+
+
+def test_decode_restores_css_coordinates():
+    data = decode_strokes(payload().encode('utf-8'))
+    assert (data["width"], data["height"]) == (100, 50)
+    pen, eraser = data["strokes"]
+    assert pen == {"eraser": False, "size": 4, "points": [(10.0, 10.0), (30.0, 10.0), (30.0, 30.0)]}
+    assert eraser["eraser"] and eraser["points"] == [(30.0, 30.0)]
+
+
+def test_decode_key_identifies_content():
+    assert decode_strokes(payload())["key"] == decode_strokes(payload())["key"]
+    assert decode_strokes(payload())["key"] != decode_strokes(payload(s=[[0, 4, 1, 1]]))["key"]
+
+
+@pytest.mark.parametrize("raw", [
+    "not json",
+    payload(v=2),
+    payload(w=0),
+    payload(h=100000),
+    payload(q=0),
+    payload(s=None),
+    payload(s=[[0, 4, 1]]),
+    payload(s=[[2, 4, 1, 1]]),
+    payload(s=[[0, 0, 1, 1]]),
+])
+def test_decode_rejects_invalid_payloads(raw):
+    with pytest.raises(ValueError):
+        decode_strokes(raw)
+
+
+def test_rasterize_scales_to_target_width():
+    png = rasterize_strokes(decode_strokes(payload()), target_width=200)
+    image = Image.open(io.BytesIO(png)).convert('RGB')
+    assert image.size == (200, 100)
+    # 画笔经过的位置为黑色，空白处为白色，橡皮擦处为白色
+    assert image.getpixel((40, 20)) == (0, 0, 0)
+    assert image.getpixel((190, 5)) == (255, 255, 255)
+    assert image.getpixel((60, 60)) == (255, 255, 255)
+
+
+def test_rasterize_caps_height():
+    png = rasterize_strokes(decode_strokes(payload(h=10000)), target_width=200, max_height=500)
+    assert Image.open(io.BytesIO(png)).size == (200, 500)
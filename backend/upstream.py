@@ -0,0 +1,40 @@
+"""
+上游 HTTP 连接池
+
+OCR 和 LLM 客户端各自持有一个 requests.Session，复用 TCP/TLS 连接；
+probe() 用于启动预热（提前建立连接）和就绪检查。
+"""
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 16
+
+
+def make_http_session(pool_size=DEFAULT_POOL_SIZE):
+    """创建带连接池的 Session，pool_size 应不小于该上游的并发数"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def probe(session, url, timeout=3, verify=False):
+    """
+    向上游发送 GET 请求以建立连接并检查可达性。
+    任何非 5xx 响应（包括接口对 GET 返回的 404/405）都视为可达。
+    """
+    started = time.monotonic()
+    result = {"url": url}
+    try:
+        response = session.get(url, timeout=timeout, verify=verify)
+        response.close()
+        result["status"] = response.status_code
+        result["reachable"] = response.status_code < 500
+    except requests.RequestException as e:
+        result["reachable"] = False
+        result["error"] = str(e)
+    result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return result
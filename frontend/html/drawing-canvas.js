@@ -8,6 +8,7 @@ class DrawingCanvas {
             penSize: 2,
             eraserSize: 10,
             maxUndoSteps: 20,
+            strokeQuantization: 1, // 笔画坐标量化倍数（每CSS像素的单位数）
             ...options
         };
         
@@ -17,6 +18,9 @@ class DrawingCanvas {
         this.currentTool = 'pen'; // pen, eraser
         this.undoStack = [];
         this.currentPath = [];
+        this.strokes = []; // 已完成的笔画，用于笔画格式提交
+        this.strokeStack = []; // 与undoStack对应的笔画快照
+        this.hasRasterContent = false; // 导入过图片时只能以图片格式提交
         this.isToolbarCollapsed = false;
         this.toolbar = null;
         
@@ -291,6 +295,11 @@ class DrawingCanvas {
     stopDrawing() {
         if (this.isDrawing) {
             this.isDrawing = false;
+            this.strokes.push({
+                tool: this.currentTool,
+                size: this.currentTool === 'eraser' ? this.options.eraserSize : this.options.penSize,
+                points: this.currentPath
+            });
             this.saveState();
         }
     }
@@ -341,16 +350,22 @@ class DrawingCanvas {
 
     saveState() {
         this.undoStack.push(this.ctx.getImageData(0, 0, this.canvas.width, this.canvas.height));
+        this.strokeStack.push({ strokes: this.strokes.slice(), hasRasterContent: this.hasRasterContent });
         if (this.undoStack.length > this.options.maxUndoSteps) {
             this.undoStack.shift();
+            this.strokeStack.shift();
         }
     }
 
     undo() {
         if (this.undoStack.length > 1) {
             this.undoStack.pop(); // 移除当前状态
+            this.strokeStack.pop();
             const prevState = this.undoStack[this.undoStack.length - 1];
             this.ctx.putImageData(prevState, 0, 0);
+            const prevStrokes = this.strokeStack[this.strokeStack.length - 1];
+            this.strokes = prevStrokes.strokes.slice();
+            this.hasRasterContent = prevStrokes.hasRasterContent;
         }
     }
 
@@ -453,6 +468,8 @@ class DrawingCanvas {
             this.ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
             this.ctx.fillStyle = this.options.backgroundColor;
             this.ctx.fillRect(0, 0, this.canvas.width, this.canvas.height);
+            this.strokes = [];
+            this.hasRasterContent = false;
             this.saveState();
         }
     }
@@ -497,6 +514,45 @@ class DrawingCanvas {
         return tempCanvas.toDataURL(type, quality);
     }
 
+    // 导出为紧凑的笔画数据（坐标量化+差分编码），导入过图片时返回null
+    toStrokes() {
+        if (this.hasRasterContent) return null;
+
+        const q = this.options.strokeQuantization;
+        const dpr = window.devicePixelRatio || 1;
+        return {
+            v: 1,
+            w: Math.round(this.canvas.width / dpr),
+            h: Math.round(this.canvas.height / dpr),
+            q: q,
+            s: this.strokes.map(stroke => {
+                const encoded = [stroke.tool === 'eraser' ? 1 : 0, stroke.size];
+                let prevX = 0, prevY = 0;
+                stroke.points.forEach((point, index) => {
+                    const x = Math.round(point.x * q);
+                    const y = Math.round(point.y * q);
+                    // 跳过量化后与上一点重合的点
+                    if (index > 0 && x === prevX && y === prevY) return;
+                    encoded.push(x - prevX, y - prevY);
+                    prevX = x;
+                    prevY = y;
+                });
+                return encoded;
+            })
+        };
+    }
+
+    // 导出提交数据：优先使用笔画格式，导入过图片时退回图片格式
+    // callback(blob, field)，field 为表单字段名 'strokes' 或 'image'
+    toSubmissionData(callback, type = 'image/png', quality = 0.8) {
+        const strokes = this.toStrokes();
+        if (strokes) {
+            callback(new Blob([JSON.stringify(strokes)], { type: 'application/json' }), 'strokes');
+        } else {
+            this.toBlob((blob) => callback(blob, 'image'), type, quality);
+        }
+    }
+
     downloadImage() {
         this.toBlob((blob) => {
             const url = URL.createObjectURL(blob);
@@ -529,6 +585,7 @@ class DrawingCanvas {
                     this.setSize(img.width, img.height);
                     // 绘制图片到画布上
                     this.ctx.drawImage(img, 0, 0);
+                    this.hasRasterContent = true;
                     this.saveState();
                 };
                 img.src = event.target.result;